@@ -0,0 +1,84 @@
+"""tickets filter indexes
+
+Revision ID: 2019314c2518
+Revises: 943986d1edc1
+Create Date: 2026-10-18 10:12:41.529103
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2019314c2518'
+down_revision: Union[str, None] = '943986d1edc1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE/DROP INDEX CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_tickets_user_id_created_at_id',
+            'tickets',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_tickets_user_id_payment_type_created_at',
+            'tickets',
+            ['user_id', 'payment_type', sa.text('created_at DESC')],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_tickets_user_id_total',
+            'tickets',
+            ['user_id', 'total'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # covered by the leading "user_id" column of the composite indexes above
+        op.drop_index(
+            'ix_tickets_user_id',
+            table_name='tickets',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_tickets_user_id',
+            'tickets',
+            ['user_id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_tickets_user_id_total',
+            table_name='tickets',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_tickets_user_id_payment_type_created_at',
+            table_name='tickets',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_tickets_user_id_created_at_id',
+            table_name='tickets',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,57 @@
+"""created ticket daily aggregates
+
+Revision ID: a3e91f27c6d4
+Revises: 5b0d4e7c9a13
+Create Date: 2026-10-18 15:21:44.904113
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3e91f27c6d4'
+down_revision: Union[str, None] = '5b0d4e7c9a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def upgrade() -> None:
+    op.create_table('ticket_daily_aggregates',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('payment_type', postgresql.ENUM('cash', 'card', name='paymenttypeenum', create_type=False), nullable=False),
+    sa.Column('tickets_count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.DECIMAL(precision=16, scale=2), nullable=False),
+    sa.Column('payment_amount', sa.DECIMAL(precision=16, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'payment_type')
+    )
+    # the tickets table is locked until the backfill is committed, so no ticket is created without being aggregated
+    op.execute('LOCK TABLE tickets IN SHARE MODE')
+    # tickets without the creation time are dated by the migration, so they're aggregated under the day
+    # they're listed and partitioned by from now on, instead of being left out of the stats
+    undated_tickets_count = op.get_bind().execute(
+        sa.text('UPDATE tickets SET created_at = now() WHERE created_at IS NULL')
+    ).rowcount
+    if undated_tickets_count:
+        logger.warning('%s tickets without the creation time are dated by the migration time', undated_tickets_count)
+    op.execute(
+        """
+        INSERT INTO ticket_daily_aggregates (user_id, day, payment_type, tickets_count, total, payment_amount)
+        SELECT user_id, created_at::date, payment_type, count(*), sum(total), sum(payment_amount)
+        FROM tickets
+        WHERE user_id IS NOT NULL AND payment_type IS NOT NULL
+        GROUP BY user_id, created_at::date, payment_type
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ticket_daily_aggregates')
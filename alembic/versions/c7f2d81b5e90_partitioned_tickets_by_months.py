@@ -0,0 +1,238 @@
+"""partitioned tickets by months
+
+Revision ID: c7f2d81b5e90
+Revises: a3e91f27c6d4
+Create Date: 2026-10-18 18:47:05.213377
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7f2d81b5e90'
+down_revision: Union[str, None] = 'a3e91f27c6d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+PAYMENT_TYPE_ENUM = postgresql.ENUM('cash', 'card', name='paymenttypeenum', create_type=False)
+
+TICKETS_COLUMNS = 'id, user_id, created_at, payment_type, payment_amount, total'
+TICKET_PRODUCTS_COLUMNS = 'id, ticket_id, name, price, quantity'
+
+# from the month of the oldest ticket up to 3 months ahead, "commands.ticket_partitions" creates the next ones
+CREATE_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    month timestamp := date_trunc('month', coalesce((SELECT min(created_at) FROM tickets_unpartitioned), now()));
+BEGIN
+    WHILE month <= date_trunc('month', now()) + interval '3 months' LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF tickets FOR VALUES FROM (%L) TO (%L)',
+            'tickets_' || to_char(month, '"y"YYYY"m"MM'), month, month + interval '1 month'
+        );
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF ticket_products FOR VALUES FROM (%L) TO (%L)',
+            'ticket_products_' || to_char(month, '"y"YYYY"m"MM'), month, month + interval '1 month'
+        );
+        month := month + interval '1 month';
+    END LOOP;
+END
+$$
+"""
+
+DATE_UNDATED_TICKETS = """
+WITH dated_tickets AS (
+    UPDATE tickets_unpartitioned SET created_at = now() WHERE created_at IS NULL
+    RETURNING user_id, created_at, payment_type, payment_amount, total
+), aggregated_tickets AS (
+    INSERT INTO ticket_daily_aggregates (user_id, day, payment_type, tickets_count, total, payment_amount)
+    SELECT user_id, created_at::date, payment_type, count(*), sum(total), sum(payment_amount)
+    FROM dated_tickets
+    WHERE user_id IS NOT NULL AND payment_type IS NOT NULL
+    GROUP BY user_id, created_at::date, payment_type
+    ON CONFLICT (user_id, day, payment_type) DO UPDATE SET
+        tickets_count = ticket_daily_aggregates.tickets_count + excluded.tickets_count,
+        total = ticket_daily_aggregates.total + excluded.total,
+        payment_amount = ticket_daily_aggregates.payment_amount + excluded.payment_amount
+)
+SELECT count(*) FROM dated_tickets
+"""
+
+
+def upgrade() -> None:
+    # the tables are rewritten, so nothing is written to them until the migration is committed
+    op.execute('LOCK TABLE tickets, ticket_products IN ACCESS EXCLUSIVE MODE')
+    op.drop_constraint('ticket_products_ticket_id_fkey', 'ticket_products', type_='foreignkey')
+    _drop_indexes()
+    _rename_tables('_unpartitioned')
+
+    op.create_table('tickets',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('tickets_id_seq')"), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('payment_type', PAYMENT_TYPE_ENUM, nullable=True),
+    sa.Column('payment_amount', sa.DECIMAL(precision=10, scale=2), nullable=False),
+    sa.Column('total', sa.DECIMAL(precision=10, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    op.create_table('ticket_products',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('ticket_products_id_seq')"), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('ticket_created_at', sa.DateTime(), nullable=False),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('price', sa.DECIMAL(precision=10, scale=2), nullable=False),
+    sa.Column('quantity', sa.DECIMAL(precision=10, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('id', 'ticket_created_at'),
+    postgresql_partition_by='RANGE (ticket_created_at)'
+    )
+    op.execute('ALTER SEQUENCE tickets_id_seq OWNED BY tickets.id')
+    op.execute('ALTER SEQUENCE ticket_products_id_seq OWNED BY ticket_products.id')
+    op.execute(CREATE_MONTHLY_PARTITIONS)
+    op.execute('CREATE TABLE tickets_default PARTITION OF tickets DEFAULT')
+    op.execute('CREATE TABLE ticket_products_default PARTITION OF ticket_products DEFAULT')
+
+    # products without the ticket can't be placed in any partition, they have to be dealt with by hand
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT FROM ticket_products_unpartitioned WHERE ticket_id IS NULL) THEN
+                RAISE EXCEPTION 'ticket_products has rows without ticket_id, delete them or set their tickets first';
+            END IF;
+        END
+        $$
+        """
+    )
+    # tickets without the creation time can't be placed in any partition, they're dated by the migration time
+    # and added to the daily aggregates of that day, as the aggregates migration does
+    undated_tickets_count = op.get_bind().execute(sa.text(DATE_UNDATED_TICKETS)).scalar_one()
+    if undated_tickets_count:
+        logger.warning('%s tickets without the creation time are dated by the migration time', undated_tickets_count)
+    op.execute(
+        f"""
+        INSERT INTO tickets ({TICKETS_COLUMNS})
+        SELECT {TICKETS_COLUMNS} FROM tickets_unpartitioned
+        """
+    )
+    op.execute(
+        f"""
+        INSERT INTO ticket_products ({TICKET_PRODUCTS_COLUMNS}, ticket_created_at)
+        SELECT products.id, products.ticket_id, products.name, products.price, products.quantity, tickets.created_at
+        FROM ticket_products_unpartitioned AS products
+        JOIN tickets_unpartitioned AS tickets ON tickets.id = products.ticket_id
+        """
+    )
+    _check_copied_rows('tickets_unpartitioned', 'tickets')
+    _check_copied_rows('ticket_products_unpartitioned', 'ticket_products')
+    op.drop_table('ticket_products_unpartitioned')
+    op.drop_table('tickets_unpartitioned')
+
+    # created after the data is copied, so the foreign key is validated and the indexes are built at once
+    op.create_foreign_key(
+        'ticket_products_ticket_id_ticket_created_at_fkey',
+        'ticket_products',
+        'tickets',
+        ['ticket_id', 'ticket_created_at'],
+        ['id', 'created_at'],
+    )
+    _create_indexes()
+
+
+def downgrade() -> None:
+    op.execute('LOCK TABLE tickets, ticket_products IN ACCESS EXCLUSIVE MODE')
+    op.drop_constraint('ticket_products_ticket_id_ticket_created_at_fkey', 'ticket_products', type_='foreignkey')
+    _drop_indexes()
+    _rename_tables('_partitioned')
+
+    op.create_table('tickets',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('tickets_id_seq')"), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('payment_type', PAYMENT_TYPE_ENUM, nullable=True),
+    sa.Column('payment_amount', sa.DECIMAL(precision=10, scale=2), nullable=False),
+    sa.Column('total', sa.DECIMAL(precision=10, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('ticket_products',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('ticket_products_id_seq')"), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(), nullable=True),
+    sa.Column('price', sa.DECIMAL(precision=10, scale=2), nullable=False),
+    sa.Column('quantity', sa.DECIMAL(precision=10, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('ALTER SEQUENCE tickets_id_seq OWNED BY tickets.id')
+    op.execute('ALTER SEQUENCE ticket_products_id_seq OWNED BY ticket_products.id')
+    op.execute(f'INSERT INTO tickets ({TICKETS_COLUMNS}) SELECT {TICKETS_COLUMNS} FROM tickets_partitioned')
+    op.execute(
+        f"""
+        INSERT INTO ticket_products ({TICKET_PRODUCTS_COLUMNS})
+        SELECT {TICKET_PRODUCTS_COLUMNS} FROM ticket_products_partitioned
+        """
+    )
+    _check_copied_rows('tickets_partitioned', 'tickets')
+    _check_copied_rows('ticket_products_partitioned', 'ticket_products')
+    # the attached partitions are dropped with the tables, the detached ones are kept
+    op.drop_table('ticket_products_partitioned')
+    op.drop_table('tickets_partitioned')
+
+    op.create_foreign_key('ticket_products_ticket_id_fkey', 'ticket_products', 'tickets', ['ticket_id'], ['id'])
+    _create_indexes()
+
+
+def _drop_indexes():
+    op.drop_index('ix_tickets_user_id_created_at_id', table_name='tickets')
+    op.drop_index('ix_tickets_user_id_payment_type_created_at', table_name='tickets')
+    op.drop_index('ix_tickets_user_id_total', table_name='tickets')
+    op.drop_index('ix_ticket_products_ticket_id', table_name='ticket_products')
+
+
+def _create_indexes():
+    op.create_index(
+        'ix_tickets_user_id_created_at_id',
+        'tickets',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False,
+    )
+    op.create_index(
+        'ix_tickets_user_id_payment_type_created_at',
+        'tickets',
+        ['user_id', 'payment_type', sa.text('created_at DESC')],
+        unique=False,
+    )
+    op.create_index('ix_tickets_user_id_total', 'tickets', ['user_id', 'total'], unique=False)
+    op.create_index('ix_ticket_products_ticket_id', 'ticket_products', ['ticket_id'], unique=False)
+
+
+def _rename_tables(suffix: str):
+    """Renames the tables with their primary keys, which are named as the tables, and releases their id sequences"""
+    for table in ('tickets', 'ticket_products'):
+        op.rename_table(table, f'{table}{suffix}')
+        op.execute(f'ALTER TABLE {table}{suffix} RENAME CONSTRAINT {table}_pkey TO {table}{suffix}_pkey')
+        # the ids go on from the same sequences, which would be dropped with the tables otherwise
+        op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY NONE')
+
+
+def _check_copied_rows(source_table: str, target_table: str):
+    """Stops the migration before the source table is dropped, unless all of its rows are copied"""
+    op.execute(
+        f"""
+        DO $$
+        BEGIN
+            IF (SELECT count(*) FROM {source_table}) <> (SELECT count(*) FROM {target_table}) THEN
+                RAISE EXCEPTION 'Not all the rows of {source_table} are copied to {target_table}';
+            END IF;
+        END
+        $$
+        """
+    )
@@ -1,15 +1,28 @@
 import multiprocessing
+import os
 
 from gunicorn import glogging
 
 bind = '0.0.0.0:8000'
 worker_class = 'uvicorn.workers.UvicornWorker'
-workers = multiprocessing.cpu_count() * 2 + 1
-reload = True
-preload = True
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# the application splits the database connections budget between the workers by it
+os.environ['WEB_CONCURRENCY'] = str(workers)
+# "production" imports the application once in the master process, before forking the workers,
+# "development" imports it in every worker and restarts the workers when the code changes
+gunicorn_profile = os.getenv('GUNICORN_PROFILE', 'production')
+preload_app = gunicorn_profile == 'production'
+reload = gunicorn_profile == 'development'
 
 accesslog = '-'
 
 logging_format = '%(asctime)s [%(levelname)s] %(message)s'
 glogging.Logger.access_fmt = logging_format
 glogging.Logger.error_fmt = logging_format
+
+
+def when_ready(server):
+    # the application is preloaded already, the workers aren't forked yet
+    if preload_app:
+        from main import preload_modules
+        preload_modules()
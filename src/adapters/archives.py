@@ -0,0 +1,41 @@
+import io
+import zipfile
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator
+
+
+class ZipStreamBuffer(io.RawIOBase):
+    """Write-only, non-seekable buffer, so zipfile writes entries sequentially with data descriptors"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(files: AsyncIterable[tuple[str, datetime, bytes]]) -> AsyncIterator[bytes]:
+    """
+    Yields the ZIP archive of the given (name, modification time, content) files part by part:
+    every file is compressed and yielded as soon as it's received, so only one file is kept in memory at a time.
+    """
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        async for name, modified_at, content in files:
+            zip_info = zipfile.ZipInfo(name, date_time=modified_at.timetuple()[:6])
+            zip_info.compress_type = zipfile.ZIP_DEFLATED
+            zip_file.writestr(zip_info, content)
+            if data := buffer.drain():
+                yield data
+    # the central directory is written on closing
+    yield buffer.drain()
@@ -1,55 +1,108 @@
 import abc
+import calendar
 import uuid
 from datetime import datetime, timedelta
+from typing import Optional
 
 from jose import JWTError, jwt
 
 from config import Config
-from adapters.exceptions.auth import CredentialsException, InvalidJTIException, TokenExpiredException
+from adapters.cache import LRUCache
+from adapters.exceptions.auth import (
+    CredentialsException,
+    InvalidJTIException,
+    TokenExpiredException,
+    TokenRevokedException,
+)
+from adapters.revocation import RevokedTokensRegistry
+from dto import Identity, TokenClaims
 
 
 class JWTAuthenticator:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, revoked_tokens_registry: RevokedTokensRegistry):
         self._config = config
+        self._revoked_tokens_registry = revoked_tokens_registry
         self._valid_token_types = (config.JWT_ACCESS_TOKEN_TYPE, config.JWT_REFRESH_TOKEN_TYPE)
         self._token_type_expiration_minutes_mapping = {
             self._config.JWT_ACCESS_TOKEN_TYPE: self._config.JWT_ACCESS_TOKEN_EXPIRE_MINUTES,
             self._config.JWT_REFRESH_TOKEN_TYPE: self._config.JWT_REFRESH_TOKEN_EXPIRE_MINUTES,
         }
+        # already validated tokens, mapped to their claims until the tokens expire
+        self._tokens_cache = LRUCache(config.JWT_TOKENS_CACHE_SIZE)
 
     def create_access_token(self, user_id: int) -> str:
-        return self._create_token(user_id, self._config.JWT_ACCESS_TOKEN_TYPE)
+        token_type = self._config.JWT_ACCESS_TOKEN_TYPE
+        return self._create_token(user_id, token_type, *self._get_token_identifiers(token_type))
 
     def create_refresh_token(self, user_id: int) -> str:
-        return self._create_token(user_id, self._config.JWT_REFRESH_TOKEN_TYPE)
-
-    def _create_token(self, user_id: int, token_type: str) -> str:
-        payload = {
-            "user_id": user_id,
-            "exp": datetime.now() + timedelta(minutes=self._token_type_expiration_minutes_mapping[token_type]),
-            "token_type": token_type,
-            "jti": uuid.uuid4().hex,
-        }
+        token_type = self._config.JWT_REFRESH_TOKEN_TYPE
+        return self._create_token(user_id, token_type, *self._get_token_identifiers(token_type))
+
+    def create_tokens(self, user_id: int) -> tuple[str, str]:
+        """
+        Access and refresh tokens of the same login, each one carries the "jti" and the expiration of the other one,
+        so both of them are revoked on logout whichever of them is presented
+        """
+        access_token_type, refresh_token_type = self._config.JWT_ACCESS_TOKEN_TYPE, self._config.JWT_REFRESH_TOKEN_TYPE
+        access_jti, access_exp = self._get_token_identifiers(access_token_type)
+        refresh_jti, refresh_exp = self._get_token_identifiers(refresh_token_type)
+        access_token = self._create_token(user_id, access_token_type, access_jti, access_exp, refresh_jti, refresh_exp)
+        refresh_token = self._create_token(user_id, refresh_token_type, refresh_jti, refresh_exp, access_jti, access_exp)
+        return access_token, refresh_token
+
+    def _get_token_identifiers(self, token_type: str) -> tuple[str, datetime]:
+        expire_minutes = self._token_type_expiration_minutes_mapping[token_type]
+        return uuid.uuid4().hex, datetime.now() + timedelta(minutes=expire_minutes)
+
+    def _create_token(
+            self,
+            user_id: int,
+            token_type: str,
+            jti: str,
+            exp: datetime,
+            linked_jti: Optional[str] = None,
+            linked_exp: Optional[datetime] = None,
+    ) -> str:
+        payload = {"user_id": user_id, "exp": exp, "token_type": token_type, "jti": jti}
+        if linked_jti:
+            payload["linked_jti"] = linked_jti
+            # encoded the same way as "exp", only the registered claims are converted by jose
+            payload["linked_exp"] = calendar.timegm(linked_exp.utctimetuple())
         token = jwt.encode(payload, self._config.JWT_SECRET_KEY, algorithm=self._config.JWT_ALGORITHM)
         return f"{self._config.JWT_TOKEN_TYPE_NAME} {token}"
 
-    async def validate_authorization_header(self, header: str) -> int:
+    async def get_authorization_header_claims(self, header: str) -> TokenClaims:
         try:
             token_type, token = header.split()
         except ValueError:
             raise CredentialsException
         if token_type != self._config.JWT_TOKEN_TYPE_NAME:
             raise CredentialsException
-        return await self.validate_token(token)
+        return await self.get_token_claims(token)
 
     async def validate_token(self, token: str) -> int:
-        try:
-            payload = jwt.decode(token, self._config.JWT_SECRET_KEY, algorithms=[self._config.JWT_ALGORITHM])
-        except JWTError:
-            raise CredentialsException
-        return await self._validate_payload(payload)
-
-    async def _validate_payload(self, payload: dict) -> int:
+        token_claims = await self.get_token_claims(token)
+        return token_claims.user_id
+
+    async def get_token_claims(self, token: str) -> TokenClaims:
+        token_claims = self._tokens_cache.get(token)
+        if token_claims is None:
+            try:
+                payload = jwt.decode(token, self._config.JWT_SECRET_KEY, algorithms=[self._config.JWT_ALGORITHM])
+            except JWTError:
+                raise CredentialsException
+            token_claims = await self._validate_payload(payload)
+            token_ttl = (token_claims.expired_at - datetime.now()).total_seconds()
+            self._tokens_cache.set(token, token_claims, token_ttl)
+        # checked on every call, tokens could have been revoked after they were cached
+        if self._revoked_tokens_registry.is_revoked(token_claims.jti):
+            raise TokenRevokedException
+        return token_claims
+
+    def get_tokens_cache_stats(self) -> dict:
+        return self._tokens_cache.get_stats()
+
+    async def _validate_payload(self, payload: dict) -> TokenClaims:
         user_id = payload.get("user_id")
         exp = payload.get("exp")
         token_type = payload.get("token_type")
@@ -64,7 +117,26 @@ class JWTAuthenticator:
             raise CredentialsException
         await self._check_token_expiration(token_expired_at)
         await self._check_jti_is_valid_uuid(jti)
-        return user_id
+        linked_jti, linked_expired_at = await self._get_linked_token(payload)
+        return TokenClaims(
+            user_id=user_id,
+            jti=jti,
+            expired_at=token_expired_at,
+            linked_jti=linked_jti,
+            linked_expired_at=linked_expired_at,
+        )
+
+    async def _get_linked_token(self, payload: dict) -> tuple[Optional[str], Optional[datetime]]:
+        linked_jti = payload.get("linked_jti")
+        linked_exp = payload.get("linked_exp")
+        if not linked_jti or not linked_exp:
+            return None, None
+        try:
+            linked_expired_at = datetime.utcfromtimestamp(int(linked_exp))
+        except TypeError:
+            raise CredentialsException
+        await self._check_jti_is_valid_uuid(linked_jti)
+        return linked_jti, linked_expired_at
 
     async def _check_token_expiration(self, token_expired_at: datetime):
         current_datetime = datetime.now()
@@ -80,7 +152,7 @@ class JWTAuthenticator:
 
 class IdentityProviderABC(abc.ABC):
     @abc.abstractmethod
-    async def provide_user_id(self) -> int:
+    async def provide_identity(self) -> Identity:
         pass
 
 
@@ -89,5 +161,12 @@ class JWTIdentityProvider(IdentityProviderABC):
         self._jwt_authenticator = jwt_authenticator
         self._authorization_header = authorization_header
 
-    async def provide_user_id(self) -> int:
-        return await self._jwt_authenticator.validate_authorization_header(self._authorization_header)
+    async def provide_identity(self) -> Identity:
+        token_claims = await self._jwt_authenticator.get_authorization_header_claims(self._authorization_header)
+        return Identity(
+            user_id=token_claims.user_id,
+            jti=token_claims.jti,
+            expired_at=token_claims.expired_at,
+            linked_jti=token_claims.linked_jti,
+            linked_expired_at=token_claims.linked_expired_at,
+        )
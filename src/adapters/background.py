@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable]
+
+
+class BackgroundJobsQueue:
+    """
+    Runs jobs on a fixed number of asyncio workers of the current process.
+    The queue is bounded, when it's full new jobs are dropped instead of making the caller wait.
+    """
+
+    def __init__(self, max_size: int, workers_count: int):
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(max_size)
+        self._max_size = max_size
+        self._workers_count = workers_count
+        self._workers: list[asyncio.Task] = []
+        self.dropped_jobs = 0
+        self.failed_jobs = 0
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self._workers_count)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def join(self):
+        await self._queue.join()
+
+    def put_nowait(self, job: Job) -> bool:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.dropped_jobs += 1
+            logger.warning("Background jobs queue is full, the job is dropped")
+            return False
+        return True
+
+    def get_stats(self) -> dict:
+        return {
+            "size": self._queue.qsize(),
+            "max_size": self._max_size,
+            "workers": len(self._workers),
+            "dropped_jobs": self.dropped_jobs,
+            "failed_jobs": self.failed_jobs,
+        }
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await job()
+            except Exception:
+                self.failed_jobs += 1
+                logger.exception("Background job has failed")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """Bounded in-process cache, evicts least recently used entries, every entry also expires after its own TTL"""
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        if ttl <= 0 or self._max_size <= 0:
+            self._entries.pop(key, None)
+            return
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def get_stats(self) -> dict:
+        requests_count = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / requests_count if requests_count else 0.0,
+        }
+
+
+MAX_TICKETS_COUNTS_PER_USER = 100
+
+
+class TicketsCountCache:
+    """Counts of the user tickets by filters, all the counts of the user are dropped at once when the tickets change"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._users_cache = LRUCache(max_size)
+        self._ttl = ttl
+
+    def get(self, user_id: int, filter_key: Hashable) -> Optional[int]:
+        user_counts = self._users_cache.get(user_id)
+        return user_counts.get(filter_key) if user_counts is not None else None
+
+    def set(self, user_id: int, filter_key: Hashable, count: int):
+        user_counts = self._users_cache.get(user_id)
+        if user_counts is None:
+            # counts of the user expire together, "ttl" after the first one is cached
+            user_counts = {}
+            self._users_cache.set(user_id, user_counts, self._ttl)
+        if len(user_counts) < MAX_TICKETS_COUNTS_PER_USER:
+            user_counts[filter_key] = count
+
+    def invalidate(self, user_id: int):
+        self._users_cache.delete(user_id)
+
+    def get_stats(self) -> dict:
+        return self._users_cache.get_stats()
+
+
+class RecentWritesCache:
+    """
+    Users who have written to the primary database recently, their reads are served by the primary
+    until the replica surely has their writes. Kept in the memory of the worker, so writes handled by other workers
+    aren't known, reads of the single tickets fall back to the primary when they aren't found on the replica instead.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._users_cache = LRUCache(max_size)
+        self._ttl = ttl
+
+    def add(self, user_id: int):
+        self._users_cache.set(user_id, True, self._ttl)
+
+    def has_recent_writes(self, user_id: int) -> bool:
+        return self._users_cache.get(user_id) is not None
+
+    def get_stats(self) -> dict:
+        return self._users_cache.get_stats()
@@ -1,3 +1,82 @@
+import logging
+import time
+from typing import Optional
+
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import Config
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool which also counts the checkouts, how many of them wait for a connection now and how long they wait"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def get_stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": self.overflow(),
+            "waiting": self.waiting,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "average_wait_seconds": self.total_wait_seconds / self.checkouts if self.checkouts else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+    def _do_get(self):
+        # includes connecting, when the pool opens a new connection instead of waiting for a returned one
+        self.waiting += 1
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            wait_seconds = time.perf_counter() - started_at
+            self.waiting -= 1
+            self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+
+def create_db_engine(config: Config, url: Optional[str] = None) -> AsyncEngine:
+    """Engine of the primary database, or of the given one with the same pool settings"""
+    pool_size = config.database_pool_size
+    max_connections = pool_size + config.DATABASE_POOL_MAX_OVERFLOW
+    if max_connections * config.WEB_CONCURRENCY > config.DATABASE_CONNECTIONS_BUDGET:
+        logger.warning(
+            "Workers can open up to %s database connections, more than the budget of %s",
+            max_connections * config.WEB_CONCURRENCY,
+            config.DATABASE_CONNECTIONS_BUDGET,
+        )
+    return create_async_engine(
+        url or config.DATABASE_URL,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=pool_size,
+        max_overflow=config.DATABASE_POOL_MAX_OVERFLOW,
+        pool_timeout=config.DATABASE_POOL_TIMEOUT_SECONDS,
+        pool_recycle=config.DATABASE_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=config.DATABASE_POOL_PRE_PING,
+        connect_args={
+            # the prepared statements cache of the SQLAlchemy dialect and the statements cache of asyncpg itself,
+            # both have to be disabled with 0 behind PgBouncer in the transaction pooling mode
+            "prepared_statement_cache_size": config.DATABASE_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": config.DATABASE_STATEMENT_CACHE_SIZE,
+        },
+    )
@@ -27,3 +27,12 @@ class InvalidJTIException(HTTPException):
             detail="'jti' is not a valid uuid",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+
+class TokenRevokedException(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token is revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
@@ -0,0 +1,10 @@
+from fastapi.exceptions import HTTPException
+from starlette import status
+
+
+class InvalidCursorException(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Pagination cursor is invalid",
+        )
@@ -0,0 +1,11 @@
+from fastapi.exceptions import HTTPException
+from starlette import status
+
+
+class PasswordHasherOverloadedException(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, try again later",
+            headers={"Retry-After": "1"},
+        )
@@ -0,0 +1,60 @@
+import csv
+import enum
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Sequence
+
+
+async def stream_ndjson(fields: Sequence[str], rows: AsyncIterable[Sequence], chunk_size: int) -> AsyncIterator[bytes]:
+    """Yields the rows as the JSON objects of the given fields, one per line, in chunks of about "chunk_size" bytes"""
+    buffer = io.StringIO()
+
+    def write_row(row: Sequence):
+        json.dump(dict(zip(fields, map(_to_export_value, row))), buffer, ensure_ascii=False, separators=(",", ":"))
+        buffer.write("\n")
+
+    async for chunk in _stream_chunks(buffer, rows, write_row, chunk_size):
+        yield chunk
+
+
+async def stream_csv(fields: Sequence[str], rows: AsyncIterable[Sequence], chunk_size: int) -> AsyncIterator[bytes]:
+    """Yields the CSV with the header of the given fields, in chunks of about "chunk_size" bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+
+    def write_row(row: Sequence):
+        writer.writerow(map(_to_export_value, row))
+
+    async for chunk in _stream_chunks(buffer, rows, write_row, chunk_size):
+        yield chunk
+
+
+async def _stream_chunks(
+        buffer: io.StringIO,
+        rows: AsyncIterable[Sequence],
+        write_row: Callable[[Sequence], Any],
+        chunk_size: int,
+) -> AsyncIterator[bytes]:
+    # only the current chunk is kept in memory, the rows are written to it as they arrive
+    async for row in rows:
+        write_row(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _to_export_value(value: Any) -> Any:
+    # the same representations as the API responses have
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
@@ -1,16 +1,23 @@
 import io
 from datetime import timedelta
-from typing import Union, Optional
-
-import miniopy_async
+from typing import TYPE_CHECKING, Union, Optional
 
+from adapters.cache import LRUCache
 from config import Config
 
+if TYPE_CHECKING:
+    from miniopy_async import Minio
+
 
 class FilesStorage:
-    def __init__(self, config: Config, minio_client: miniopy_async.Minio):
+    def __init__(self, config: Config, minio_client: "Minio"):
+        # the client module is imported with the client, on the first use, so it's already loaded here
+        from miniopy_async.error import S3Error
+
+        self._s3_error_class = S3Error
         self._config = config
         self._minio_client = minio_client
+        self._links_cache = LRUCache(config.FILES_LINKS_CACHE_SIZE)
 
     async def put_object(
             self,
@@ -20,34 +27,77 @@ class FilesStorage:
             length: int,
             content_type: str,
     ) -> str:
-        if not await self._minio_client.bucket_exists(bucket_name):
-            await self._minio_client.make_bucket(bucket_name)
-        await self._minio_client.put_object(
-            bucket_name=bucket_name,
-            object_name=object_name,
-            data=data,
-            length=length,
-            content_type=content_type,
-        )
+        # the bucket is created at startup, it's only recreated when it went missing afterwards
+        try:
+            await self._minio_client.put_object(
+                bucket_name=bucket_name,
+                object_name=object_name,
+                data=data,
+                length=length,
+                content_type=content_type,
+            )
+        except self._s3_error_class as e:
+            if e.code != "NoSuchBucket":
+                raise
+            await self.create_bucket(bucket_name)
+            data.seek(0)
+            await self._minio_client.put_object(
+                bucket_name=bucket_name,
+                object_name=object_name,
+                data=data,
+                length=length,
+                content_type=content_type,
+            )
         return await self.get_object_link(bucket_name, object_name, content_type=content_type)
 
+    async def create_bucket(self, bucket_name: str):
+        if await self._minio_client.bucket_exists(bucket_name):
+            return
+        try:
+            await self._minio_client.make_bucket(bucket_name)
+        except self._s3_error_class as e:
+            # another application instance could have created it in the meantime
+            if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                raise
+
     async def get_object_link(
             self,
             bucket_name: str,
             object_name: str,
-            expires: timedelta = timedelta(hours=1),
+            expires: Optional[timedelta] = None,
             content_type: Optional[str] = None,
     ) -> str:
+        expires = expires or timedelta(minutes=self._config.FILES_LINKS_EXPIRATION_MINUTES)
         response_headers = {}
         if content_type:
             response_headers["Content-Type"] = content_type
-        return await self._minio_client.presigned_get_object(
+        link = await self._minio_client.presigned_get_object(
             bucket_name,
             object_name,
             change_host=self._config.MINIO_PUBLIC_HOST,
             response_headers=response_headers,
             expires=expires,
         )
+        # the link is reused until shortly before it expires, so the client has time to follow it
+        cache_ttl = expires.total_seconds() - self._config.FILES_LINKS_CACHE_MARGIN_SECONDS
+        self._links_cache.set((bucket_name, object_name, content_type), link, cache_ttl)
+        return link
+
+    async def get_existing_object_link(
+            self,
+            bucket_name: str,
+            object_name: str,
+            content_type: Optional[str] = None,
+    ) -> Optional[str]:
+        """Returns the link to the object if it exists, a cached link is returned without any storage calls"""
+        if link := self._links_cache.get((bucket_name, object_name, content_type)):
+            return link
+        if not await self.check_object_exists(bucket_name, object_name):
+            return None
+        return await self.get_object_link(bucket_name, object_name, content_type=content_type)
+
+    def get_links_cache_stats(self) -> dict:
+        return self._links_cache.get_stats()
 
     async def check_object_exists(self, bucket_name: str, object_name: str) -> bool:
         try:
@@ -1,14 +1,70 @@
-from typing import Optional
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Optional
+
+from adapters.exceptions.pagination import InvalidCursorException
+from constants import PaginationModeEnum
 
 
 class BasePaginator:
-    def __init__(self, page_size: Optional[int] = None, page: Optional[int] = None):
+    """
+    Supports two modes:
+    - offset mode, the default one, pages are returned when both "page" and "page_size" are given,
+      otherwise all the items are returned;
+    - keyset (cursor) mode, opted in with "pagination=cursor" or "cursor" and used along with "page_size".
+      The first page is requested without "cursor", every next page is requested with the "next_cursor"
+      returned along with the previous one, so the cost of a page doesn't depend on how deep it is.
+    """
+
+    def __init__(
+            self,
+            page_size: Optional[int] = None,
+            page: Optional[int] = None,
+            cursor: Optional[str] = None,
+            pagination: PaginationModeEnum = PaginationModeEnum.offset,
+    ):
         self.page_size = page_size
         self.page = page
+        self.cursor = cursor
+        self.pagination = pagination
+
+    @property
+    def is_cursor_mode(self) -> bool:
+        is_cursor_requested = self.pagination is PaginationModeEnum.cursor or self.cursor is not None
+        return is_cursor_requested and bool(self.page_size) and not self.page
 
     def get_offset_limit(self) -> tuple[Optional[int], Optional[int]]:
+        if self.is_cursor_mode:
+            return None, self.page_size
         if not self.page or not self.page_size:
             return None, None
         offset = (self.page - 1) * self.page_size
         limit = self.page_size
         return offset, limit
+
+    def get_keyset(self) -> Optional[tuple[datetime, int]]:
+        """Returns "created_at" and "id" of the last item of the previous page"""
+        if not self.is_cursor_mode or not self.cursor:
+            return None
+        return decode_cursor(self.cursor)
+
+    def get_next_cursor(self, items: list[Any]) -> Optional[str]:
+        if not self.is_cursor_mode or not items or len(items) < self.page_size:
+            return None
+        last_item = items[-1]
+        return encode_cursor(last_item.created_at, last_item.id)
+
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    raw_cursor = f"{created_at.isoformat()}|{item_id}"
+    return base64.urlsafe_b64encode(raw_cursor.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw_cursor = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, item_id = raw_cursor.split("|")
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursorException
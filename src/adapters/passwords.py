@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from adapters.exceptions.passwords import PasswordHasherOverloadedException
+from config import Config
+
+Result = TypeVar("Result")
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on a dedicated bounded thread pool, so bcrypt doesn't block the event loop.
+    When more than "max_pending" calls are already waiting for a free thread, new ones are rejected right away.
+    """
+
+    def __init__(self, config: Config):
+        self._pwd_context = config.pwd_context
+        self._workers_count = config.PASSWORD_HASHER_WORKERS_COUNT
+        self._max_pending = config.PASSWORD_HASHER_MAX_PENDING
+        self._executor = ThreadPoolExecutor(max_workers=self._workers_count, thread_name_prefix="password_hasher")
+        # only changed from the event loop thread, so there's no need for locking
+        self._calls_count = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self._pwd_context.verify, password, hashed_password)
+
+    def get_stats(self) -> dict:
+        busy_workers = min(self._calls_count, self._workers_count)
+        return {
+            "workers": self._workers_count,
+            "busy_workers": busy_workers,
+            "utilisation": busy_workers / self._workers_count,
+            "pending": self._calls_count - busy_workers,
+            "max_pending": self._max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, function: Callable[..., Result], *args) -> Result:
+        if self._calls_count >= self._workers_count + self._max_pending:
+            self.rejected += 1
+            raise PasswordHasherOverloadedException()
+        loop = asyncio.get_running_loop()
+        self._calls_count += 1
+        future = self._executor.submit(function, *args)
+        # the call keeps its thread when the awaiting coroutine is cancelled, so it's counted until it's done
+        future.add_done_callback(lambda done_future: self._call_soon_threadsafe(loop, self._on_done, done_future))
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future: Future):
+        self._calls_count -= 1
+        if future.cancelled():
+            return
+        if future.exception() is None:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    @staticmethod
+    def _call_soon_threadsafe(loop: asyncio.AbstractEventLoop, callback: Callable, *args):
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # the loop is closed already, there's nobody to report to
+            pass
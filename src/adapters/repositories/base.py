@@ -1,15 +1,36 @@
+import json
 from abc import ABC, abstractmethod
-from typing import Any, List, Optional, Type, TypeVar, cast
+from typing import Any, AsyncIterator, List, Optional, Type, TypeVar, cast
 
 from fastapi_filter.contrib.sqlalchemy import Filter
 from sqlalchemy import column, delete, exists, func, insert, select, update
+from sqlalchemy.engine import Result, Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import load_only
-from sqlalchemy.sql import Select
+from sqlalchemy.sql import ClauseElement, Executable, Select
 
 Model = TypeVar("Model")
 
 
+class Explain(Executable, ClauseElement):
+    """
+    "EXPLAIN" of the query, compiled by the dialect of the session along with the query,
+    so the values stay bound parameters with their types and are never inlined into the SQL
+    """
+
+    inherit_cache = False
+
+    def __init__(self, db_query: Select, options: str):
+        self.db_query = db_query
+        self.options = options
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(explain: Explain, compiler, **kwargs) -> str:
+    return f"EXPLAIN ({explain.options}) {compiler.process(explain.db_query, **kwargs)}"
+
+
 def create_repository(model: Type[Model], db_session: AsyncSession) -> "SQLAlchemyRepository":
     return SQLAlchemyRepository(model, db_session)
 
@@ -47,6 +68,14 @@ class BaseRepository(ABC):
     async def get_many(self, *args, db_query: Optional[Any] = None, fields_to_load: Optional[tuple[str]] = None):
         pass
 
+    @abstractmethod
+    def stream(self, *args, db_query: Optional[Any] = None, yield_per: int = 1000):
+        pass
+
+    @abstractmethod
+    def stream_rows(self, *args, db_query: Optional[Any] = None, yield_per: int = 1000):
+        pass
+
     @abstractmethod
     async def exists(self, *args, db_query: Optional[Any] = None):
         pass
@@ -55,6 +84,14 @@ class BaseRepository(ABC):
     async def count(self, *args, db_query: Optional[Any] = None):
         pass
 
+    @abstractmethod
+    async def explain(self, db_query: Any, analyze: bool = False):
+        pass
+
+    @abstractmethod
+    async def execute(self, db_query: Any):
+        pass
+
 
 class SQLAlchemyRepository(BaseRepository):
     def __init__(self, model: Type[Model], db_session: AsyncSession):
@@ -77,9 +114,9 @@ class SQLAlchemyRepository(BaseRepository):
         return await self.__db_session.scalar(select_query)
 
     async def create_many(self, objects: list[dict]) -> list[Model]:
-        create_query = insert(self._model).values(objects).returning(self._model)
-        select_query = select(self._model).from_statement(create_query).execution_options(synchronize_session="fetch")
-        result = await self.__db_session.scalars(select_query)
+        """Inserts objects with multi-row INSERT statements, returned objects are in the same order as given ones"""
+        create_query = insert(self._model).returning(self._model, sort_by_parameter_order=True)
+        result = await self.__db_session.scalars(create_query, objects)
         return result.all()
 
     async def update_object(self, object_to_update: Model, **kwargs) -> Model:
@@ -146,6 +183,36 @@ class SQLAlchemyRepository(BaseRepository):
         results = await self.__db_session.scalars(select_query)
         return results.unique().all() if unique_results else results.all()
 
+    async def stream(
+        self,
+        *args: Any,
+        query_filter: Optional[Filter] = None,
+        db_query: Optional[Select] = None,
+        yield_per: int = 1000,
+    ) -> AsyncIterator[Model]:
+        """Iterates over the objects with a server-side cursor, fetching "yield_per" rows at a time"""
+        select_query = self._get_db_query(*args, db_query=db_query)
+        if query_filter:
+            select_query = query_filter.filter(select_query)
+        results = await self.__db_session.stream_scalars(select_query.execution_options(yield_per=yield_per))
+        async for result in results:
+            yield result
+
+    async def stream_rows(
+        self,
+        *args: Any,
+        query_filter: Optional[Filter] = None,
+        db_query: Optional[Select] = None,
+        yield_per: int = 1000,
+    ) -> AsyncIterator[Row]:
+        """Same as "stream", but iterates over the rows, for the queries of columns instead of the objects"""
+        select_query = self._get_db_query(*args, db_query=db_query)
+        if query_filter:
+            select_query = query_filter.filter(select_query)
+        results = await self.__db_session.stream(select_query.execution_options(yield_per=yield_per))
+        async for result in results:
+            yield result
+
     async def exists(self, *args: Any, db_query: Optional[Select] = None) -> Optional[bool]:
         select_db_query = self._get_db_query(*args, db_query=db_query)
         exists_db_query = exists(select_db_query).select()
@@ -157,5 +224,15 @@ class SQLAlchemyRepository(BaseRepository):
         db_query = db_query.with_only_columns([func.count()]).order_by(None)
         return await self.__db_session.scalar(db_query) or 0
 
+    async def execute(self, db_query: Executable) -> Result:
+        return await self.__db_session.execute(db_query)
+
+    async def explain(self, db_query: Select, analyze: bool = False) -> dict:
+        """Returns the query plan in the "EXPLAIN (FORMAT JSON)" format"""
+        explain_options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        result = await self.__db_session.execute(Explain(db_query, explain_options))
+        plan = result.scalar()
+        return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
     def _get_db_query(self, *args, db_query: Optional[Select]) -> Select:
         return db_query.where(*args) if db_query is not None else select(self._model).where(*args)
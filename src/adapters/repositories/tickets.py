@@ -1,13 +1,23 @@
-from typing import Optional
+import re
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Optional
 
 from fastapi_filter.contrib.sqlalchemy import Filter
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy import (
+    DECIMAL, Date, Text, case, cast, column, func, insert, literal, select, text, true, tuple_, values,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import aliased, selectinload, joinedload
+from sqlalchemy.sql import ColumnElement, Select
 
 from adapters.repositories.base import SQLAlchemyRepository
 from config import Config
+from constants import TICKETS_EXPORT_FIELDS
 from dto import TicketCreationData, TicketProductCreationData
-from models import Ticket, TicketProduct
+from models import Ticket, TicketProduct, TicketDailyAggregate
 
 
 class TicketsRepository:
@@ -15,28 +25,308 @@ class TicketsRepository:
         self._repo = repo
         self._config = config
 
-    async def create_ticket(self, user_id: int, ticket_data: TicketCreationData) -> Ticket:
-        total = sum(ticket_product.price * ticket_product.quantity for ticket_product in ticket_data.products)
-        return await self._repo.create(
-            user_id=user_id,
-            payment_type=ticket_data.payment.type,
-            payment_amount=ticket_data.payment.amount,
-            total=total,
+    async def create_ticket(
+            self,
+            user_id: int,
+            ticket_data: TicketCreationData,
+    ) -> tuple[Ticket, list[TicketProduct]]:
+        """
+        Inserts the ticket and its products and adds the ticket to its daily aggregate with a single statement
+        using data-modifying CTEs, the ticket and its products are returned with the values generated by the database
+        """
+        ticket_cte = insert(Ticket).values(
+            **self._get_ticket_values(user_id, ticket_data)
+        ).returning(
+            *Ticket.__table__.columns
+        ).cte("created_ticket")
+        daily_aggregate_cte = self._get_daily_aggregates_upsert_query(
+            postgresql.insert(TicketDailyAggregate).from_select(
+                ["user_id", "day", "payment_type", "tickets_count", "total", "payment_amount"],
+                select(
+                    ticket_cte.c.user_id,
+                    cast(ticket_cte.c.created_at, Date),
+                    ticket_cte.c.payment_type,
+                    literal(1),
+                    ticket_cte.c.total,
+                    ticket_cte.c.payment_amount,
+                ),
+            )
+        ).cte("updated_daily_aggregate")
+        if not ticket_data.products:
+            db_query = select(aliased(Ticket, ticket_cte)).add_cte(daily_aggregate_cte)
+            ticket = (await self._repo.execute(db_query)).scalar_one()
+            return ticket, []
+        products_data = values(
+            column("name", TicketProduct.name.type),
+            column("price", TicketProduct.price.type),
+            column("quantity", TicketProduct.quantity.type),
+            name="products_data",
+        ).data(
+            [(product.name, product.price, product.quantity) for product in ticket_data.products]
+        )
+        ticket_products_cte = insert(TicketProduct).from_select(
+            ["ticket_id", "ticket_created_at", "name", "price", "quantity"],
+            select(
+                ticket_cte.c.id,
+                ticket_cte.c.created_at,
+                products_data.c.name,
+                products_data.c.price,
+                products_data.c.quantity,
+            ),
+        ).returning(
+            *TicketProduct.__table__.columns
+        ).cte("created_ticket_products")
+        db_query = select(
+            aliased(Ticket, ticket_cte),
+            aliased(TicketProduct, ticket_products_cte),
+        ).select_from(
+            ticket_cte
+        ).join(
+            ticket_products_cte, true()
+        ).order_by(
+            ticket_products_cte.c.id
+        ).add_cte(
+            daily_aggregate_cte
+        )
+        rows = (await self._repo.execute(db_query)).all()
+        return rows[0][0], [ticket_product for _, ticket_product in rows]
+
+    async def create_tickets(self, user_id: int, tickets_data: list[TicketCreationData]) -> list[Ticket]:
+        return await self._repo.create_many(
+            [self._get_ticket_values(user_id, ticket_data) for ticket_data in tickets_data]
         )
 
+    async def add_tickets_to_daily_aggregates(self, tickets: list[Ticket]):
+        daily_aggregates = defaultdict(lambda: {"tickets_count": 0, "total": Decimal(0), "payment_amount": Decimal(0)})
+        for ticket in tickets:
+            # grouped beforehand, a single upsert can't update the same row twice
+            daily_aggregate = daily_aggregates[(ticket.user_id, ticket.created_at.date(), ticket.payment_type)]
+            daily_aggregate["tickets_count"] += 1
+            daily_aggregate["total"] += ticket.total
+            daily_aggregate["payment_amount"] += ticket.payment_amount
+        if not daily_aggregates:
+            return
+        await self._repo.execute(
+            self._get_daily_aggregates_upsert_query(
+                postgresql.insert(TicketDailyAggregate).values([
+                    {"user_id": user_id, "day": day, "payment_type": payment_type, **daily_aggregate}
+                    for (user_id, day, payment_type), daily_aggregate in daily_aggregates.items()
+                ])
+            )
+        )
+
+    async def get_daily_aggregates(
+            self,
+            user_id: int,
+            daily_aggregates_filter: Optional[Filter] = None,
+    ) -> list[TicketDailyAggregate]:
+        db_query = select(TicketDailyAggregate).where(
+            TicketDailyAggregate.user_id == user_id
+        ).order_by(
+            TicketDailyAggregate.day, TicketDailyAggregate.payment_type
+        )
+        return await self._repo.get_many(db_query=db_query, query_filter=daily_aggregates_filter)
+
+    def _get_daily_aggregates_upsert_query(self, insert_query: postgresql.Insert) -> postgresql.Insert:
+        return insert_query.on_conflict_do_update(
+            index_elements=[TicketDailyAggregate.user_id, TicketDailyAggregate.day, TicketDailyAggregate.payment_type],
+            set_={
+                "tickets_count": TicketDailyAggregate.tickets_count + insert_query.excluded.tickets_count,
+                "total": TicketDailyAggregate.total + insert_query.excluded.total,
+                "payment_amount": TicketDailyAggregate.payment_amount + insert_query.excluded.payment_amount,
+            },
+        )
+
+    def _get_ticket_values(self, user_id: int, ticket_data: TicketCreationData) -> dict:
+        return {
+            "user_id": user_id,
+            "payment_type": ticket_data.payment.type,
+            "payment_amount": ticket_data.payment.amount,
+            "total": ticket_data.products_total,
+        }
+
     async def get_many_tickets(
             self,
             user_id: int,
             tickets_filter: Optional[Filter] = None,
             offset: Optional[int] = None,
             limit: Optional[int] = None,
+            keyset_pagination: bool = False,
+            keyset: Optional[tuple[datetime, int]] = None,
     ) -> list[Ticket]:
-        db_query = select(Ticket).where(
-            Ticket.user_id == user_id
-        ).options(
+        db_query = self._get_many_tickets_query(user_id, keyset_pagination, keyset)
+        return await self._repo.get_many(db_query=db_query, query_filter=tickets_filter, offset=offset, limit=limit)
+
+    async def get_many_tickets_rows(
+            self,
+            user_id: int,
+            tickets_filter: Optional[Filter] = None,
+            offset: Optional[int] = None,
+            limit: Optional[int] = None,
+            keyset_pagination: bool = False,
+            keyset: Optional[tuple[datetime, int]] = None,
+    ) -> tuple[list[Row], dict[int, list[Row]]]:
+        """
+        Same tickets as "get_many_tickets" returns, but as plain rows without building ORM objects,
+        the products rows are grouped by the tickets IDs.
+        """
+        db_query = self._apply_many_tickets_conditions(
+            select(*Ticket.__table__.columns), user_id, keyset_pagination, keyset,
+        )
+        if tickets_filter:
+            db_query = tickets_filter.filter(db_query)
+        if offset:
+            db_query = db_query.offset(offset)
+        if limit:
+            db_query = db_query.limit(limit)
+        tickets_rows = (await self._repo.execute(db_query)).all()
+        ticket_products_rows = defaultdict(list)
+        if not tickets_rows:
+            return tickets_rows, ticket_products_rows
+        products_db_query = select(
+            *TicketProduct.__table__.columns
+        ).where(
+            TicketProduct.ticket_id.in_([ticket_row.id for ticket_row in tickets_rows]),
+            # lets the products partitions out of the page tickets creation times be pruned
+            TicketProduct.ticket_created_at.between(
+                min(ticket_row.created_at for ticket_row in tickets_rows),
+                max(ticket_row.created_at for ticket_row in tickets_rows),
+            ),
+        ).order_by(
+            TicketProduct.id
+        )
+        for ticket_product_row in await self._repo.execute(products_db_query):
+            ticket_products_rows[ticket_product_row.ticket_id].append(ticket_product_row)
+        return tickets_rows, ticket_products_rows
+
+    async def get_many_tickets_json(
+            self,
+            user_id: int,
+            tickets_filter: Optional[Filter] = None,
+            offset: Optional[int] = None,
+            limit: Optional[int] = None,
+            keyset_pagination: bool = False,
+            keyset: Optional[tuple[datetime, int]] = None,
+    ) -> list[Row]:
+        """
+        Same tickets as "get_many_tickets" returns, as rows of the ticket ID, creation time and "json",
+        the ticket serialized by the database exactly as TicketSchema serializes it, see "_get_ticket_json"
+        """
+        db_query = self._apply_many_tickets_conditions(
+            select(Ticket.id, Ticket.created_at, self._get_ticket_json().label("json")),
+            user_id,
+            keyset_pagination,
+            keyset,
+        )
+        if tickets_filter:
+            db_query = tickets_filter.filter(db_query)
+        if offset:
+            db_query = db_query.offset(offset)
+        if limit:
+            db_query = db_query.limit(limit)
+        return (await self._repo.execute(db_query)).all()
+
+    async def count_many_tickets(
+            self,
+            user_id: int,
+            tickets_filter: Optional[Filter] = None,
+            limit: Optional[int] = None,
+    ) -> int:
+        """Counts the tickets, stops counting at "limit" so the cost of the query is bounded"""
+        db_query = select(Ticket.id).where(Ticket.user_id == user_id)
+        if tickets_filter:
+            db_query = tickets_filter.filter(db_query)
+        if limit:
+            db_query = db_query.limit(limit)
+        result = await self._repo.execute(select(func.count()).select_from(db_query.subquery()))
+        return result.scalar_one()
+
+    async def estimate_many_tickets_count(self, user_id: int, tickets_filter: Optional[Filter] = None) -> int:
+        """Returns the number of the tickets estimated by the query planner, without executing the query"""
+        db_query = select(Ticket.id).where(Ticket.user_id == user_id)
+        if tickets_filter:
+            db_query = tickets_filter.filter(db_query)
+        plan = await self._repo.explain(db_query)
+        return int(plan["Plan"]["Plan Rows"])
+
+    def stream_many_tickets(self, user_id: int, tickets_filter: Optional[Filter] = None) -> AsyncIterator[Ticket]:
+        db_query = self._get_many_tickets_query(user_id, keyset_pagination=True).options(joinedload(Ticket.user))
+        return self._repo.stream(db_query=db_query, query_filter=tickets_filter)
+
+    def stream_many_tickets_export_rows(
+            self,
+            user_id: int,
+            tickets_filter: Optional[Filter] = None,
+    ) -> AsyncIterator[Row]:
+        """
+        Rows of the tickets joined with their products, named as TICKETS_EXPORT_FIELDS,
+        a row per product, the tickets without products have a single row with the empty product columns
+        """
+        export_columns = (
+            Ticket.id,
+            Ticket.created_at,
+            Ticket.payment_type,
+            Ticket.payment_amount,
+            Ticket.total,
+            TicketProduct.id,
+            TicketProduct.name,
+            TicketProduct.price,
+            TicketProduct.quantity,
+        )
+        db_query = select(
+            *(export_column.label(field) for field, export_column in zip(TICKETS_EXPORT_FIELDS, export_columns))
+        ).outerjoin(
+            Ticket.ticket_products
+        )
+        db_query = self._apply_many_tickets_conditions(db_query, user_id, keyset_pagination=True).order_by(
+            TicketProduct.id,
+        )
+        return self._repo.stream_rows(db_query=db_query, query_filter=tickets_filter)
+
+    async def explain_many_tickets(
+            self,
+            user_id: int,
+            tickets_filter: Optional[Filter] = None,
+            limit: Optional[int] = None,
+            keyset_pagination: bool = False,
+            keyset: Optional[tuple[datetime, int]] = None,
+            analyze: bool = False,
+    ) -> dict:
+        db_query = self._get_many_tickets_query(user_id, keyset_pagination, keyset)
+        if tickets_filter:
+            db_query = tickets_filter.filter(db_query)
+        if limit:
+            db_query = db_query.limit(limit)
+        return await self._repo.explain(db_query, analyze=analyze)
+
+    def _get_many_tickets_query(
+            self,
+            user_id: int,
+            keyset_pagination: bool = False,
+            keyset: Optional[tuple[datetime, int]] = None,
+    ) -> Select:
+        db_query = select(Ticket).options(
             selectinload(Ticket.ticket_products),
         )
-        return await self._repo.get_many(db_query=db_query, query_filter=tickets_filter, offset=offset, limit=limit)
+        return self._apply_many_tickets_conditions(db_query, user_id, keyset_pagination, keyset)
+
+    def _apply_many_tickets_conditions(
+            self,
+            db_query: Select,
+            user_id: int,
+            keyset_pagination: bool = False,
+            keyset: Optional[tuple[datetime, int]] = None,
+    ) -> Select:
+        db_query = db_query.where(Ticket.user_id == user_id)
+        if keyset_pagination:
+            db_query = db_query.order_by(Ticket.created_at.desc(), Ticket.id.desc())
+            if keyset:
+                db_query = db_query.where(
+                    tuple_(Ticket.created_at, Ticket.id) < tuple_(*keyset),
+                    # implied by the row comparison, but only simple comparisons prune the partitions
+                    Ticket.created_at <= keyset[0],
+                )
+        return db_query
 
     async def get_one_ticket(self, ticket_id: int, user_id: Optional[int] = None) -> Ticket:
         where_clause = [Ticket.id == ticket_id]
@@ -51,19 +341,168 @@ class TicketsRepository:
             )
         )
 
+    async def check_ticket_exists(self, ticket_id: int, user_id: Optional[int] = None) -> bool:
+        where_clause = [Ticket.id == ticket_id]
+        if user_id:
+            where_clause.append(Ticket.user_id == user_id)
+        return bool(await self._repo.exists(db_query=select(Ticket.id).where(*where_clause)))
+
+    async def get_one_ticket_json(self, ticket_id: int, user_id: int) -> Optional[str]:
+        db_query = select(self._get_ticket_json()).where(Ticket.id == ticket_id, Ticket.user_id == user_id)
+        return (await self._repo.execute(db_query)).scalar_one_or_none()
+
+    def _get_ticket_json(self) -> ColumnElement:
+        """
+        Builds the ticket JSON by concatenation, as "json_build_object" would add whitespaces the schemas don't,
+        so the responses are byte for byte the same as in the Python serialization: same keys order,
+        decimals as strings, the products totals rounded half to even and microseconds omitted when they're zero
+        """
+        products_total = self._round_half_even(TicketProduct.price * TicketProduct.quantity * 100)
+        product_json = (
+            literal('{"ticket_id":') + cast(TicketProduct.ticket_id, Text)
+            + literal(',"name":') + func.coalesce(_to_json_text(TicketProduct.name), literal("null"))
+            + literal(',"price":') + _to_json_text(cast(TicketProduct.price, Text))
+            + literal(',"quantity":') + _to_json_text(cast(TicketProduct.quantity, Text))
+            + literal(',"total":') + _to_json_text(cast(cast(products_total / 100, DECIMAL(20, 2)), Text))
+            + literal("}")
+        )
+        products_json = select(
+            func.coalesce(
+                func.string_agg(product_json, postgresql.aggregate_order_by(literal(","), TicketProduct.id)),
+                literal(""),
+            )
+        ).where(
+            TicketProduct.ticket_id == Ticket.id,
+            TicketProduct.ticket_created_at == Ticket.created_at,
+        ).scalar_subquery()
+        microseconds = func.to_char(Ticket.created_at, "US")
+        created_at = func.to_char(Ticket.created_at, 'YYYY-MM-DD"T"HH24:MI:SS') + case(
+            (microseconds == "000000", ""),
+            else_=literal(".") + microseconds,
+        )
+        return (
+            literal('{"id":') + cast(Ticket.id, Text)
+            + literal(',"created_at":') + _to_json_text(created_at)
+            + literal(',"total":') + _to_json_text(cast(Ticket.total, Text))
+            + literal(',"payment":{"type":') + _to_json_text(cast(Ticket.payment_type, Text))
+            + literal(',"amount":') + _to_json_text(cast(Ticket.payment_amount, Text))
+            + literal('},"products":[') + products_json
+            + literal('],"rest":') + _to_json_text(cast(Ticket.payment_amount - Ticket.total, Text))
+            + literal("}")
+        )
+
+    def _round_half_even(self, value: ColumnElement) -> ColumnElement:
+        """Rounds to an integer as Decimal.quantize does by default, "round" of Postgres rounds half away from zero"""
+        floored_value = func.floor(value)
+        return case(
+            (value - floored_value != Decimal("0.5"), func.round(value)),
+            (func.mod(floored_value, 2) == 0, floored_value),
+            else_=floored_value + 1,
+        )
+
 
 class TicketProductsRepository:
     def __init__(self, config: Config, repo: SQLAlchemyRepository):
         self._repo = repo
         self._config = config
 
-    async def create_ticket_products(
+    async def create_tickets_products(
             self,
-            ticket_id: int,
-            products: list[TicketProductCreationData],
+            tickets_products: list[tuple[Ticket, list[TicketProductCreationData]]],
     ) -> list[TicketProduct]:
         products = [
-            {"ticket_id": ticket_id, **product.model_dump()}
-            for product in products
+            # the ticket creation time is the partition key of the products
+            {"ticket_id": ticket.id, "ticket_created_at": ticket.created_at, **product.model_dump()}
+            for ticket, ticket_products in tickets_products
+            for product in ticket_products
         ]
+        if not products:
+            return []
         return await self._repo.create_many(products)
+
+
+class TicketPartitionsRepository:
+    """
+    Monthly range partitions of the tickets by "created_at" and of their products by "ticket_created_at",
+    the same months are partitioned in both tables and the partitions are named by them, as "tickets_y2026m01".
+    """
+
+    PARTITIONED_TABLES = (Ticket.__tablename__, TicketProduct.__tablename__)
+    PARTITION_NAME_PATTERN = re.compile(rf"^{Ticket.__tablename__}_y(\d{{4}})m(\d{{2}})$")
+
+    def __init__(self, config: Config, repo: SQLAlchemyRepository):
+        self._repo = repo
+        self._config = config
+
+    async def get_partitions_months(self) -> list[date]:
+        """First days of the months partitioned now, the default partition isn't included"""
+        db_query = text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+        ).bindparams(table=Ticket.__tablename__)
+        partitions_names = await self._repo.execute(db_query)
+        return sorted(
+            date(int(match.group(1)), int(match.group(2)), 1)
+            for partition_name in partitions_names.scalars()
+            if (match := self.PARTITION_NAME_PATTERN.match(partition_name))
+        )
+
+    async def has_default_partition_tickets(self, month: date) -> bool:
+        """Tickets of the month in the default partition, the month partition can't be created while they're there"""
+        db_query = text(
+            f"SELECT EXISTS (SELECT 1 FROM {Ticket.__tablename__}_default "
+            "WHERE created_at >= :month_start AND created_at < :month_end)"
+        ).bindparams(month_start=month, month_end=add_months(month, 1))
+        result = await self._repo.execute(db_query)
+        return result.scalar_one()
+
+    async def create_partitions(self, month: date):
+        for table in self.PARTITIONED_TABLES:
+            await self._repo.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {self._get_partition_name(table, month)} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                )
+            )
+
+    async def detach_partitions(self, month: date):
+        """
+        Detaches the month partitions, they are kept as the standalone tables to be archived or dropped.
+        The products go first, as the tickets can't be detached while the products partitioned table references them.
+        """
+        products_partition_name = self._get_partition_name(TicketProduct.__tablename__, month)
+        await self._repo.execute(
+            text(f"ALTER TABLE {TicketProduct.__tablename__} DETACH PARTITION {products_partition_name}")
+        )
+        # the detached partition keeps the foreign key, it would prevent the tickets partition from being detached,
+        # its name is looked up, as the foreign keys cloned to the partitions aren't always named as the parent one
+        db_query = text(
+            "SELECT conname FROM pg_constraint "
+            "WHERE contype = 'f' AND conrelid = CAST(:partition AS regclass) AND confrelid = CAST(:table AS regclass)"
+        ).bindparams(partition=products_partition_name, table=Ticket.__tablename__)
+        for products_foreign_key in (await self._repo.execute(db_query)).scalars().all():
+            quoted_products_foreign_key = products_foreign_key.replace('"', '""')
+            await self._repo.execute(
+                text(f'ALTER TABLE {products_partition_name} DROP CONSTRAINT "{quoted_products_foreign_key}"')
+            )
+        await self._repo.execute(
+            text(
+                f"ALTER TABLE {Ticket.__tablename__} "
+                f"DETACH PARTITION {self._get_partition_name(Ticket.__tablename__, month)}"
+            )
+        )
+
+    def _get_partition_name(self, table: str, month: date) -> str:
+        return f"{table}_y{month:%Y}m{month:%m}"
+
+
+def add_months(month: date, months: int) -> date:
+    """Returns the first day of the month "months" after (or before, when negative) the given one"""
+    months_count = month.year * 12 + month.month - 1 + months
+    return date(months_count // 12, months_count % 12 + 1, 1)
+
+
+def _to_json_text(value: ColumnElement) -> ColumnElement:
+    """JSON literal of the value, with the strings quoted and escaped"""
+    return cast(func.to_json(value), Text)
@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from adapters.repositories.base import SQLAlchemyRepository
+from config import Config
+from models import RevokedToken
+
+
+class RevokedTokensRepository:
+    def __init__(self, config: Config, repo: SQLAlchemyRepository):
+        self._repo = repo
+        self._config = config
+
+    async def revoke_token(self, jti: str, expires_at: datetime):
+        await self._repo.execute(
+            insert(RevokedToken).values(jti=jti, expires_at=expires_at).on_conflict_do_nothing(
+                index_elements=[RevokedToken.jti],
+            )
+        )
+
+    async def get_revoked_tokens(self, revoked_since: Optional[datetime] = None) -> list[RevokedToken]:
+        """Returns not yet expired revoked tokens, only the ones revoked since the given time if it's provided"""
+        db_query = select(RevokedToken).where(RevokedToken.expires_at >= datetime.now())
+        if revoked_since:
+            db_query = db_query.where(RevokedToken.revoked_at >= revoked_since)
+        return await self._repo.get_many(db_query=db_query)
@@ -1,15 +1,17 @@
+from adapters.passwords import PasswordHasher
 from adapters.repositories.base import SQLAlchemyRepository
 from config import Config
 from models.users import User
 
 
 class UsersRepository:
-    def __init__(self, config: Config, repo: SQLAlchemyRepository):
+    def __init__(self, config: Config, repo: SQLAlchemyRepository, password_hasher: PasswordHasher):
         self._repo = repo
         self._config = config
+        self._password_hasher = password_hasher
 
     async def create_user(self, name: str, nickname: str, password: str) -> User:
-        password = User.hash_password(self._config, password)
+        password = await User.hash_password(self._password_hasher, password)
         return await self._repo.create(name=name, nickname=nickname, password=password)
 
     async def get_user(self, nickname: str) -> User:
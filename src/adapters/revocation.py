@@ -0,0 +1,26 @@
+from datetime import datetime
+
+
+class RevokedTokensRegistry:
+    """
+    In-memory copy of the revoked tokens of the current worker, so checking a token is a dict lookup.
+    Tokens are kept only until they expire, after that they're rejected as expired anyway.
+    """
+
+    def __init__(self):
+        self._revoked_tokens: dict[str, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._revoked_tokens)
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked_tokens
+
+    def add(self, jti: str, expires_at: datetime):
+        self._revoked_tokens[jti] = expires_at
+
+    def remove_expired(self):
+        current_datetime = datetime.now()
+        self._revoked_tokens = {
+            jti: expires_at for jti, expires_at in self._revoked_tokens.items() if expires_at >= current_datetime
+        }
@@ -6,4 +6,7 @@ from pydantic import BaseModel
 class BasePaginatedResponse(BaseModel):
     page_size: Optional[int]
     page: Optional[int]
+    next_cursor: Optional[str] = None
+    total_count: Optional[int] = None
+    is_total_count_approximate: bool = False
     items: list[BaseModel]
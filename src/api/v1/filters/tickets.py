@@ -1,10 +1,10 @@
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 from typing import Optional
 
 from fastapi_filter.contrib.sqlalchemy import Filter
 
-from models import Ticket
+from models import Ticket, TicketDailyAggregate
 
 
 class TicketsFilter(Filter):
@@ -17,3 +17,13 @@ class TicketsFilter(Filter):
     class Constants(Filter.Constants):
         model = Ticket
         search_model_fields = ["payment_type"]
+
+
+class TicketDailyAggregatesFilter(Filter):
+    day__gte: Optional[date] = None
+    day__lte: Optional[date] = None
+    payment_type: Optional[str] = None
+
+    class Constants(Filter.Constants):
+        model = TicketDailyAggregate
+        search_model_fields = ["payment_type"]
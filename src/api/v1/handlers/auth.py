@@ -1,20 +1,33 @@
-from fastapi import APIRouter, Depends, exceptions
+from typing import Union
+
+from fastapi import APIRouter, Depends, Query, exceptions
 from starlette import status
 
-from api.v1.schemas.auth import RegistrationRequestSchema, LoginRequestSchema
+from api.v1.schemas.auth import RegistrationRequestSchema, RegistrationResponseSchema, LoginRequestSchema
 from dependencies import Stub
 from dto import SuccessLoginResult
-from services.auth import RegistrationService, LoginService
+from services.auth import RegistrationService, LoginService, LogoutService
 from services.exceptions.auth import IncorrectPasswordException, InvalidNicknameException
 
 router = APIRouter()
 
 
-@router.post("/register", status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/register",
+    response_model=Union[SuccessLoginResult, RegistrationResponseSchema],
+    status_code=status.HTTP_201_CREATED,
+)
 async def register(
         registration_data: RegistrationRequestSchema,
+        login: bool = Query(False, description="Return the tokens of the registered user right away"),
         registration_service: RegistrationService = Depends(Stub(RegistrationService)),
 ):
+    if login:
+        return await registration_service.register_and_login_user(
+            name=registration_data.name,
+            nickname=registration_data.nickname,
+            password=registration_data.password,
+        )
     await registration_service.register_user(
         name=registration_data.name,
         nickname=registration_data.nickname,
@@ -34,3 +47,9 @@ async def login(
         raise exceptions.HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
     except InvalidNicknameException as e:
         raise exceptions.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+
+@router.post("/logout", status_code=status.HTTP_200_OK)
+async def logout(logout_service: LogoutService = Depends(Stub(LogoutService))):
+    await logout_service.logout_user()
+    return {"success": True}
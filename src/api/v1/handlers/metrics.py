@@ -0,0 +1,52 @@
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, exceptions
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette import status
+
+from adapters.auth import JWTAuthenticator
+from adapters.background import BackgroundJobsQueue
+from adapters.cache import RecentWritesCache, TicketsCountCache
+from adapters.files_storage import FilesStorage
+from adapters.passwords import PasswordHasher
+from config import Config
+from dependencies import Stub
+
+
+async def verify_metrics_token(
+        x_metrics_token: Optional[str] = Header(None),
+        config: Config = Depends(Stub(Config)),
+):
+    """The metrics show the workers internals, so they're hidden unless the token is configured and presented"""
+    if not config.METRICS_TOKEN:
+        raise exceptions.HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not x_metrics_token or not secrets.compare_digest(x_metrics_token, config.METRICS_TOKEN):
+        raise exceptions.HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid metrics token")
+
+
+router = APIRouter(dependencies=[Depends(verify_metrics_token)])
+
+
+@router.get("/metrics", status_code=status.HTTP_200_OK)
+async def get_metrics(
+        jwt_authenticator: JWTAuthenticator = Depends(Stub(JWTAuthenticator)),
+        password_hasher: PasswordHasher = Depends(Stub(PasswordHasher)),
+        files_storage: FilesStorage = Depends(Stub(FilesStorage)),
+        background_jobs_queue: BackgroundJobsQueue = Depends(Stub(BackgroundJobsQueue)),
+        tickets_count_cache: TicketsCountCache = Depends(Stub(TicketsCountCache)),
+        recent_writes_cache: RecentWritesCache = Depends(Stub(RecentWritesCache)),
+        db_engine: AsyncEngine = Depends(Stub(AsyncEngine)),
+        replica_db_engine: Optional[AsyncEngine] = Depends(Stub(AsyncEngine, replica=True)),
+):
+    """In-process metrics of the current worker"""
+    return {
+        "jwt_tokens_cache": jwt_authenticator.get_tokens_cache_stats(),
+        "password_hasher": password_hasher.get_stats(),
+        "files_links_cache": files_storage.get_links_cache_stats(),
+        "background_jobs": background_jobs_queue.get_stats(),
+        "tickets_count_cache": tickets_count_cache.get_stats(),
+        "recent_writes_cache": recent_writes_cache.get_stats(),
+        "database_pool": db_engine.pool.get_stats(),
+        "database_replica_pool": replica_db_engine.pool.get_stats() if replica_db_engine is not None else None,
+    }
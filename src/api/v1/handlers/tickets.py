@@ -1,16 +1,40 @@
-from fastapi import APIRouter, Depends, exceptions
+from decimal import Decimal
+from typing import Iterator, Optional
+
+from fastapi import APIRouter, Body, Depends, Header, Query, exceptions
 from fastapi_filter import FilterDepends
+from sqlalchemy.engine import Row
 from starlette import status
-from starlette.responses import RedirectResponse
+from starlette.responses import RedirectResponse, Response, StreamingResponse
 
 from adapters.pagination import BasePaginator
-from api.v1.filters.tickets import TicketsFilter
+from api.v1.filters.tickets import TicketsFilter, TicketDailyAggregatesFilter
 from api.v1.schemas.tickets import (
-    TicketSchema, TicketProductSchema, TicketPaymentSchema, TicketCreationSchema, PaginatedTicketSchema,
+    TicketSchema,
+    TicketProductSchema,
+    TicketPaymentSchema,
+    TicketCreationSchema,
+    TicketCreationResultSchema,
+    PaginatedTicketSchema,
+    TicketDailyStatsSchema,
+    TicketsStatsSchema,
+)
+from constants import (
+    MAX_RECEIPT_SYMBOLS,
+    MAX_TICKETS_BATCH_SIZE,
+    TICKET_FILE_CACHE_CONTROL,
+    TICKET_FILE_CHUNK_SIZE,
+    TICKET_FILE_CONTENT_TYPE,
+    TICKETS_ARCHIVE_CONTENT_TYPE,
+    TICKETS_CSV_CONTENT_TYPE,
+    TICKETS_NDJSON_CONTENT_TYPE,
+    TicketsExportFormatEnum,
 )
 from dependencies import Stub
+from dto import TicketFile
+from models import Ticket, TicketProduct
 from services.exceptions.tickets import TicketNotFoundException, IncorrectTicketAmountException
-from services.tickets import CreateTicketService, RetrieveTicketsService, DownloadTicketService
+from services.tickets import CreateTicketService, RetrieveTicketsService, DownloadTicketService, ExportTicketsService
 
 router = APIRouter()
 
@@ -24,12 +48,76 @@ async def create_ticket(
         ticket, products = await ticket_creation_service.create_ticket(ticket_data)
     except IncorrectTicketAmountException as e:
         raise exceptions.HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
-    return TicketSchema(
-        id=ticket.id,
-        created_at=ticket.created_at,
-        total=ticket.total,
-        payment=TicketPaymentSchema.from_orm(ticket),
-        products=[TicketProductSchema.from_orm(product) for product in products],
+    return _get_ticket_schema(ticket, products)
+
+
+@router.post("/create_tickets", response_model=list[TicketCreationResultSchema], status_code=status.HTTP_200_OK)
+async def create_tickets(
+        tickets_data: list[TicketCreationSchema] = Body(min_length=1, max_length=MAX_TICKETS_BATCH_SIZE),
+        ticket_creation_service: CreateTicketService = Depends(Stub(CreateTicketService)),
+):
+    results = await ticket_creation_service.create_tickets(tickets_data)
+    return [
+        TicketCreationResultSchema(error=str(result))
+        if isinstance(result, IncorrectTicketAmountException)
+        else TicketCreationResultSchema(ticket=_get_ticket_schema(*result))
+        for result in results
+    ]
+
+
+# declared before "/tickets/{ticket_id}", otherwise "stats" would be matched as the ticket ID
+@router.get("/tickets/stats", response_model=TicketsStatsSchema, status_code=status.HTTP_200_OK)
+async def get_tickets_stats(
+        daily_aggregates_filter: TicketDailyAggregatesFilter = FilterDepends(TicketDailyAggregatesFilter),
+        retrieve_tickets_service: RetrieveTicketsService = Depends(Stub(RetrieveTicketsService)),
+):
+    daily_aggregates = await retrieve_tickets_service.get_daily_aggregates(daily_aggregates_filter)
+    return TicketsStatsSchema(
+        tickets_count=sum(daily_aggregate.tickets_count for daily_aggregate in daily_aggregates),
+        total=sum((daily_aggregate.total for daily_aggregate in daily_aggregates), Decimal(0)),
+        payment_amount=sum((daily_aggregate.payment_amount for daily_aggregate in daily_aggregates), Decimal(0)),
+        days=[TicketDailyStatsSchema.from_orm(daily_aggregate) for daily_aggregate in daily_aggregates],
+    )
+
+
+# declared before "/tickets/{ticket_id}", otherwise "export" would be matched as the ticket ID
+@router.get(
+    "/tickets/export",
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"content": {TICKETS_ARCHIVE_CONTENT_TYPE: {}}}},
+)
+async def export_tickets(
+        tickets_filter: TicketsFilter = FilterDepends(TicketsFilter),
+        max_symbols: int = Query(gt=0, le=MAX_RECEIPT_SYMBOLS),
+        export_tickets_service: ExportTicketsService = Depends(Stub(ExportTicketsService)),
+):
+    archive = await export_tickets_service.export_tickets(tickets_filter, max_symbols)
+    return StreamingResponse(
+        archive,
+        media_type=TICKETS_ARCHIVE_CONTENT_TYPE,
+        headers={"Content-Disposition": 'attachment; filename="tickets.zip"'},
+    )
+
+
+@router.get(
+    "/tickets/export/rows",
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_200_OK: {"content": {TICKETS_NDJSON_CONTENT_TYPE: {}, TICKETS_CSV_CONTENT_TYPE: {}}}},
+)
+async def export_tickets_rows(
+        tickets_filter: TicketsFilter = FilterDepends(TicketsFilter),
+        export_format: TicketsExportFormatEnum = Query(TicketsExportFormatEnum.ndjson, alias="format"),
+        export_tickets_service: ExportTicketsService = Depends(Stub(ExportTicketsService)),
+):
+    tickets_rows = await export_tickets_service.export_tickets_rows(tickets_filter, export_format)
+    return StreamingResponse(
+        tickets_rows,
+        media_type=(
+            TICKETS_CSV_CONTENT_TYPE if export_format is TicketsExportFormatEnum.csv else TICKETS_NDJSON_CONTENT_TYPE
+        ),
+        headers={"Content-Disposition": f'attachment; filename="tickets.{export_format.value}"'},
     )
 
 
@@ -39,46 +127,137 @@ async def get_one_ticket(
         retrieve_tickets_service: RetrieveTicketsService = Depends(Stub(RetrieveTicketsService)),
 ):
     try:
+        if retrieve_tickets_service.is_database_json_enabled():
+            ticket_json = await retrieve_tickets_service.get_one_ticket_json(ticket_id)
+            return Response(content=ticket_json, media_type="application/json")
         ticket = await retrieve_tickets_service.get_one_ticket(ticket_id)
     except TicketNotFoundException as e:
         raise exceptions.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
-    return TicketSchema(
-        id=ticket.id,
-        created_at=ticket.created_at,
-        total=ticket.total,
-        payment=TicketPaymentSchema.from_orm(ticket),
-        products=[TicketProductSchema.from_orm(product) for product in ticket.ticket_products],
-    )
+    return _get_ticket_schema(ticket, ticket.ticket_products)
 
 
 @router.get("/tickets", response_model=PaginatedTicketSchema, status_code=status.HTTP_200_OK)
 async def get_many_tickets(
         tickets_filter: TicketsFilter = FilterDepends(TicketsFilter),
         paginator: BasePaginator = Depends(),
+        include_total: bool = Query(False, description="Count the tickets, big counts are approximate"),
         retrieve_tickets_service: RetrieveTicketsService = Depends(Stub(RetrieveTicketsService)),
 ):
-    tickets = await retrieve_tickets_service.get_many_tickets(tickets_filter, paginator)
-    items = [
-        TicketSchema(
-            id=ticket.id,
-            created_at=ticket.created_at,
-            total=ticket.total,
-            payment=TicketPaymentSchema.from_orm(ticket),
-            products=[TicketProductSchema.from_orm(product) for product in ticket.ticket_products],
+    total_count, is_total_count_approximate = None, False
+    if include_total:
+        total_count, is_total_count_approximate = await retrieve_tickets_service.get_tickets_count(tickets_filter)
+    is_database_json_enabled = retrieve_tickets_service.is_database_json_enabled()
+    if is_database_json_enabled:
+        tickets_rows = await retrieve_tickets_service.get_many_tickets_json(tickets_filter, paginator)
+        items = []
+    else:
+        tickets_rows, ticket_products_rows = await retrieve_tickets_service.get_many_tickets_rows(
+            tickets_filter,
+            paginator,
         )
-        for ticket in tickets
-    ]
-    return PaginatedTicketSchema(page_size=paginator.page_size, page=paginator.page, items=items)
+        items = [
+            _construct_ticket_schema(ticket_row, ticket_products_rows[ticket_row.id]) for ticket_row in tickets_rows
+        ]
+    # rows from the database are valid already, so the schemas are built without validation
+    # and serialized directly, bypassing the "response_model" validation as well
+    paginated_tickets_json = PaginatedTicketSchema.model_construct(
+        page_size=paginator.page_size,
+        page=paginator.page,
+        next_cursor=paginator.get_next_cursor(tickets_rows),
+        total_count=total_count,
+        is_total_count_approximate=is_total_count_approximate,
+        items=items,
+    ).model_dump_json(exclude=_get_paginated_tickets_exclude(paginator, include_total))
+    if is_database_json_enabled:
+        # "items" is the last field, the tickets JSONs are put into its empty list as they are
+        items_json = ",".join(ticket_row.json for ticket_row in tickets_rows)
+        paginated_tickets_json = f"{paginated_tickets_json.removesuffix('[]}')}[{items_json}]}}"
+    return Response(content=paginated_tickets_json, media_type="application/json")
 
 
-@router.get("/download_ticket/{ticket_id}", status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+@router.get(
+    "/download_ticket/{ticket_id}",
+    status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+    responses={
+        status.HTTP_200_OK: {"content": {TICKET_FILE_CONTENT_TYPE: {}}},
+        status.HTTP_304_NOT_MODIFIED: {},
+    },
+)
 async def download_ticket(
         ticket_id: int,
-        max_symbols: int,
+        max_symbols: int = Query(gt=0, le=MAX_RECEIPT_SYMBOLS),
+        if_none_match: Optional[str] = Header(None),
         download_ticket_service: DownloadTicketService = Depends(Stub(DownloadTicketService)),
 ):
     try:
-        download_url = await download_ticket_service.get_download_url(ticket_id, max_symbols)
+        # ETags are only sent along with the streamed files
+        if if_none_match and download_ticket_service.is_streaming_enabled():
+            etag = download_ticket_service.get_ticket_file_etag(ticket_id, max_symbols)
+            if _is_etag_matched(if_none_match, etag):
+                await download_ticket_service.check_ticket_exists(ticket_id)
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": etag, "Cache-Control": TICKET_FILE_CACHE_CONTROL},
+                )
+        ticket_file = await download_ticket_service.get_ticket_file(ticket_id, max_symbols)
     except TicketNotFoundException as e:
         raise exceptions.HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
-    return RedirectResponse(download_url)
+    if not isinstance(ticket_file, TicketFile):
+        return RedirectResponse(ticket_file)
+    return StreamingResponse(
+        _iter_chunks(ticket_file.content),
+        media_type=TICKET_FILE_CONTENT_TYPE,
+        headers={
+            "ETag": ticket_file.etag,
+            "Content-Length": str(len(ticket_file.content)),
+            "Cache-Control": TICKET_FILE_CACHE_CONTROL,
+        },
+    )
+
+
+def _get_ticket_schema(ticket: Ticket, products: list[TicketProduct]) -> TicketSchema:
+    return TicketSchema(
+        id=ticket.id,
+        created_at=ticket.created_at,
+        total=ticket.total,
+        payment=TicketPaymentSchema.from_orm(ticket),
+        products=[TicketProductSchema.from_orm(product) for product in products],
+    )
+
+
+def _construct_ticket_schema(ticket_row: Row, ticket_products_rows: list[Row]) -> TicketSchema:
+    return TicketSchema.model_construct(
+        id=ticket_row.id,
+        created_at=ticket_row.created_at,
+        total=ticket_row.total,
+        payment=TicketPaymentSchema.model_construct(type=ticket_row.payment_type, amount=ticket_row.payment_amount),
+        products=[
+            TicketProductSchema.model_construct(
+                ticket_id=ticket_product_row.ticket_id,
+                name=ticket_product_row.name,
+                price=ticket_product_row.price,
+                quantity=ticket_product_row.quantity,
+            )
+            for ticket_product_row in ticket_products_rows
+        ],
+    )
+
+
+def _get_paginated_tickets_exclude(paginator: BasePaginator, include_total: bool) -> set[str]:
+    """The fields of the opt-in features are left out unless requested, so the offset pages stay as they were"""
+    exclude = set()
+    if not paginator.is_cursor_mode:
+        exclude.add("next_cursor")
+    if not include_total:
+        exclude.update(("total_count", "is_total_count_approximate"))
+    return exclude
+
+
+def _is_etag_matched(if_none_match: str, etag: str) -> bool:
+    # weak comparison, as If-None-Match requires
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _iter_chunks(content: bytes) -> Iterator[bytes]:
+    for start in range(0, len(content), TICKET_FILE_CHUNK_SIZE):
+        yield content[start:start + TICKET_FILE_CHUNK_SIZE]
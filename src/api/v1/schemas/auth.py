@@ -7,6 +7,10 @@ class RegistrationRequestSchema(BaseModel):
     password: str
 
 
+class RegistrationResponseSchema(BaseModel):
+    success: bool
+
+
 class LoginRequestSchema(BaseModel):
     nickname: str
     password: str
@@ -1,5 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
+from typing import Optional
 
 from pydantic import BaseModel, computed_field, Field
 
@@ -53,3 +54,26 @@ class TicketSchema(BaseModel):
 
 class PaginatedTicketSchema(BasePaginatedResponse):
     items: list[TicketSchema]
+
+
+class TicketCreationResultSchema(BaseModel):
+    ticket: Optional[TicketSchema] = None
+    error: Optional[str] = None
+
+
+class TicketDailyStatsSchema(BaseModel):
+    day: date
+    payment_type: PaymentTypeEnum
+    tickets_count: int
+    total: Decimal
+    payment_amount: Decimal
+
+    class Config:
+        from_attributes = True
+
+
+class TicketsStatsSchema(BaseModel):
+    tickets_count: int
+    total: Decimal
+    payment_amount: Decimal
+    days: list[TicketDailyStatsSchema]
@@ -0,0 +1,77 @@
+"""
+Measures the per-request overhead of resolving the services dependencies by "DependenciesOverrides".
+
+Adds routes depending on the services to the application, sends requests to them in process
+and subtracts the time of a route without dependencies. Nothing is sent to the database or the files storage:
+the sessions aren't connected until they're used, the access token is signed for a fake user.
+
+Usage: python -m benchmarks.dependencies_resolution [--requests 1000] [--rounds 5]
+"""
+import argparse
+import asyncio
+import time
+from typing import Callable
+
+from fastapi import Depends, FastAPI
+from httpx import ASGITransport, AsyncClient
+from starlette.responses import Response
+
+from adapters.auth import JWTAuthenticator
+from config import Config
+from dependencies import Stub
+from main import create_application, fastapi_dependency_overrides_factory
+from services.auth import LoginService
+from services.tickets import CreateTicketService, DownloadTicketService, RetrieveTicketsService
+
+BENCHMARKED_SERVICES = (RetrieveTicketsService, CreateTicketService, DownloadTicketService, LoginService)
+
+
+def add_benchmark_route(application: FastAPI, path: str, dependency: Callable = None):
+    if dependency is None:
+        async def endpoint():
+            return Response()
+    else:
+        async def endpoint(service=Depends(Stub(dependency))):
+            return Response()
+    application.add_api_route(path, endpoint)
+
+
+BENCHMARK_USER_ID = 1
+
+
+async def measure(client: AsyncClient, path: str, access_token: str, requests: int, rounds: int) -> float:
+    """Best time of the rounds per request, in microseconds"""
+    durations = []
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get(path, headers={"Authorization": access_token})
+            # otherwise the failure path would be measured instead of the dependencies resolution
+            assert response.status_code == 200, f"{path} has responded with {response.status_code}: {response.text}"
+        durations.append((time.perf_counter() - started_at) / requests * 1_000_000)
+    return min(durations)
+
+
+async def main(requests: int, rounds: int):
+    application = create_application(fastapi_dependency_overrides_factory, Config())
+    add_benchmark_route(application, "/benchmark/no_dependencies")
+    for service in BENCHMARKED_SERVICES:
+        add_benchmark_route(application, f"/benchmark/{service.__name__}", service)
+    jwt_authenticator = await application.dependency_overrides[JWTAuthenticator]()
+    access_token = jwt_authenticator.create_access_token(BENCHMARK_USER_ID)
+    async with AsyncClient(transport=ASGITransport(app=application), base_url="http://test") as client:
+        baseline = await measure(client, "/benchmark/no_dependencies", access_token, requests, rounds)
+        print(f"no dependencies: {baseline:.0f} us per request")
+        for service in BENCHMARKED_SERVICES:
+            duration = await measure(client, f"/benchmark/{service.__name__}", access_token, requests, rounds)
+            print(
+                f"{service.__name__}: {duration:.0f} us per request, {duration - baseline:.0f} us for the dependencies"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.requests, arguments.rounds))
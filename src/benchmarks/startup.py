@@ -0,0 +1,84 @@
+"""
+Reports the time to the first request of a worker, every run starts a fresh process, as every worker starts cold.
+
+With the "production" gunicorn profile the master process imports the application and the lazily imported modules
+once, the forked workers only run the lifespan startup and handle the first request. The "development" profile
+imports the application in every worker. Both are reproduced here, the "production" one with a fork of the process.
+The lifespan connects to the database and the files storage, "--no-lifespan" skips it when they aren't available.
+
+Usage: python -m benchmarks.startup [--runs 5] [--no-lifespan]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+PROFILES = ("production", "development")
+
+
+async def start_worker(lifespan: bool) -> dict:
+    from main import app
+    started_at = time.perf_counter()
+    async with app.router.lifespan_context(app) if lifespan else contextlib.nullcontext():
+        lifespan_started_at = time.perf_counter()
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.get("/api/v1/metrics")
+            response.raise_for_status()
+        first_request_handled_at = time.perf_counter()
+    return {
+        "lifespan": lifespan_started_at - started_at,
+        "first request": first_request_handled_at - lifespan_started_at,
+    }
+
+
+def run_worker(profile: str, lifespan: bool):
+    """Prints the timings of the worker started with the profile as JSON"""
+    started_at = time.perf_counter()
+    import main
+    if profile == "production":
+        main.preload_modules()
+    imported_at = time.perf_counter()
+    timings = {"import": imported_at - started_at}
+    if profile == "production" and (worker_pid := os.fork()):
+        os.waitpid(worker_pid, 0)
+        return
+    timings.update(asyncio.run(start_worker(lifespan)))
+    print(json.dumps(timings), flush=True)
+    if profile == "production":
+        os._exit(0)
+
+
+def main(runs: int, lifespan: bool):
+    for profile in PROFILES:
+        command = [sys.executable, "-m", "benchmarks.startup", "--worker", profile]
+        if not lifespan:
+            command.append("--no-lifespan")
+        timings = [
+            json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout.splitlines()[-1])
+            for _ in range(runs)
+        ]
+        medians = {phase: statistics.median(timing[phase] for timing in timings) * 1000 for phase in timings[0]}
+        worker_phases = ("lifespan", "first request") if profile == "production" else tuple(medians)
+        print(
+            f"{profile}: " + ", ".join(f"{phase} {median:.0f} ms" for phase, median in medians.items())
+            + f", time to the first request of a worker {sum(medians[phase] for phase in worker_phases):.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-lifespan", action="store_true", help="skip the lifespan startup")
+    parser.add_argument("--worker", choices=PROFILES, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.worker:
+        run_worker(arguments.worker, not arguments.no_lifespan)
+    else:
+        main(arguments.runs, not arguments.no_lifespan)
@@ -0,0 +1,156 @@
+"""
+Checks that the tickets list queries are served by the "tickets" composite indexes
+and that the "created_at" range filter prunes the monthly partitions.
+
+Seeds a big dataset inside a transaction, runs "EXPLAIN" for the queries built by TicketsRepository
+for the typical TicketsFilter shapes and rolls everything back, so it's safe to repeat.
+The partitions of the seeded months are created in the same transaction, if they're missing.
+
+Usage: python -m benchmarks.tickets_list_explain [--tickets 2000000] [--users 100] [--analyze]
+"""
+import argparse
+import asyncio
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from adapters.repositories.base import create_repository
+from adapters.repositories.tickets import TicketPartitionsRepository, TicketsRepository, add_months
+from api.v1.filters.tickets import TicketsFilter
+from config import Config
+from models import Ticket
+
+PAGE_SIZE = 50
+SEEDED_MONTHS = 25
+
+SEED_USERS_QUERY = """
+INSERT INTO users (nickname, name, password)
+SELECT 'explain_' || i || '_' || :run_tag, 'explain_' || i || '_' || :run_tag, ''
+FROM generate_series(1, :users) AS i
+RETURNING id
+"""
+
+SEED_TICKETS_QUERY = """
+INSERT INTO tickets (user_id, created_at, payment_type, payment_amount, total)
+SELECT
+    (CAST(:user_ids AS integer[]))[1 + i % :users],
+    now() - random() * interval '730 days',
+    (CASE WHEN random() < 0.5 THEN 'cash' ELSE 'card' END)::paymenttypeenum,
+    amount + 100,
+    amount
+FROM (SELECT i, round((random() * 1000)::numeric, 2) AS amount FROM generate_series(1, :tickets) AS i) AS seed
+"""
+
+
+def iter_plan_nodes(plan_node: dict) -> Iterator[dict]:
+    yield plan_node
+    for child_node in plan_node.get("Plans", []):
+        yield from iter_plan_nodes(child_node)
+
+
+def get_scans_description(plan: dict) -> tuple[list[str], bool, set[str]]:
+    indexes, seq_scan, partitions = [], False, set()
+    for plan_node in iter_plan_nodes(plan["Plan"]):
+        relation_name = plan_node.get("Relation Name", "")
+        if not relation_name.startswith(f"{Ticket.__tablename__}_"):
+            continue
+        partitions.add(relation_name)
+        # the default partition is empty, when it isn't pruned it may be scanned sequentially
+        if plan_node["Node Type"] == "Seq Scan" and relation_name != f"{Ticket.__tablename__}_default":
+            seq_scan = True
+        if index_name := plan_node.get("Index Name"):
+            indexes.append(index_name)
+    return indexes, seq_scan, partitions
+
+
+async def create_seeded_partitions(session: AsyncSession):
+    partitions_repo = TicketPartitionsRepository(Config(), create_repository(Ticket, session))
+    partitions_months = await partitions_repo.get_partitions_months()
+    current_month = date.today().replace(day=1)
+    for months in range(SEEDED_MONTHS):
+        month = add_months(current_month, -months)
+        if month not in partitions_months and not await partitions_repo.has_default_partition_tickets(month):
+            await partitions_repo.create_partitions(month)
+
+
+async def explain(
+        tickets_repo: TicketsRepository,
+        user_id: int,
+        tickets_filter: Optional[TicketsFilter],
+        keyset: Optional[tuple[datetime, int]],
+        analyze: bool,
+) -> dict:
+    return await tickets_repo.explain_many_tickets(
+        user_id,
+        tickets_filter,
+        limit=PAGE_SIZE,
+        keyset_pagination=True,
+        keyset=keyset,
+        analyze=analyze,
+    )
+
+
+async def main(tickets: int, users: int, analyze: bool) -> bool:
+    config = Config()
+    engine = create_async_engine(config.DATABASE_URL)
+    success = True
+    async with engine.connect() as connection:
+        transaction = await connection.begin()
+        try:
+            session = AsyncSession(bind=connection)
+            await create_seeded_partitions(session)
+            run_tag = datetime.now().strftime("%Y%m%d%H%M%S%f")
+            user_ids = (
+                await connection.execute(text(SEED_USERS_QUERY), {"users": users, "run_tag": run_tag})
+            ).scalars().all()
+            await connection.execute(
+                text(SEED_TICKETS_QUERY),
+                {"user_ids": list(user_ids), "users": users, "tickets": tickets},
+            )
+            await connection.execute(text("ANALYZE tickets"))
+
+            tickets_repo = TicketsRepository(config, create_repository(Ticket, session))
+            user_id = min(user_ids)
+            now = datetime.now()
+            deep_keyset = (now - timedelta(days=600), 0)
+            scenarios = {
+                "first page": (None, None),
+                "deep page": (None, deep_keyset),
+                "created_at range": (
+                    TicketsFilter(created_at__gte=now - timedelta(days=60), created_at__lte=now - timedelta(days=30)),
+                    None,
+                ),
+                "payment_type": (TicketsFilter(payment_type="card"), deep_keyset),
+                "total range": (TicketsFilter(total__gte=Decimal("10.00"), total__lte=Decimal("20.00")), None),
+            }
+            for scenario_name, (tickets_filter, keyset) in scenarios.items():
+                plan = await explain(tickets_repo, user_id, tickets_filter, keyset, analyze)
+                indexes, seq_scan, partitions = get_scans_description(plan)
+                scenario_success = bool(indexes) and not seq_scan
+                if scenario_name == "created_at range":
+                    # a month long range is within 2 monthly partitions, only they have to be scanned
+                    scenario_success = scenario_success and len(partitions) <= 2
+                success = success and scenario_success
+                execution_time = f", {plan['Execution Time']:.2f} ms" if analyze else ""
+                print(
+                    f"[{'OK' if scenario_success else 'FAIL'}] {scenario_name}: "
+                    f"indexes={len(indexes)}, partitions={len(partitions)}, seq_scan={seq_scan}, "
+                    f"cost={plan['Plan']['Total Cost']}{execution_time}"
+                )
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+    return success
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--analyze", action="store_true", help="run EXPLAIN ANALYZE to report execution time")
+    arguments = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(arguments.tickets, arguments.users, arguments.analyze)) else 1)
@@ -0,0 +1,141 @@
+"""
+Compares the tickets list read paths: ORM objects validated into schemas and then by "response_model",
+against Core rows built into schemas without validation and serialized directly, as "GET /tickets" does now,
+and against the tickets serialized by the database, as it does with "TICKETS_DATABASE_JSON_ENABLED".
+
+Seeds one user with a page of tickets inside a transaction, reads and serializes the page with both paths
+and rolls everything back, so it's safe to repeat.
+
+Usage: python -m benchmarks.tickets_list_serialization [--page-size 500] [--products 5] [--repeat 20]
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from starlette.responses import JSONResponse
+
+from adapters.repositories.base import create_repository
+from adapters.repositories.tickets import TicketsRepository
+from api.v1.handlers.tickets import _construct_ticket_schema, _get_ticket_schema
+from api.v1.schemas.tickets import PaginatedTicketSchema
+from config import Config
+from models import Ticket
+
+SEED_USER_QUERY = """
+INSERT INTO users (nickname, name, password)
+VALUES ('serialization_' || :run_tag, 'serialization_' || :run_tag, '')
+RETURNING id
+"""
+
+SEED_TICKETS_QUERY = """
+INSERT INTO tickets (user_id, created_at, payment_type, payment_amount, total)
+SELECT :user_id, now() - i * interval '1 minute', 'cash', 1000, 10 * :products
+FROM generate_series(1, :tickets) AS i
+"""
+
+SEED_TICKET_PRODUCTS_QUERY = """
+INSERT INTO ticket_products (ticket_id, ticket_created_at, name, price, quantity)
+SELECT tickets.id, tickets.created_at, 'product ' || i, 5, 2
+FROM tickets, generate_series(1, :products) AS i
+WHERE tickets.user_id = :user_id
+"""
+
+
+async def measure(name: str, read_page: Callable[[], Awaitable[bytes]], session: AsyncSession, repeat: int) -> bytes:
+    page = await read_page()
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        session.expunge_all()
+        await read_page()
+    print(f"{name}: {(time.perf_counter() - started_at) / repeat * 1000:.2f} ms per page")
+    return page
+
+
+async def main(page_size: int, products: int, repeat: int):
+    config = Config()
+    engine = create_async_engine(config.DATABASE_URL)
+    response_field = create_model_field(name="Response", type_=PaginatedTicketSchema, mode="serialization")
+    async with engine.connect() as connection:
+        transaction = await connection.begin()
+        try:
+            run_tag = datetime.now().strftime("%Y%m%d%H%M%S%f")
+            user_id = (await connection.execute(text(SEED_USER_QUERY), {"run_tag": run_tag})).scalar_one()
+            await connection.execute(
+                text(SEED_TICKETS_QUERY),
+                {"user_id": user_id, "tickets": page_size, "products": products},
+            )
+            await connection.execute(text(SEED_TICKET_PRODUCTS_QUERY), {"user_id": user_id, "products": products})
+            session = AsyncSession(bind=connection)
+            tickets_repo = TicketsRepository(config, create_repository(Ticket, session))
+
+            async def read_orm_page() -> bytes:
+                tickets = await tickets_repo.get_many_tickets(user_id, limit=page_size, keyset_pagination=True)
+                paginated_tickets = PaginatedTicketSchema(
+                    page_size=page_size,
+                    page=None,
+                    items=[_get_ticket_schema(ticket, ticket.ticket_products) for ticket in tickets],
+                )
+                # what FastAPI does with the returned value for the "response_model"
+                content = await serialize_response(field=response_field, response_content=paginated_tickets)
+                return JSONResponse(content).body
+
+            async def read_rows_page() -> bytes:
+                tickets_rows, ticket_products_rows = await tickets_repo.get_many_tickets_rows(
+                    user_id,
+                    limit=page_size,
+                    keyset_pagination=True,
+                )
+                paginated_tickets = PaginatedTicketSchema.model_construct(
+                    page_size=page_size,
+                    page=None,
+                    next_cursor=None,
+                    total_count=None,
+                    is_total_count_approximate=False,
+                    items=[
+                        _construct_ticket_schema(ticket_row, ticket_products_rows[ticket_row.id])
+                        for ticket_row in tickets_rows
+                    ],
+                )
+                return paginated_tickets.model_dump_json().encode()
+
+            async def read_database_json_page() -> bytes:
+                tickets_rows = await tickets_repo.get_many_tickets_json(
+                    user_id,
+                    limit=page_size,
+                    keyset_pagination=True,
+                )
+                paginated_tickets_json = PaginatedTicketSchema.model_construct(
+                    page_size=page_size,
+                    page=None,
+                    next_cursor=None,
+                    total_count=None,
+                    is_total_count_approximate=False,
+                    items=[],
+                ).model_dump_json().removesuffix("[]}")
+                items_json = ",".join(ticket_row.json for ticket_row in tickets_rows)
+                return f"{paginated_tickets_json}[{items_json}]}}".encode()
+
+            orm_page = await measure("ORM objects + response_model", read_orm_page, session, repeat)
+            rows_page = await measure("Core rows + model_construct", read_rows_page, session, repeat)
+            database_json_page = await measure("JSON built by the database", read_database_json_page, session, repeat)
+            print(f"Same responses: {json.loads(orm_page) == json.loads(rows_page)}")
+            print(f"Same bytes of the database JSON: {rows_page == database_json_page}")
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--products", type=int, default=5, help="products per ticket")
+    parser.add_argument("--repeat", type=int, default=20)
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.page_size, arguments.products, arguments.repeat))
@@ -0,0 +1,39 @@
+"""
+Revokes the token by its "jti" claim, every worker rejects it after its next revoked tokens sync.
+
+Usage: python -m commands.revoke_token <jti> [--expires-in-minutes 1440]
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from adapters.repositories.base import create_repository
+from adapters.repositories.tokens import RevokedTokensRepository
+from config import Config
+from models import RevokedToken
+
+
+async def main(jti: str, expires_in_minutes: Optional[int]):
+    config = Config()
+    # the token itself isn't known, so it's kept revoked for the longest lifetime a token can have by default
+    expires_in_minutes = expires_in_minutes or max(
+        config.JWT_ACCESS_TOKEN_EXPIRE_MINUTES,
+        config.JWT_REFRESH_TOKEN_EXPIRE_MINUTES,
+    )
+    engine = create_async_engine(config.DATABASE_URL)
+    async with AsyncSession(engine) as session, session.begin():
+        revoked_tokens_repo = RevokedTokensRepository(config, create_repository(RevokedToken, session))
+        await revoked_tokens_repo.revoke_token(jti, datetime.now() + timedelta(minutes=expires_in_minutes))
+    await engine.dispose()
+    print(f"Token {jti} is revoked")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("jti")
+    parser.add_argument("--expires-in-minutes", type=int, help="how long the token has to be kept revoked")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.jti, arguments.expires_in_minutes))
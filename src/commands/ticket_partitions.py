@@ -0,0 +1,57 @@
+"""
+Creates the monthly partitions of the tickets and their products ahead of time, run it at least monthly.
+Optionally detaches the partitions of the old months, they are kept as the standalone tables to be archived or dropped.
+
+Tickets of the months without partitions go to the default partitions and aren't pruned,
+the partitions of such months aren't created until their tickets are moved from the default partitions.
+
+Usage: python -m commands.ticket_partitions [--months-ahead 3] [--detach-older-than-months <months>]
+"""
+import argparse
+import asyncio
+from datetime import date
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from adapters.repositories.base import create_repository
+from adapters.repositories.tickets import TicketPartitionsRepository, add_months
+from config import Config
+from models import Ticket
+
+
+async def main(months_ahead: int, detach_older_than_months: Optional[int]):
+    config = Config()
+    current_month = date.today().replace(day=1)
+    engine = create_async_engine(config.DATABASE_URL)
+    async with AsyncSession(engine) as session, session.begin():
+        partitions_repo = TicketPartitionsRepository(config, create_repository(Ticket, session))
+        partitions_months = await partitions_repo.get_partitions_months()
+        for months in range(months_ahead + 1):
+            month = add_months(current_month, months)
+            if month in partitions_months:
+                continue
+            if await partitions_repo.has_default_partition_tickets(month):
+                print(f"Partitions of {month:%Y-%m} aren't created, the default partition has tickets of the month")
+                continue
+            await partitions_repo.create_partitions(month)
+            print(f"Partitions of {month:%Y-%m} are created")
+        if detach_older_than_months is not None:
+            oldest_kept_month = add_months(current_month, -detach_older_than_months)
+            for month in partitions_months:
+                if month < oldest_kept_month:
+                    await partitions_repo.detach_partitions(month)
+                    print(f"Partitions of {month:%Y-%m} are detached")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--months-ahead", type=int, default=3, help="months after the current one to partition")
+    parser.add_argument(
+        "--detach-older-than-months",
+        type=int,
+        help="detach the partitions of the months older than the given number of months before the current one",
+    )
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.months_ahead, arguments.detach_older_than_months))
@@ -1,19 +1,41 @@
+import functools
 import os
 from pathlib import Path, PosixPath
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-from passlib.context import CryptContext
 from pydantic_settings import BaseSettings
 
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
 
 class Config(BaseSettings):
     HOST_DOMAIN: str = os.getenv("HOST_DOMAIN", "http://127.0.0.1:8000")
 
     BASE_DIR: PosixPath = Path(__file__).resolve().parent
 
-    PWD_CONTEXT: CryptContext = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    PASSWORD_HASHER_WORKERS_COUNT: int = int(os.getenv("PASSWORD_HASHER_WORKERS_COUNT", 2))
+    PASSWORD_HASHER_MAX_PENDING: int = int(os.getenv("PASSWORD_HASHER_MAX_PENDING", 32))
 
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    # connections of all the workers together, each worker gets an equal share of it for its pool
+    DATABASE_CONNECTIONS_BUDGET: int = int(os.getenv("DATABASE_CONNECTIONS_BUDGET", 80))
+    # 0 to size the pool from the budget
+    DATABASE_POOL_SIZE: int = int(os.getenv("DATABASE_POOL_SIZE", 0))
+    DATABASE_POOL_MAX_OVERFLOW: int = int(os.getenv("DATABASE_POOL_MAX_OVERFLOW", 0))
+    DATABASE_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DATABASE_POOL_TIMEOUT_SECONDS", 30))
+    # -1 to never recycle the connections
+    DATABASE_POOL_RECYCLE_SECONDS: int = int(os.getenv("DATABASE_POOL_RECYCLE_SECONDS", -1))
+    DATABASE_POOL_PRE_PING: bool = bool(os.getenv("DATABASE_POOL_PRE_PING", ""))
+    DATABASE_STATEMENT_CACHE_SIZE: int = int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE", 100))
+    # read-only replica the tickets are read from, the primary database is used for everything when it's not set
+    DATABASE_REPLICA_URL: Optional[str] = os.getenv("DATABASE_REPLICA_URL")
+    # should be longer than the replication lag, the user reads from the primary for that long after writing
+    DATABASE_REPLICA_READ_YOUR_WRITES_SECONDS: int = int(os.getenv("DATABASE_REPLICA_READ_YOUR_WRITES_SECONDS", 10))
+    RECENT_WRITES_CACHE_SIZE: int = int(os.getenv("RECENT_WRITES_CACHE_SIZE", 10000))
+
+    # the number of the gunicorn workers, set by "gunicorn.conf.py"
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", 1))
 
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY")
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", 60))
@@ -22,6 +44,11 @@ class Config(BaseSettings):
     JWT_REFRESH_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("JWT_REFRESH_TOKEN_EXPIRE_MINUTES", 1440))
     JWT_ACCESS_TOKEN_TYPE: str = os.getenv("JWT_ACCESS_TOKEN_TYPE", "access_token")
     JWT_REFRESH_TOKEN_TYPE: str = os.getenv("JWT_REFRESH_TOKEN_TYPE", "refresh_token")
+    JWT_TOKENS_CACHE_SIZE: int = int(os.getenv("JWT_TOKENS_CACHE_SIZE", 10000))
+    # the longest time a token revoked by another worker or the command is still accepted by the current worker
+    JWT_REVOKED_TOKENS_SYNC_INTERVAL_SECONDS: int = int(os.getenv("JWT_REVOKED_TOKENS_SYNC_INTERVAL_SECONDS", 5))
+    # tokens revoked in transactions committed later than they started are fetched once again to not be missed
+    JWT_REVOKED_TOKENS_SYNC_OVERLAP_SECONDS: int = int(os.getenv("JWT_REVOKED_TOKENS_SYNC_OVERLAP_SECONDS", 60))
 
     MINIO_URL: str = os.getenv("MINIO_URL", "minio:9000")
     MINIO_SECURE: bool = bool(os.getenv("MINIO_SECURE", ""))
@@ -31,5 +58,46 @@ class Config(BaseSettings):
 
     TICKET_FILES_BUCKET_NAME: str = os.getenv("TICKET_FILES_BUCKET_NAME", "files")
 
+    TICKET_FILES_STREAMING_ENABLED: bool = bool(os.getenv("TICKET_FILES_STREAMING_ENABLED", ""))
+    TICKET_FILES_STREAMING_MAX_SIZE: int = int(os.getenv("TICKET_FILES_STREAMING_MAX_SIZE", 64 * 1024))
+
+    # comma separated "max_symbols" values the ticket files are rendered for right after the tickets creation
+    TICKET_FILES_PRERENDER_WIDTHS: str = os.getenv("TICKET_FILES_PRERENDER_WIDTHS", "32,42,48")
+
+    BACKGROUND_JOBS_QUEUE_SIZE: int = int(os.getenv("BACKGROUND_JOBS_QUEUE_SIZE", 1000))
+    BACKGROUND_JOBS_WORKERS_COUNT: int = int(os.getenv("BACKGROUND_JOBS_WORKERS_COUNT", 2))
+
+    # result sets up to this size are counted exactly, bigger ones are estimated by the query planner
+    TICKETS_EXACT_COUNT_THRESHOLD: int = int(os.getenv("TICKETS_EXACT_COUNT_THRESHOLD", 1000))
+    TICKETS_COUNT_CACHE_SIZE: int = int(os.getenv("TICKETS_COUNT_CACHE_SIZE", 10000))
+    TICKETS_COUNT_CACHE_TTL_SECONDS: int = int(os.getenv("TICKETS_COUNT_CACHE_TTL_SECONDS", 60))
+
+    # the tickets are read already serialized to JSON by the database, instead of serializing them in Python
+    TICKETS_DATABASE_JSON_ENABLED: bool = bool(os.getenv("TICKETS_DATABASE_JSON_ENABLED", ""))
+
+    # "GET /api/v1/metrics" is served only with this token in the "X-Metrics-Token" header, disabled when not set
+    METRICS_TOKEN: Optional[str] = os.getenv("METRICS_TOKEN")
+
+    FILES_LINKS_EXPIRATION_MINUTES: int = int(os.getenv("FILES_LINKS_EXPIRATION_MINUTES", 60))
+    FILES_LINKS_CACHE_SIZE: int = int(os.getenv("FILES_LINKS_CACHE_SIZE", 10000))
+    FILES_LINKS_CACHE_MARGIN_SECONDS: int = int(os.getenv("FILES_LINKS_CACHE_MARGIN_SECONDS", 300))
+
+    @functools.cached_property
+    def pwd_context(self) -> "CryptContext":
+        # imported on the first use, most of the processes importing the config never hash passwords
+        from passlib.context import CryptContext
+        return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+    @property
+    def database_pool_size(self) -> int:
+        if self.DATABASE_POOL_SIZE:
+            return self.DATABASE_POOL_SIZE
+        worker_connections = self.DATABASE_CONNECTIONS_BUDGET // max(self.WEB_CONCURRENCY, 1)
+        return max(worker_connections - self.DATABASE_POOL_MAX_OVERFLOW, 1)
+
+    @property
+    def ticket_files_prerender_widths(self) -> list[int]:
+        return [int(width) for width in self.TICKET_FILES_PRERENDER_WIDTHS.split(",") if width.strip()]
+
     class Config:
         frozen = True
@@ -1,6 +1,27 @@
 import enum
 import functools
 
+MAX_TICKETS_BATCH_SIZE = 1000
+MAX_RECEIPT_SYMBOLS = 500
+TICKET_FILE_CONTENT_TYPE = "text/plain; charset=utf-8"
+TICKET_FILE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+TICKET_FILE_CHUNK_SIZE = 64 * 1024
+TICKETS_ARCHIVE_CONTENT_TYPE = "application/zip"
+TICKETS_NDJSON_CONTENT_TYPE = "application/x-ndjson"
+TICKETS_CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+TICKETS_EXPORT_CHUNK_SIZE = 64 * 1024
+TICKETS_EXPORT_FIELDS = (
+    "ticket_id",
+    "created_at",
+    "payment_type",
+    "payment_amount",
+    "total",
+    "product_id",
+    "product_name",
+    "product_price",
+    "product_quantity",
+)
+
 
 class PaymentTypeEnum(enum.Enum):
     cash = "cash"
@@ -14,3 +35,13 @@ class PaymentTypeEnum(enum.Enum):
     @classmethod
     def get_display_name(cls, value_to_display: str) -> str:
         return cls._display_name_mapping().get(value_to_display, "")
+
+
+class TicketsExportFormatEnum(enum.Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class PaginationModeEnum(enum.Enum):
+    offset = "offset"
+    cursor = "cursor"
@@ -1,22 +1,37 @@
 import functools
-from typing import Callable, Type
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Optional, Type
 
-import miniopy_async
 from fastapi import Depends, Header
-from miniopy_async import Minio
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from adapters.auth import JWTAuthenticator, IdentityProviderABC, JWTIdentityProvider
+from adapters.background import BackgroundJobsQueue
+from adapters.cache import RecentWritesCache, TicketsCountCache
+from adapters.database import create_db_engine
 from adapters.files_storage import FilesStorage
+from adapters.passwords import PasswordHasher
 from adapters.repositories.base import SQLAlchemyRepository, Model, create_repository
 from adapters.repositories.tickets import TicketsRepository, TicketProductsRepository
+from adapters.repositories.tokens import RevokedTokensRepository
 from adapters.repositories.users import UsersRepository
+from adapters.revocation import RevokedTokensRegistry
 from config import Config
-from models import Ticket, TicketProduct
+from dto import Identity
+from models import Ticket, TicketProduct, RevokedToken
 from models.users import User
-from services.auth import RegistrationService, LoginService
-from services.tickets import CreateTicketService, RetrieveTicketsService, DownloadTicketService
+from services.auth import RegistrationService, LoginService, LogoutService, RevokedTokensSyncService
+from services.tickets import (
+    CreateTicketService,
+    RetrieveTicketsService,
+    DownloadTicketService,
+    PrerenderTicketFilesService,
+    ExportTicketsService,
+)
+
+if TYPE_CHECKING:
+    from miniopy_async import Minio
 
 
 class Stub:
@@ -42,10 +57,37 @@ class Stub:
 
 
 class DependenciesOverrides:
+    """
+    Providers of the dependencies, the application singletons are built once per worker on the first use
+    and provided without any sub-dependencies. Request-scoped providers build the services with their repositories
+    at once, only the per-request dependencies (config, db sessions, identity) are resolved by FastAPI.
+    Nothing is built on the application import, so the preloading gunicorn master doesn't create the engines
+    and the clients to be shared by the forked workers, they're built by the lifespan of every worker.
+    """
+
     def __init__(self, config: Config):
         self.config = config
-        self.db_sessionmaker = sessionmaker(
-            create_async_engine(config.DATABASE_URL),
+
+    @functools.cached_property
+    def db_engine(self) -> AsyncEngine:
+        return create_db_engine(self.config)
+
+    @functools.cached_property
+    def db_sessionmaker(self) -> sessionmaker:
+        return sessionmaker(self.db_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+
+    @functools.cached_property
+    def db_replica_engine(self) -> Optional[AsyncEngine]:
+        if not self.config.DATABASE_REPLICA_URL:
+            return None
+        return create_db_engine(self.config, self.config.DATABASE_REPLICA_URL)
+
+    @functools.cached_property
+    def db_replica_sessionmaker(self) -> Optional[sessionmaker]:
+        if self.db_replica_engine is None:
+            return None
+        return sessionmaker(
+            self.db_replica_engine.execution_options(postgresql_readonly=True),
             autoflush=False,
             expire_on_commit=False,
             class_=AsyncSession,
@@ -54,26 +96,36 @@ class DependenciesOverrides:
     def overridden_dependencies(self) -> dict:
         return {
             Config: self.get_config,
-            Minio: self.get_minio_client,
             FilesStorage: self.get_files_storage,
+            BackgroundJobsQueue: self.get_background_jobs_queue,
+            TicketsCountCache: self.get_tickets_count_cache,
+            RecentWritesCache: self.get_recent_writes_cache,
+            AsyncEngine: self.get_db_engine,
+            Stub(AsyncEngine, replica=True): self.get_replica_db_engine,
             AsyncSession: self.get_db_session,
+            Stub(AsyncSession, streaming=True): self.get_streaming_db_session,
+            Stub(AsyncSession, replica=True): self.get_replica_db_session,
+            RevokedTokensRegistry: self.get_revoked_tokens_registry,
             JWTAuthenticator: self.get_jwt_authenticator,
+            PasswordHasher: self.get_password_hasher,
             IdentityProviderABC: self.get_identity_provider,
-            UsersRepository: self.get_users_repository,
-            TicketsRepository: self.get_tickets_repository,
-            TicketProductsRepository: self.get_ticket_products_repository,
+            Identity: self.get_identity,
             RegistrationService: self.get_registration_service,
             LoginService: self.get_login_service,
+            LogoutService: self.get_logout_service,
+            RevokedTokensSyncService: self.get_revoked_tokens_sync_service,
             CreateTicketService: self.get_create_ticket_service,
             RetrieveTicketsService: self.get_retrieve_tickets_service,
             DownloadTicketService: self.get_download_ticket_service,
+            PrerenderTicketFilesService: self.get_prerender_ticket_files_service,
+            ExportTicketsService: self.get_export_tickets_service,
         }
 
-    def get_config(self):
-        return self.config
+    @functools.cached_property
+    def minio_client(self) -> "Minio":
+        # the client module and its HTTP client are imported on the first use, after the workers are forked
+        import miniopy_async
 
-    @functools.lru_cache(maxsize=1)
-    def get_minio_client(self):
         return miniopy_async.Minio(
             endpoint=self.config.MINIO_URL,
             secure=self.config.MINIO_SECURE,
@@ -81,77 +133,220 @@ class DependenciesOverrides:
             secret_key=self.config.MINIO_SECRET_KEY,
         )
 
-    @functools.lru_cache(maxsize=1)
-    def get_files_storage(self, config: Config = Depends(Stub(Config)), minio_client: Minio = Depends(Stub(Minio))):
-        return FilesStorage(config, minio_client)
+    @functools.cached_property
+    def files_storage(self) -> FilesStorage:
+        return FilesStorage(self.config, self.minio_client)
+
+    @functools.cached_property
+    def background_jobs_queue(self) -> BackgroundJobsQueue:
+        return BackgroundJobsQueue(self.config.BACKGROUND_JOBS_QUEUE_SIZE, self.config.BACKGROUND_JOBS_WORKERS_COUNT)
+
+    @functools.cached_property
+    def tickets_count_cache(self) -> TicketsCountCache:
+        return TicketsCountCache(self.config.TICKETS_COUNT_CACHE_SIZE, self.config.TICKETS_COUNT_CACHE_TTL_SECONDS)
+
+    @functools.cached_property
+    def recent_writes_cache(self) -> RecentWritesCache:
+        return RecentWritesCache(
+            self.config.RECENT_WRITES_CACHE_SIZE,
+            self.config.DATABASE_REPLICA_READ_YOUR_WRITES_SECONDS,
+        )
+
+    @functools.cached_property
+    def revoked_tokens_registry(self) -> RevokedTokensRegistry:
+        return RevokedTokensRegistry()
+
+    @functools.cached_property
+    def jwt_authenticator(self) -> JWTAuthenticator:
+        return JWTAuthenticator(self.config, self.revoked_tokens_registry)
+
+    @functools.cached_property
+    def password_hasher(self) -> PasswordHasher:
+        return PasswordHasher(self.config)
+
+    @functools.cached_property
+    def revoked_tokens_sync_service(self) -> RevokedTokensSyncService:
+        return RevokedTokensSyncService(
+            self.config,
+            self.revoked_tokens_registry,
+            functools.partial(self.background_revoked_tokens_repository, self.config),
+        )
+
+    @functools.cached_property
+    def prerender_ticket_files_service(self) -> PrerenderTicketFilesService:
+        return PrerenderTicketFilesService(
+            self.config,
+            self.background_jobs_queue,
+            functools.partial(self.background_download_ticket_service, self.config, self.files_storage),
+        )
+
+    async def get_config(self):
+        return self.config
+
+    async def get_files_storage(self):
+        return self.files_storage
+
+    async def get_background_jobs_queue(self):
+        return self.background_jobs_queue
+
+    async def get_tickets_count_cache(self):
+        return self.tickets_count_cache
+
+    async def get_recent_writes_cache(self):
+        return self.recent_writes_cache
+
+    async def get_db_engine(self):
+        return self.db_engine
+
+    async def get_replica_db_engine(self):
+        """Engine of the read-only replica, None when it isn't configured"""
+        return self.db_replica_engine
 
     async def get_db_session(self):
         async with (session := self.db_sessionmaker()):
             yield session
 
-    @functools.lru_cache(maxsize=1)
-    def get_jwt_authenticator(self, config: Config = Depends(Stub(Config))):
-        return JWTAuthenticator(config)
+    async def get_streaming_db_session(self):
+        """
+        Session for the streamed responses: dependencies are finalized before the response body is sent,
+        so it isn't closed by FastAPI and has to be closed by the response body generator itself.
+        """
+        return self.db_sessionmaker()
+
+    async def get_replica_db_session(self):
+        """Session of the read-only replica, None when it isn't configured"""
+        if self.db_replica_sessionmaker is None:
+            yield None
+            return
+        async with (session := self.db_replica_sessionmaker()):
+            yield session
+
+    async def get_revoked_tokens_registry(self):
+        return self.revoked_tokens_registry
+
+    async def get_jwt_authenticator(self):
+        return self.jwt_authenticator
+
+    async def get_password_hasher(self):
+        return self.password_hasher
 
-    def get_identity_provider(
+    async def get_revoked_tokens_sync_service(self):
+        return self.revoked_tokens_sync_service
+
+    async def get_prerender_ticket_files_service(self):
+        return self.prerender_ticket_files_service
+
+    async def get_identity_provider(self, authorization: str = Header(...)):
+        return JWTIdentityProvider(self.jwt_authenticator, authorization)
+
+    async def get_identity(
             self,
-            authorization: str = Header(...),
-            jwt_authenticator: JWTAuthenticator = Depends(Stub(JWTAuthenticator)),
+            identity_provider: IdentityProviderABC = Depends(Stub(IdentityProviderABC)),
     ):
-        return JWTIdentityProvider(jwt_authenticator, authorization)
+        """Resolved once per request, as FastAPI caches the dependencies for the request"""
+        return await identity_provider.provide_identity()
 
-    def get_users_repository(self, config: Config = Depends(Stub(Config)), db_session: AsyncSession = Depends()):
-        repo = create_repository(User, db_session)
-        return UsersRepository(config, repo)
+    async def get_registration_service(
+            self,
+            config: Config = Depends(Stub(Config)),
+            db_session: AsyncSession = Depends(Stub(AsyncSession)),
+    ):
+        users_repo = UsersRepository(config, create_repository(User, db_session), self.password_hasher)
+        return RegistrationService(config, db_session, users_repo, self.jwt_authenticator)
 
-    def get_tickets_repository(self, config: Config = Depends(Stub(Config)), db_session: AsyncSession = Depends()):
-        repo = create_repository(Ticket, db_session)
-        return TicketsRepository(config, repo)
-    
-    def get_ticket_products_repository(
+    async def get_login_service(
             self,
             config: Config = Depends(Stub(Config)),
-            db_session: AsyncSession = Depends(),
+            db_session: AsyncSession = Depends(Stub(AsyncSession)),
     ):
-        repo = create_repository(TicketProduct, db_session)
-        return TicketProductsRepository(config, repo)
+        users_repo = UsersRepository(config, create_repository(User, db_session), self.password_hasher)
+        return LoginService(config, self.jwt_authenticator, users_repo, self.password_hasher)
 
-    def get_registration_service(
+    async def get_logout_service(
             self,
             config: Config = Depends(Stub(Config)),
-            db_session: AsyncSession = Depends(),
-            users_repo: UsersRepository = Depends(Stub(UsersRepository)),
+            identity: Identity = Depends(Stub(Identity)),
+            db_session: AsyncSession = Depends(Stub(AsyncSession)),
     ):
-        return RegistrationService(config, db_session, users_repo)
+        revoked_tokens_repo = RevokedTokensRepository(config, create_repository(RevokedToken, db_session))
+        return LogoutService(identity, db_session, revoked_tokens_repo, self.revoked_tokens_registry)
 
-    def get_login_service(
+    async def get_create_ticket_service(
             self,
             config: Config = Depends(Stub(Config)),
-            jwt_authenticator: JWTAuthenticator = Depends(Stub(JWTAuthenticator)),
-            users_repo: UsersRepository = Depends(Stub(UsersRepository)),
+            identity: Identity = Depends(Stub(Identity)),
+            db_session: AsyncSession = Depends(Stub(AsyncSession)),
     ):
-        return LoginService(config, jwt_authenticator, users_repo)
+        return CreateTicketService(
+            identity,
+            db_session,
+            TicketsRepository(config, create_repository(Ticket, db_session)),
+            TicketProductsRepository(config, create_repository(TicketProduct, db_session)),
+            self.prerender_ticket_files_service,
+            self.tickets_count_cache,
+            self.recent_writes_cache,
+        )
 
-    def get_create_ticket_service(
+    async def get_retrieve_tickets_service(
             self,
-            identity_provider: IdentityProviderABC = Depends(),
-            db_session: AsyncSession = Depends(),
-            tickets_repo: TicketsRepository = Depends(Stub(TicketsRepository)),
-            ticket_products_repo: TicketProductsRepository = Depends(Stub(TicketProductsRepository)),
+            config: Config = Depends(Stub(Config)),
+            identity: Identity = Depends(Stub(Identity)),
+            db_session: AsyncSession = Depends(Stub(AsyncSession)),
+            replica_db_session: Optional[AsyncSession] = Depends(Stub(AsyncSession, replica=True)),
     ):
-        return CreateTicketService(identity_provider, db_session, tickets_repo, ticket_products_repo)
+        return RetrieveTicketsService(
+            config,
+            identity,
+            TicketsRepository(config, create_repository(Ticket, db_session)),
+            self._get_replica_tickets_repository(config, replica_db_session),
+            self.tickets_count_cache,
+            self.recent_writes_cache,
+        )
 
-    def get_retrieve_tickets_service(
+    async def get_download_ticket_service(
             self,
-            identity_provider: IdentityProviderABC = Depends(),
-            tickets_repo: TicketsRepository = Depends(Stub(TicketsRepository)),
+            config: Config = Depends(Stub(Config)),
+            db_session: AsyncSession = Depends(Stub(AsyncSession)),
+            replica_db_session: Optional[AsyncSession] = Depends(Stub(AsyncSession, replica=True)),
     ):
-        return RetrieveTicketsService(identity_provider, tickets_repo)
+        return DownloadTicketService(
+            config,
+            TicketsRepository(config, create_repository(Ticket, db_session)),
+            self.files_storage,
+            self._get_replica_tickets_repository(config, replica_db_session),
+        )
 
-    def get_download_ticket_service(
+    async def get_export_tickets_service(
             self,
             config: Config = Depends(Stub(Config)),
-            tickets_repo: TicketsRepository = Depends(Stub(TicketsRepository)),
-            files_storage: FilesStorage = Depends(Stub(FilesStorage)),
+            identity: Identity = Depends(Stub(Identity)),
+            db_session: AsyncSession = Depends(Stub(AsyncSession, streaming=True)),
     ):
-        return DownloadTicketService(config, tickets_repo, files_storage)
+        tickets_repo = TicketsRepository(config, create_repository(Ticket, db_session))
+        return ExportTicketsService(identity, db_session, tickets_repo)
+
+    def _get_replica_tickets_repository(
+            self,
+            config: Config,
+            replica_db_session: Optional[AsyncSession],
+    ) -> Optional[TicketsRepository]:
+        if not config.DATABASE_REPLICA_URL or replica_db_session is None:
+            return None
+        return TicketsRepository(config, create_repository(Ticket, replica_db_session))
+
+    @asynccontextmanager
+    async def background_download_ticket_service(
+            self,
+            config: Config,
+            files_storage: FilesStorage,
+    ) -> AsyncIterator[DownloadTicketService]:
+        """DownloadTicketService with its own db session, for the work done outside of requests"""
+        async with (session := self.db_sessionmaker()):
+            tickets_repo = TicketsRepository(config, create_repository(Ticket, session))
+            yield DownloadTicketService(config, tickets_repo, files_storage)
+
+    @asynccontextmanager
+    async def background_revoked_tokens_repository(self, config: Config) -> AsyncIterator[RevokedTokensRepository]:
+        """RevokedTokensRepository with its own db session, for the work done outside of requests"""
+        async with (session := self.db_sessionmaker()):
+            yield RevokedTokensRepository(config, create_repository(RevokedToken, session))
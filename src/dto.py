@@ -1,4 +1,6 @@
+from datetime import datetime
 from decimal import Decimal
+from typing import Optional
 
 from pydantic import BaseModel
 
@@ -8,6 +10,33 @@ class SuccessLoginResult(BaseModel):
     refresh_token: str
 
 
+class TokenClaims(BaseModel):
+    user_id: int
+    jti: str
+    expired_at: datetime
+    # the other token of the same login, revoked together with this one
+    linked_jti: Optional[str] = None
+    linked_expired_at: Optional[datetime] = None
+
+
+class Identity(BaseModel):
+    """Caller of the request, authenticated once per request and shared by all the services of the request"""
+    user_id: int
+    jti: str
+    expired_at: datetime
+    # the other token of the same login, revoked together with this one
+    linked_jti: Optional[str] = None
+    linked_expired_at: Optional[datetime] = None
+
+    class Config:
+        frozen = True
+
+
+class TicketFile(BaseModel):
+    content: bytes
+    etag: str
+
+
 class TicketProductCreationData(BaseModel):
     name: str
     price: Decimal
@@ -22,3 +51,7 @@ class TicketCreationPaymentData(BaseModel):
 class TicketCreationData(BaseModel):
     products: list[TicketProductCreationData]
     payment: TicketCreationPaymentData
+
+    @property
+    def products_total(self) -> Decimal:
+        return sum((product.price * product.quantity for product in self.products), Decimal(0))
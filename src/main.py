@@ -1,15 +1,53 @@
+import asyncio
+import importlib
+from contextlib import asynccontextmanager, suppress
 from typing import Callable
 
 import uvicorn
 from fastapi import FastAPI
 
+from adapters.background import BackgroundJobsQueue
+from adapters.files_storage import FilesStorage
+from adapters.passwords import PasswordHasher
 from api.v1.urls import v1_urls_router
 from config import Config
 from dependencies import DependenciesOverrides
+from services.auth import RevokedTokensSyncService
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    dependency_overrides = application.dependency_overrides
+    config = await dependency_overrides[Config]()
+    # the clients are built and their modules are imported here, after the worker is forked, see DependenciesOverrides
+    files_storage = await dependency_overrides[FilesStorage]()
+    await files_storage.create_bucket(config.TICKET_FILES_BUCKET_NAME)
+    password_hasher = await dependency_overrides[PasswordHasher]()
+    background_jobs_queue = await dependency_overrides[BackgroundJobsQueue]()
+    background_jobs_queue.start()
+    revoked_tokens_sync_service = await dependency_overrides[RevokedTokensSyncService]()
+    await revoked_tokens_sync_service.sync()
+    revoked_tokens_sync_task = asyncio.create_task(revoked_tokens_sync_service.run())
+    yield
+    revoked_tokens_sync_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await revoked_tokens_sync_task
+    await background_jobs_queue.stop()
+    password_hasher.shutdown()
+
+
+# imported by the application on the first use, so that the processes which don't need them don't import them
+LAZILY_IMPORTED_MODULES = ("miniopy_async", "passlib.context")
+
+
+def preload_modules():
+    """Imports the lazily imported modules, for the preloading gunicorn master to share them with the forked workers"""
+    for module in LAZILY_IMPORTED_MODULES:
+        importlib.import_module(module)
 
 
 def create_application(dependency_overrides_factory: Callable, config: Config) -> FastAPI:
-    application = FastAPI()
+    application = FastAPI(lifespan=lifespan)
 
     application.dependency_overrides = dependency_overrides_factory(config)
 
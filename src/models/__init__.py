@@ -1,6 +1,7 @@
 from sqlalchemy import MetaData
 
 from models.tickets import *
+from models.tokens import *
 from models.users import *
 
 """
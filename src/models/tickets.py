@@ -1,19 +1,24 @@
-from sqlalchemy import Column, String, Integer, DECIMAL, DateTime, func, ForeignKey, Enum
+from sqlalchemy import (
+    Column, String, Integer, DECIMAL, Date, DateTime, func, ForeignKey, ForeignKeyConstraint, Enum, Index, DDL, event,
+)
 from sqlalchemy.orm import relationship
 
 from adapters.database import Base
 
-__all__ = ("Ticket", "TicketProduct",)
+__all__ = ("Ticket", "TicketProduct", "TicketDailyAggregate",)
 
 from constants import PaymentTypeEnum
 
 
 class Ticket(Base):
+    """Partitioned by months of "created_at", see "commands.ticket_partitions" """
+
     __tablename__ = "tickets"
 
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
-    created_at = Column(DateTime, default=func.now())
+    # the primary key of a partitioned table has to include the partition key
+    id = Column(Integer, primary_key=True, autoincrement=True, insert_sentinel=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime, primary_key=True, default=func.now())
     payment_type = Column(Enum(PaymentTypeEnum), default=PaymentTypeEnum.cash)
     payment_amount = Column(DECIMAL(10, 2), nullable=False)
     total = Column(DECIMAL(10, 2), nullable=False)
@@ -21,14 +26,56 @@ class Ticket(Base):
     user = relationship("User", back_populates="tickets", cascade="all, delete")
     ticket_products = relationship("TicketProduct", back_populates="ticket")
 
+    __table_args__ = (
+        Index("ix_tickets_user_id_created_at_id", user_id, created_at.desc(), id.desc()),
+        Index("ix_tickets_user_id_payment_type_created_at", user_id, payment_type, created_at.desc()),
+        Index("ix_tickets_user_id_total", user_id, total),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
 
 class TicketProduct(Base):
+    """Partitioned by months of the ticket "created_at", so the products are in the same partitions as their tickets"""
+
     __tablename__ = "ticket_products"
 
-    id = Column(Integer, primary_key=True)
-    ticket_id = Column(Integer, ForeignKey("tickets.id"), index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, insert_sentinel=True)
+    ticket_id = Column(Integer, nullable=False, index=True)
+    ticket_created_at = Column(DateTime, primary_key=True)
     name = Column(String)
     price = Column(DECIMAL(10, 2), nullable=False)
     quantity = Column(DECIMAL(10, 2), nullable=False)
 
     ticket = relationship("Ticket", back_populates="ticket_products", cascade="all, delete")
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            [ticket_id, ticket_created_at],
+            [Ticket.id, Ticket.created_at],
+            name="ticket_products_ticket_id_ticket_created_at_fkey",
+        ),
+        {"postgresql_partition_by": "RANGE (ticket_created_at)"},
+    )
+
+
+# partitions are created by the migrations and "commands.ticket_partitions", tables created from the metadata,
+# as in the tests, get the default partitions only to be usable
+for partitioned_table in (Ticket.__table__, TicketProduct.__table__):
+    event.listen(
+        partitioned_table,
+        "after_create",
+        DDL("CREATE TABLE %(table)s_default PARTITION OF %(table)s DEFAULT"),
+    )
+
+
+class TicketDailyAggregate(Base):
+    """Per user, day and payment type sums of the tickets, updated in the same transactions the tickets are created"""
+
+    __tablename__ = "ticket_daily_aggregates"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    payment_type = Column(Enum(PaymentTypeEnum), primary_key=True)
+    tickets_count = Column(Integer, nullable=False)
+    total = Column(DECIMAL(16, 2), nullable=False)
+    payment_amount = Column(DECIMAL(16, 2), nullable=False)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, Integer, DateTime, func
+
+from adapters.database import Base
+
+__all__ = ("RevokedToken",)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, unique=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, default=func.now(), nullable=False, index=True)
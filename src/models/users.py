@@ -2,7 +2,7 @@ from sqlalchemy import Column, String, Integer
 from sqlalchemy.orm import relationship
 
 from adapters.database import Base
-from config import Config
+from adapters.passwords import PasswordHasher
 
 __all__ = ("User",)
 
@@ -18,8 +18,8 @@ class User(Base):
     tickets = relationship("Ticket", back_populates="user")
 
     @classmethod
-    def hash_password(cls, config: Config, password: str) -> str:
-        return config.PWD_CONTEXT.hash(password)
+    async def hash_password(cls, password_hasher: PasswordHasher, password: str) -> str:
+        return await password_hasher.hash(password)
 
-    def check_password(self, config: Config, password: str) -> bool:
-        return config.PWD_CONTEXT.verify(password, self.password)
+    async def check_password(self, password_hasher: PasswordHasher, password: str) -> bool:
+        return await password_hasher.verify(password, self.password)
@@ -1,36 +1,136 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncContextManager, Callable, Optional
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from adapters.auth import JWTAuthenticator
+from adapters.passwords import PasswordHasher
+from adapters.repositories.tokens import RevokedTokensRepository
 from adapters.repositories.users import UsersRepository
+from adapters.revocation import RevokedTokensRegistry
 from config import Config
-from dto import SuccessLoginResult
+from dto import Identity, SuccessLoginResult
+from models.users import User
 from services.exceptions.auth import IncorrectPasswordException, InvalidNicknameException
 
+logger = logging.getLogger(__name__)
+
+
+def create_login_result(jwt_authenticator: JWTAuthenticator, user_id: int) -> SuccessLoginResult:
+    access_token, refresh_token = jwt_authenticator.create_tokens(user_id)
+    return SuccessLoginResult(access_token=access_token, refresh_token=refresh_token)
+
 
 class RegistrationService:
-    def __init__(self, config: Config, uow: AsyncSession, users_repo: UsersRepository):
+    def __init__(
+            self,
+            config: Config,
+            uow: AsyncSession,
+            users_repo: UsersRepository,
+            jwt_authenticator: JWTAuthenticator,
+    ):
         self._config = config
         self._uow = uow
         self._users_repo = users_repo
+        self._jwt_authenticator = jwt_authenticator
 
-    async def register_user(self, name: str, nickname: str, password: str):
+    async def register_user(self, name: str, nickname: str, password: str) -> User:
         user = await self._users_repo.create_user(name, nickname, password)
         await self._uow.commit()
-        await self._uow.refresh(user)
+        return user
+
+    async def register_and_login_user(self, name: str, nickname: str, password: str) -> SuccessLoginResult:
+        """Issues the tokens for the just inserted user, without reading it back and checking the password again"""
+        user = await self.register_user(name, nickname, password)
+        return create_login_result(self._jwt_authenticator, user.id)
 
 
 class LoginService:
-    def __init__(self, config: Config, jwt_authenticator: JWTAuthenticator, users_repo: UsersRepository):
+    def __init__(
+            self,
+            config: Config,
+            jwt_authenticator: JWTAuthenticator,
+            users_repo: UsersRepository,
+            password_hasher: PasswordHasher,
+    ):
         self._config = config
         self._jwt_authenticator = jwt_authenticator
         self._users_repo = users_repo
+        self._password_hasher = password_hasher
 
     async def login_user(self, nickname: str, password: str) -> SuccessLoginResult:
         user = await self._users_repo.get_user(nickname)
         if not user:
             raise InvalidNicknameException()
-        if not user.check_password(self._config, password):
+        if not await user.check_password(self._password_hasher, password):
             raise IncorrectPasswordException()
-        access_token = self._jwt_authenticator.create_access_token(user.id)
-        refresh_token = self._jwt_authenticator.create_refresh_token(user.id)
-        return SuccessLoginResult(access_token=access_token, refresh_token=refresh_token)
+        return create_login_result(self._jwt_authenticator, user.id)
+
+
+class LogoutService:
+    def __init__(
+            self,
+            identity: Identity,
+            uow: AsyncSession,
+            revoked_tokens_repo: RevokedTokensRepository,
+            revoked_tokens_registry: RevokedTokensRegistry,
+    ):
+        self._identity = identity
+        self._uow = uow
+        self._revoked_tokens_repo = revoked_tokens_repo
+        self._revoked_tokens_registry = revoked_tokens_registry
+
+    async def logout_user(self):
+        """Revokes the presented token and the other token of the same login"""
+        revoked_tokens = [(self._identity.jti, self._identity.expired_at)]
+        if self._identity.linked_jti:
+            revoked_tokens.append((self._identity.linked_jti, self._identity.linked_expired_at))
+        async with self._uow.begin():
+            for jti, expired_at in revoked_tokens:
+                await self._revoked_tokens_repo.revoke_token(jti, expired_at)
+        # other workers pick the tokens up on their next sync
+        for jti, expired_at in revoked_tokens:
+            self._revoked_tokens_registry.add(jti, expired_at)
+
+
+class RevokedTokensSyncService:
+    """
+    Keeps the worker's RevokedTokensRegistry in sync with the revoked tokens table:
+    loads all the revoked tokens once, then periodically fetches only the recently revoked ones.
+    """
+
+    def __init__(
+            self,
+            config: Config,
+            revoked_tokens_registry: RevokedTokensRegistry,
+            revoked_tokens_repo_factory: Callable[[], AsyncContextManager[RevokedTokensRepository]],
+    ):
+        self._config = config
+        self._revoked_tokens_registry = revoked_tokens_registry
+        self._revoked_tokens_repo_factory = revoked_tokens_repo_factory
+        self._last_synced_at: Optional[datetime] = None
+
+    async def sync(self):
+        revoked_since = None
+        if self._last_synced_at:
+            # tokens revoked by transactions still running at the last sync are committed with earlier times
+            overlap = timedelta(seconds=self._config.JWT_REVOKED_TOKENS_SYNC_OVERLAP_SECONDS)
+            revoked_since = self._last_synced_at - overlap
+        synced_at = datetime.now()
+        async with self._revoked_tokens_repo_factory() as revoked_tokens_repo:
+            revoked_tokens = await revoked_tokens_repo.get_revoked_tokens(revoked_since)
+        for revoked_token in revoked_tokens:
+            self._revoked_tokens_registry.add(revoked_token.jti, revoked_token.expires_at)
+        # moved on after every successful load, even an empty one, so the next ones stay incremental
+        self._last_synced_at = synced_at
+        self._revoked_tokens_registry.remove_expired()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self._config.JWT_REVOKED_TOKENS_SYNC_INTERVAL_SECONDS)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Revoked tokens sync has failed")
@@ -0,0 +1,155 @@
+import functools
+import re
+import unicodedata
+
+from constants import PaymentTypeEnum
+from models.tickets import Ticket, TicketProduct
+
+# part of the rendered files identity (ETag), has to be bumped whenever the receipt layout changes
+RECEIPT_LAYOUT_VERSION = 1
+MAX_PRODUCT_NAME_LINES = 3
+ELLIPSIS = "…"
+ZERO_WIDTH_CATEGORIES = ("Mn", "Me", "Cf")
+DOUBLE_WIDTH_EAST_ASIAN_WIDTHS = ("W", "F")
+# Latin, Greek and Cyrillic letters (without combining marks), common punctuation and currency signs,
+# every one of them takes exactly one column, so such text doesn't need a per-character width lookup
+SINGLE_WIDTH_TEXT_PATTERN = re.compile(
+    "[\x20-\x7e\xa0-\xac\xae-\u02ff\u0370-\u0482\u048a-\u052f\u2010-\u2027\u2030-\u205e\u20a0-\u20c0\u2100-\u214f]*"
+)
+
+
+def get_display_width(text: str) -> int:
+    """Returns the number of columns the text takes: combining and format characters take none, wide ones take two"""
+    if text.isascii() or SINGLE_WIDTH_TEXT_PATTERN.fullmatch(text):
+        return len(text)
+    return sum(map(get_char_display_width, text))
+
+
+@functools.lru_cache(maxsize=4096)
+def get_char_display_width(char: str) -> int:
+    if unicodedata.category(char) in ZERO_WIDTH_CATEGORIES:
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in DOUBLE_WIDTH_EAST_ASIAN_WIDTHS else 1
+
+
+def split_by_width(text: str, width: int) -> list[str]:
+    """Splits the text into chunks that take at most "width" columns each (at least one character per chunk)"""
+    chunks, chunk, chunk_width = [], "", 0
+    for char in text:
+        char_width = get_char_display_width(char)
+        if chunk and chunk_width + char_width > width:
+            chunks.append(chunk)
+            chunk, chunk_width = "", 0
+        chunk += char
+        chunk_width += char_width
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def wrap_text(text: str, width: int) -> list[str]:
+    """Greedily wraps the text by words, words that don't fit into a line on their own are split"""
+    lines, line, line_width = [], "", 0
+    for word in text.split():
+        word_width = get_display_width(word)
+        if line and line_width + 1 + word_width <= width:
+            line, line_width = f"{line} {word}", line_width + 1 + word_width
+            continue
+        if line:
+            lines.append(line)
+        if word_width <= width:
+            line, line_width = word, word_width
+            continue
+        *word_lines, line = split_by_width(word, width)
+        lines.extend(word_lines)
+        line_width = get_display_width(line)
+    if line:
+        lines.append(line)
+    return lines
+
+
+def truncate_text(text: str, width: int) -> str:
+    """Cuts the text to fit into "width" columns together with the trailing ellipsis"""
+    if get_display_width(text) + get_display_width(ELLIPSIS) <= width:
+        return f"{text}{ELLIPSIS}"
+    chunks = split_by_width(text, max(width - get_display_width(ELLIPSIS), 1))
+    return f"{chunks[0]}{ELLIPSIS}"
+
+
+class ReceiptRenderer:
+    """
+    Renders the ticket as a plain text receipt "max_symbols" columns wide.
+    Layout parts that only depend on the width are built once per renderer, the receipt itself in a single pass.
+    """
+
+    def __init__(self, max_symbols: int):
+        self._max_symbols = max_symbols
+        self._separator_row = f"{'=' * max_symbols}\n"
+        self._products_separator_row = f"{'-' * max_symbols}\n"
+        self._thanks_row = self._format_center_row("Дякуємо за покупку!")
+
+    def render(self, ticket: Ticket) -> bytes:
+        payment_type_display_name = PaymentTypeEnum.get_display_name(ticket.payment_type)
+        rows = [self._format_center_row(f"ФОП {ticket.user.name}"), self._separator_row]
+        for product_index, product in enumerate(ticket.ticket_products):
+            if product_index:
+                rows.append(self._products_separator_row)
+            rows.append(self._get_product_rows(product))
+        rows.extend((
+            self._separator_row,
+            self._format_left_row("СУМА:", f"{ticket.total:.2f}"),
+            self._format_left_row(f"{payment_type_display_name}:", f"{ticket.payment_amount:.2f}"),
+            self._format_left_row("Решта:", f"{ticket.payment_amount - ticket.total:.2f}"),
+            self._separator_row,
+            self._format_center_row(ticket.created_at.strftime("%d.%m.%Y %H:%M")),
+            self._thanks_row,
+        ))
+        return "".join(rows).encode("utf-8")
+
+    def get_min_size(self, ticket: Ticket) -> int:
+        """
+        Returns the least number of bytes the rendered receipt takes, without rendering it: every row is at least
+        "max_symbols" columns wide and every column takes at least a byte, every product takes at least two rows
+        """
+        products_count = len(ticket.ticket_products)
+        products_rows_count = 3 * products_count - 1 if products_count else 0
+        # the header, 2 separators around the products, 3 amounts, a separator, the date and the thanks rows
+        rows_count = products_rows_count + 9
+        return rows_count * (self._max_symbols + 1)
+
+    def _get_product_rows(self, product: TicketProduct) -> str:
+        # amounts consist of ASCII digits, dots and signs only, so their width is their length
+        total_calculation = f"{product.quantity:.2f} x {product.price:.2f}"
+        total = f"{product.quantity * product.price:.2f}"
+        total_calculation_row = f"{total_calculation}{' ' * (self._max_symbols - len(total_calculation))}\n"
+        name = product.name or ""
+        name_width = get_display_width(name)
+        if name_width + len(total) <= self._max_symbols:
+            return f"{total_calculation_row}{name}{' ' * (self._max_symbols - name_width - len(total))}{total}\n"
+        name_lines = wrap_text(name, self._max_symbols)
+        if len(name_lines) > MAX_PRODUCT_NAME_LINES:
+            name_lines = name_lines[:MAX_PRODUCT_NAME_LINES]
+            name_lines[-1] = truncate_text(name_lines[-1], self._max_symbols)
+        rows = [total_calculation_row]
+        rows.extend(self._format_left_row(name_line) for name_line in name_lines[:-1])
+        last_name_line = name_lines[-1] if name_lines else ""
+        if get_display_width(last_name_line) + 1 + len(total) <= self._max_symbols:
+            rows.append(self._format_left_row(last_name_line, total))
+        else:
+            rows.extend((self._format_left_row(last_name_line), self._format_left_row("", total)))
+        return "".join(rows)
+
+    def _format_left_row(self, left: str, right: str = "") -> str:
+        padding = self._max_symbols - get_display_width(left) - get_display_width(right)
+        return f"{left}{' ' * padding}{right}\n"
+
+    def _format_center_row(self, text: str) -> str:
+        total_space = self._max_symbols - get_display_width(text)
+        left_padding = total_space // 2
+        right_padding = total_space - left_padding
+        return f"{' ' * left_padding}{text}{' ' * right_padding}\n"
+
+
+@functools.lru_cache(maxsize=64)
+def get_receipt_renderer(max_symbols: int) -> ReceiptRenderer:
+    return ReceiptRenderer(max_symbols)
@@ -1,139 +1,414 @@
+import functools
 import io
-from typing import Optional
+from datetime import datetime
+from collections import defaultdict
+from typing import AsyncContextManager, AsyncIterator, Callable, Optional, Union
 
 from fastapi_filter.contrib.sqlalchemy import Filter
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from adapters.auth import IdentityProviderABC
+from adapters.archives import stream_zip
+from adapters.background import BackgroundJobsQueue
+from adapters.cache import RecentWritesCache, TicketsCountCache
+from adapters.exports import stream_csv, stream_ndjson
 from adapters.files_storage import FilesStorage
 from adapters.pagination import BasePaginator
 from adapters.repositories.tickets import TicketsRepository, TicketProductsRepository
 from config import Config
-from constants import PaymentTypeEnum
-from dto import TicketCreationData
-from models.tickets import Ticket, TicketProduct
+from constants import (
+    TICKET_FILE_CONTENT_TYPE,
+    TICKETS_EXPORT_CHUNK_SIZE,
+    TICKETS_EXPORT_FIELDS,
+    TicketsExportFormatEnum,
+)
+from dto import Identity, TicketCreationData, TicketFile
+from models.tickets import Ticket, TicketProduct, TicketDailyAggregate
 from services.exceptions.tickets import TicketNotFoundException, IncorrectTicketAmountException
+from services.receipts import RECEIPT_LAYOUT_VERSION, get_receipt_renderer
 
 
 class CreateTicketService:
     def __init__(
             self,
-            identity_provider: IdentityProviderABC,
+            identity: Identity,
             uow: AsyncSession,
             tickets_repo: TicketsRepository,
             ticket_products_repo: TicketProductsRepository,
+            prerender_ticket_files_service: "PrerenderTicketFilesService",
+            tickets_count_cache: TicketsCountCache,
+            recent_writes_cache: RecentWritesCache,
     ):
-        self._identity_provider = identity_provider
+        self._identity = identity
         self._uow = uow
         self._tickets_repo = tickets_repo
         self._ticket_products_repo = ticket_products_repo
+        self._prerender_ticket_files_service = prerender_ticket_files_service
+        self._tickets_count_cache = tickets_count_cache
+        self._recent_writes_cache = recent_writes_cache
 
     async def create_ticket(self, ticket_data: TicketCreationData) -> tuple[Ticket, list[TicketProduct]]:
-        user_id = await self._identity_provider.provide_user_id()
-        ticket_products_total = sum(
-            ticket_product.price * ticket_product.quantity for ticket_product in ticket_data.products
-        )
-        if ticket_products_total > ticket_data.payment.amount:
-            raise IncorrectTicketAmountException()
+        user_id = self._identity.user_id
+        self._check_ticket_amount(ticket_data)
         async with self._uow.begin():
-            ticket = await self._tickets_repo.create_ticket(user_id, ticket_data)
-            await self._uow.flush(ticket)
-            ticket_products = await self._ticket_products_repo.create_ticket_products(ticket.id, ticket_data.products)
-            await self._uow.commit()
-        await self._uow.refresh(ticket)
+            ticket, ticket_products = await self._tickets_repo.create_ticket(user_id, ticket_data)
+        self._tickets_count_cache.invalidate(user_id)
+        self._recent_writes_cache.add(user_id)
+        self._prerender_ticket_files_service.schedule([ticket.id])
         return ticket, ticket_products
 
+    async def create_tickets(
+            self,
+            tickets_data: list[TicketCreationData],
+    ) -> list[Union[tuple[Ticket, list[TicketProduct]], IncorrectTicketAmountException]]:
+        """
+        Creates all the valid tickets in one transaction with multi-row INSERT statements.
+        Returns a result per given ticket in the same order: either created ticket with its products or the error.
+        """
+        user_id = self._identity.user_id
+        results: list = [None] * len(tickets_data)
+        valid_tickets_indexes = []
+        for index, ticket_data in enumerate(tickets_data):
+            try:
+                self._check_ticket_amount(ticket_data)
+            except IncorrectTicketAmountException as e:
+                results[index] = e
+            else:
+                valid_tickets_indexes.append(index)
+        if not valid_tickets_indexes:
+            return results
+        async with self._uow.begin():
+            tickets = await self._tickets_repo.create_tickets(
+                user_id,
+                [tickets_data[index] for index in valid_tickets_indexes],
+            )
+            ticket_products = await self._ticket_products_repo.create_tickets_products(
+                [(ticket, tickets_data[index].products) for ticket, index in zip(tickets, valid_tickets_indexes)]
+            )
+            await self._tickets_repo.add_tickets_to_daily_aggregates(tickets)
+        self._tickets_count_cache.invalidate(user_id)
+        self._recent_writes_cache.add(user_id)
+        self._prerender_ticket_files_service.schedule([ticket.id for ticket in tickets])
+        products_by_ticket_id = defaultdict(list)
+        for ticket_product in ticket_products:
+            products_by_ticket_id[ticket_product.ticket_id].append(ticket_product)
+        for ticket, index in zip(tickets, valid_tickets_indexes):
+            results[index] = (ticket, products_by_ticket_id[ticket.id])
+        return results
+
+    def _check_ticket_amount(self, ticket_data: TicketCreationData):
+        if ticket_data.products_total > ticket_data.payment.amount:
+            raise IncorrectTicketAmountException()
+
 
 class RetrieveTicketsService:
-    def __init__(self, identity_provider: IdentityProviderABC, tickets_repo: TicketsRepository):
-        self._identity_provider = identity_provider
+    """
+    Reads the tickets from the replica when it's configured, except for the users who have created tickets recently,
+    those are read from the primary, as the replica could lag behind.
+    """
+
+    def __init__(
+            self,
+            config: Config,
+            identity: Identity,
+            tickets_repo: TicketsRepository,
+            replica_tickets_repo: Optional[TicketsRepository],
+            tickets_count_cache: TicketsCountCache,
+            recent_writes_cache: RecentWritesCache,
+    ):
+        self._config = config
+        self._identity = identity
         self._tickets_repo = tickets_repo
+        self._replica_tickets_repo = replica_tickets_repo
+        self._tickets_count_cache = tickets_count_cache
+        self._recent_writes_cache = recent_writes_cache
 
     async def get_one_ticket(self, ticket_id: int) -> Ticket:
-        user_id = await self._identity_provider.provide_user_id()
-        ticket = await self._tickets_repo.get_one_ticket(ticket_id, user_id)
+        user_id = self._identity.user_id
+        tickets_repo = self._get_reading_tickets_repo(user_id)
+        ticket = await tickets_repo.get_one_ticket(ticket_id, user_id)
+        if not ticket and tickets_repo is not self._tickets_repo:
+            # could be created on another worker and not be replicated yet
+            ticket = await self._tickets_repo.get_one_ticket(ticket_id, user_id)
         if not ticket:
             raise TicketNotFoundException()
         return ticket
 
-    async def get_many_tickets(
+    async def get_many_tickets_rows(
+            self,
+            tickets_filter: Optional[Filter] = None,
+            paginator: Optional[BasePaginator] = None,
+    ) -> tuple[list[Row], dict[int, list[Row]]]:
+        """Returns the tickets rows and their products rows grouped by the tickets IDs, see TicketsRepository"""
+        offset, limit = self._get_offset_limit(paginator)
+        keyset_pagination, keyset = self._get_keyset(paginator)
+        user_id = self._identity.user_id
+        return await self._get_reading_tickets_repo(user_id).get_many_tickets_rows(
+            user_id,
+            tickets_filter,
+            offset,
+            limit,
+            keyset_pagination=keyset_pagination,
+            keyset=keyset,
+        )
+
+    def is_database_json_enabled(self) -> bool:
+        """Whether the tickets are read already serialized by the database, see TicketsRepository"""
+        return self._config.TICKETS_DATABASE_JSON_ENABLED
+
+    async def get_one_ticket_json(self, ticket_id: int) -> str:
+        user_id = self._identity.user_id
+        tickets_repo = self._get_reading_tickets_repo(user_id)
+        ticket_json = await tickets_repo.get_one_ticket_json(ticket_id, user_id)
+        if ticket_json is None and tickets_repo is not self._tickets_repo:
+            ticket_json = await self._tickets_repo.get_one_ticket_json(ticket_id, user_id)
+        if ticket_json is None:
+            raise TicketNotFoundException()
+        return ticket_json
+
+    async def get_many_tickets_json(
             self,
             tickets_filter: Optional[Filter] = None,
             paginator: Optional[BasePaginator] = None,
-    ) -> list[Ticket]:
+    ) -> list[Row]:
+        """Returns the rows of the tickets IDs, creation times and JSONs, see TicketsRepository"""
         offset, limit = self._get_offset_limit(paginator)
-        user_id = await self._identity_provider.provide_user_id()
-        return await self._tickets_repo.get_many_tickets(user_id, tickets_filter, offset, limit)
+        keyset_pagination, keyset = self._get_keyset(paginator)
+        user_id = self._identity.user_id
+        return await self._get_reading_tickets_repo(user_id).get_many_tickets_json(
+            user_id,
+            tickets_filter,
+            offset,
+            limit,
+            keyset_pagination=keyset_pagination,
+            keyset=keyset,
+        )
+
+    async def get_tickets_count(self, tickets_filter: Optional[Filter] = None) -> tuple[int, bool]:
+        """
+        Returns the number of the tickets and whether it's approximate: up to the threshold tickets are counted exactly
+        on every call, above it the count is estimated by the query planner and cached until the user creates new tickets.
+        The cache is per worker and could be stale, so only the approximate counts are taken from it.
+        """
+        user_id = self._identity.user_id
+        tickets_repo = self._get_reading_tickets_repo(user_id)
+        threshold = self._config.TICKETS_EXACT_COUNT_THRESHOLD
+        tickets_count = await tickets_repo.count_many_tickets(user_id, tickets_filter, limit=threshold + 1)
+        if tickets_count <= threshold:
+            return tickets_count, False
+        filter_key = tickets_filter.model_dump_json() if tickets_filter else None
+        if (cached_tickets_count := self._tickets_count_cache.get(user_id, filter_key)) is not None:
+            return max(cached_tickets_count, tickets_count), True
+        # the planner could underestimate, but there are more tickets than the threshold for sure
+        estimated_tickets_count = await tickets_repo.estimate_many_tickets_count(user_id, tickets_filter)
+        tickets_count = max(estimated_tickets_count, tickets_count)
+        self._tickets_count_cache.set(user_id, filter_key, tickets_count)
+        return tickets_count, True
+
+    async def get_daily_aggregates(
+            self,
+            daily_aggregates_filter: Optional[Filter] = None,
+    ) -> list[TicketDailyAggregate]:
+        user_id = self._identity.user_id
+        return await self._get_reading_tickets_repo(user_id).get_daily_aggregates(user_id, daily_aggregates_filter)
+
+    def _get_reading_tickets_repo(self, user_id: int) -> TicketsRepository:
+        if self._replica_tickets_repo is None or self._recent_writes_cache.has_recent_writes(user_id):
+            return self._tickets_repo
+        return self._replica_tickets_repo
 
     def _get_offset_limit(self, paginator: Optional[BasePaginator]) -> tuple[Optional[int], Optional[int]]:
         if paginator:
             return paginator.get_offset_limit()
         return None, None
 
+    def _get_keyset(self, paginator: Optional[BasePaginator]) -> tuple[bool, Optional[tuple[datetime, int]]]:
+        if paginator and paginator.is_cursor_mode:
+            return True, paginator.get_keyset()
+        return False, None
+
 
 class DownloadTicketService:
-    def __init__(self, config: Config, tickets_repo: TicketsRepository, files_storage: FilesStorage):
+    def __init__(
+            self,
+            config: Config,
+            tickets_repo: TicketsRepository,
+            files_storage: FilesStorage,
+            replica_tickets_repo: Optional[TicketsRepository] = None,
+    ):
         self._config = config
         self._tickets_repo = tickets_repo
         self._files_storage = files_storage
+        self._replica_tickets_repo = replica_tickets_repo
 
     async def get_download_url(self, ticket_id: int, max_symbols: int) -> str:
-        ticket = await self._tickets_repo.get_one_ticket(ticket_id)
+        ticket = await self._get_ticket(ticket_id)
         if not ticket:
             raise TicketNotFoundException()
         return await self._save_ticket_file(ticket, max_symbols)
 
-    async def _save_ticket_file(self, ticket: Ticket, max_symbols: int) -> str:
-        bucket_name = self._config.TICKET_FILES_BUCKET_NAME
-        filename = f"{ticket.id}_{max_symbols}.txt"
-        if await self._files_storage.check_object_exists(bucket_name, filename):
-            return await self._files_storage.get_object_link(bucket_name, filename)
+    async def get_ticket_file(self, ticket_id: int, max_symbols: int) -> Union[TicketFile, str]:
+        """
+        Returns the rendered file itself when streaming is enabled and the file is small enough,
+        otherwise the link to download it from the files storage.
+        """
+        if not self.is_streaming_enabled():
+            return await self.get_download_url(ticket_id, max_symbols)
+        ticket = await self._get_ticket(ticket_id)
+        if not ticket:
+            raise TicketNotFoundException()
+        max_size = self._config.TICKET_FILES_STREAMING_MAX_SIZE
+        if get_receipt_renderer(max_symbols).get_min_size(ticket) > max_size:
+            # surely won't be streamed, so the stored file is looked up before the receipt is rendered
+            return await self._save_ticket_file(ticket, max_symbols)
         generated_data = self._get_ticket_generated_info(ticket, max_symbols)
+        if len(generated_data) > max_size:
+            return await self._save_ticket_file(ticket, max_symbols, generated_data)
+        return TicketFile(content=generated_data, etag=self.get_ticket_file_etag(ticket_id, max_symbols))
+
+    def is_streaming_enabled(self) -> bool:
+        """Whether the small files are returned directly along with their ETags, see get_ticket_file"""
+        return self._config.TICKET_FILES_STREAMING_ENABLED
+
+    async def check_ticket_exists(self, ticket_id: int):
+        """Cheaper than loading the ticket, for the requests answered without its file"""
+        if self._replica_tickets_repo is not None:
+            if await self._replica_tickets_repo.check_ticket_exists(ticket_id):
+                return
+        if not await self._tickets_repo.check_ticket_exists(ticket_id):
+            raise TicketNotFoundException()
+
+    def get_ticket_file_etag(self, ticket_id: int, max_symbols: int) -> str:
+        # tickets aren't changed after creation, so the file is identified by the rendering arguments only
+        return f'"{ticket_id}-{max_symbols}-{RECEIPT_LAYOUT_VERSION}"'
+
+    async def prerender_ticket_files(self, ticket_id: int, widths: list[int]):
+        ticket = await self._tickets_repo.get_one_ticket(ticket_id)
+        if not ticket:
+            return
+        for max_symbols in widths:
+            await self._upload_ticket_file(ticket, max_symbols, self._get_ticket_generated_info(ticket, max_symbols))
+
+    async def _get_ticket(self, ticket_id: int) -> Optional[Ticket]:
+        """From the replica when it's configured, falls back to the primary for the tickets not replicated yet"""
+        if self._replica_tickets_repo is not None:
+            if ticket := await self._replica_tickets_repo.get_one_ticket(ticket_id):
+                return ticket
+        return await self._tickets_repo.get_one_ticket(ticket_id)
+
+    async def _save_ticket_file(self, ticket: Ticket, max_symbols: int, generated_data: Optional[bytes] = None) -> str:
+        bucket_name = self._config.TICKET_FILES_BUCKET_NAME
+        filename = self._get_ticket_filename(ticket, max_symbols)
+        if link := await self._files_storage.get_existing_object_link(bucket_name, filename, TICKET_FILE_CONTENT_TYPE):
+            return link
+        if generated_data is None:
+            generated_data = self._get_ticket_generated_info(ticket, max_symbols)
+        return await self._upload_ticket_file(ticket, max_symbols, generated_data)
+
+    async def _upload_ticket_file(self, ticket: Ticket, max_symbols: int, generated_data: bytes) -> str:
         data_length = len(generated_data)
         file = io.BytesIO(generated_data)
         return await self._files_storage.put_object(
-            bucket_name=bucket_name,
-            object_name=filename,
+            bucket_name=self._config.TICKET_FILES_BUCKET_NAME,
+            object_name=self._get_ticket_filename(ticket, max_symbols),
             data=file,
             length=data_length,
-            content_type="text/plain; charset=utf-8",
+            content_type=TICKET_FILE_CONTENT_TYPE,
         )
 
     def _get_ticket_generated_info(self, ticket: Ticket, max_symbols: int) -> bytes:
-        separator = "=" * max_symbols
-        products_separator = "-" * max_symbols
-        payment_type_display_name = PaymentTypeEnum.get_display_name(ticket.payment_type)
-
-        def format_row(left: str, right: str = "", align: str = "left") -> str:
-            if align == "left":
-                return f"{left:<{max_symbols - len(right)}}{right:>{len(right)}}"
-            elif align == "center":
-                total_space = max_symbols - len(left)
-                left_pad = total_space // 2
-                right_pad = total_space - left_pad
-                return f"{' ' * left_pad}{left}{' ' * right_pad}"
-            return ""
-
-        data = f"{format_row(f'ФОП {ticket.user.name}', align='center')}\n"
-        data += f"{separator}\n"
-
-        for product_index, product in enumerate(ticket.ticket_products, 1):
-            total_calculation = f"{product.quantity:.2f} x {product.price:.2f}"
-            total = f"{product.quantity * product.price:.2f}"
-            data += f"{format_row(total_calculation, align='left')}\n"
-            data += f"{format_row(product.name, total, align='left')}\n"
-            if product_index != len(ticket.ticket_products):
-                data += f"{products_separator}\n"
-
-        data += f"{separator}\n"
-        data += f"{format_row('СУМА:', f'{ticket.total:.2f}', align='left')}\n"
-        data += f"{format_row(f'{payment_type_display_name}:', f'{ticket.payment_amount:.2f}', align='left')}\n"
-        data += f"{format_row('Решта:', f'{ticket.payment_amount - ticket.total:.2f}', align='left')}\n"
-        data += f"{separator}\n"
-
-        data += f"{format_row(ticket.created_at.strftime('%d.%m.%Y %H:%M'), align='center')}\n"
-        data += f"{format_row('Дякуємо за покупку!', align='center')}\n"
-
-        return data.encode("utf-8")
+        return get_receipt_renderer(max_symbols).render(ticket)
+
+    def _get_ticket_filename(self, ticket: Ticket, max_symbols: int) -> str:
+        return f"{ticket.id}_{max_symbols}.txt"
+
+
+class PrerenderTicketFilesService:
+    """
+    Schedules rendering and uploading of the new tickets files for the common widths, so they're ready by the first
+    download. Runs in the background jobs queue with its own db session, after the tickets are committed.
+    """
+
+    def __init__(
+            self,
+            config: Config,
+            background_jobs_queue: BackgroundJobsQueue,
+            download_ticket_service_factory: Callable[[], AsyncContextManager[DownloadTicketService]],
+    ):
+        self._config = config
+        self._background_jobs_queue = background_jobs_queue
+        self._download_ticket_service_factory = download_ticket_service_factory
+
+    def schedule(self, ticket_ids: list[int]):
+        widths = self._config.ticket_files_prerender_widths
+        if ticket_ids and widths:
+            self._background_jobs_queue.put_nowait(functools.partial(self._prerender, ticket_ids, widths))
 
+    async def _prerender(self, ticket_ids: list[int], widths: list[int]):
+        async with self._download_ticket_service_factory() as download_ticket_service:
+            for ticket_id in ticket_ids:
+                await download_ticket_service.prerender_ticket_files(ticket_id, widths)
+
+
+class ExportTicketsService:
+    def __init__(self, identity: Identity, uow: AsyncSession, tickets_repo: TicketsRepository):
+        self._identity = identity
+        self._uow = uow
+        self._tickets_repo = tickets_repo
 
+    async def export_tickets(self, tickets_filter: Optional[Filter], max_symbols: int) -> AsyncIterator[bytes]:
+        """
+        Returns the ZIP archive of the rendered user tickets as an iterator of its parts.
+        The tickets are read with a server-side cursor while the archive is consumed, the session is closed at the end.
+        """
+        user_id = self._identity.user_id
+        return self._stream_tickets_archive(user_id, tickets_filter, max_symbols)
+
+    async def export_tickets_rows(
+            self,
+            tickets_filter: Optional[Filter],
+            export_format: TicketsExportFormatEnum,
+    ) -> AsyncIterator[bytes]:
+        """
+        Returns the user tickets as NDJSON or CSV rows, a row per ticket product, as an iterator of chunks.
+        The rows are read with a server-side cursor while the chunks are consumed, the session is closed at the end.
+        """
+        user_id = self._identity.user_id
+        return self._stream_tickets_rows(user_id, tickets_filter, export_format)
+
+    async def _stream_tickets_rows(
+            self,
+            user_id: int,
+            tickets_filter: Optional[Filter],
+            export_format: TicketsExportFormatEnum,
+    ) -> AsyncIterator[bytes]:
+        stream_rows = stream_csv if export_format is TicketsExportFormatEnum.csv else stream_ndjson
+        tickets_rows = self._tickets_repo.stream_many_tickets_export_rows(user_id, tickets_filter)
+        try:
+            async for chunk in stream_rows(TICKETS_EXPORT_FIELDS, tickets_rows, TICKETS_EXPORT_CHUNK_SIZE):
+                yield chunk
+        finally:
+            await self._uow.close()
+
+    async def _stream_tickets_archive(
+            self,
+            user_id: int,
+            tickets_filter: Optional[Filter],
+            max_symbols: int,
+    ) -> AsyncIterator[bytes]:
+        try:
+            async for archive_part in stream_zip(self._iter_ticket_files(user_id, tickets_filter, max_symbols)):
+                yield archive_part
+        finally:
+            await self._uow.close()
+
+    async def _iter_ticket_files(
+            self,
+            user_id: int,
+            tickets_filter: Optional[Filter],
+            max_symbols: int,
+    ) -> AsyncIterator[tuple[str, datetime, bytes]]:
+        receipt_renderer = get_receipt_renderer(max_symbols)
+        async for ticket in self._tickets_repo.stream_many_tickets(user_id, tickets_filter):
+            filename = f"{ticket.created_at:%Y-%m-%d}_{ticket.id}.txt"
+            yield filename, ticket.created_at, receipt_renderer.render(ticket)
@@ -1,10 +1,16 @@
-from typing import Callable
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
 
 import pytest_asyncio
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
+from adapters.files_storage import FilesStorage
+from adapters.repositories.base import create_repository
+from adapters.repositories.tickets import TicketsRepository
 from config import Config
-from dependencies import DependenciesOverrides
+from dependencies import DependenciesOverrides, Stub
+from models import Ticket
+from services.tickets import DownloadTicketService
 from main import create_application
 
 __all__ = ["app", "dependencies_override_factory"]
@@ -17,9 +23,22 @@ class TestsDependenciesOverrides(DependenciesOverrides):
 
     def overridden_dependencies(self) -> dict:
         origin_dependencies = super().overridden_dependencies()
+        origin_dependencies[AsyncEngine] = lambda: self.db_session.bind.engine
+        origin_dependencies[Stub(AsyncEngine, replica=True)] = lambda: None
         origin_dependencies[AsyncSession] = lambda: self.db_session
+        origin_dependencies[Stub(AsyncSession, streaming=True)] = lambda: self.db_session
+        origin_dependencies[Stub(AsyncSession, replica=True)] = lambda: self.db_session
         return origin_dependencies
 
+    @asynccontextmanager
+    async def background_download_ticket_service(
+            self,
+            config: Config,
+            files_storage: FilesStorage,
+    ) -> AsyncIterator[DownloadTicketService]:
+        tickets_repo = TicketsRepository(config, create_repository(Ticket, self.db_session))
+        yield DownloadTicketService(config, tickets_repo, files_storage)
+
 
 @pytest_asyncio.fixture()
 def dependencies_override_factory(config: Config, fake_db_session: AsyncSession):
@@ -1,11 +1,20 @@
 import pytest_asyncio
 
 from adapters.auth import JWTAuthenticator
+from adapters.passwords import PasswordHasher
+from adapters.revocation import RevokedTokensRegistry
 from config import Config
 
-__all__ = ["jwt_authenticator"]
+__all__ = ["jwt_authenticator", "password_hasher"]
 
 
 @pytest_asyncio.fixture(scope="session")
 async def jwt_authenticator(config: Config) -> str:
-    yield JWTAuthenticator(config)
+    yield JWTAuthenticator(config, RevokedTokensRegistry())
+
+
+@pytest_asyncio.fixture(scope="session")
+async def password_hasher(config: Config) -> PasswordHasher:
+    password_hasher = PasswordHasher(config)
+    yield password_hasher
+    password_hasher.shutdown()
@@ -1,8 +1,9 @@
 import pytest_asyncio
 from sqlalchemy import event
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
+from adapters.database import create_db_engine
 from config import Config
 
 __all__ = ["fake_db_session"]
@@ -21,10 +22,10 @@ class FakeTransactionBegin:
 
 @pytest_asyncio.fixture()
 async def fake_db_session(config: Config):
-    connection = await create_async_engine(config.DATABASE_URL).connect()
+    connection = await create_db_engine(config).connect()
     transaction = await connection.begin()
     db_sessionmaker = sessionmaker(
-        create_async_engine(config.DATABASE_URL),
+        create_db_engine(config),
         autoflush=False,
         expire_on_commit=False,
         class_=AsyncSession,
@@ -27,7 +27,6 @@ async def ticket_products_repo(config: Config, fake_db_session: AsyncSession) ->
 async def create_ticket(
         fake_db_session: AsyncSession,
         tickets_repo: TicketsRepository,
-        ticket_products_repo: TicketProductsRepository,
 ) -> Callable[[int, Optional[TicketCreationData]], Ticket]:
 
     async def _create_ticket(user_id: int, ticket_creation_data: Optional[TicketCreationData] = None) -> Ticket:
@@ -45,9 +44,7 @@ async def create_ticket(
                     )
                 ],
             )
-        ticket = await tickets_repo.create_ticket(user_id, ticket_creation_data)
-        await fake_db_session.flush(ticket)
-        await ticket_products_repo.create_ticket_products(ticket.id, ticket_creation_data.products)
+        ticket, _ = await tickets_repo.create_ticket(user_id, ticket_creation_data)
         await fake_db_session.commit()
         ticket = await tickets_repo.get_one_ticket(ticket.id, user_id)
         return ticket
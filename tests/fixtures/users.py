@@ -3,6 +3,7 @@ from typing import Callable
 import pytest_asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from adapters.passwords import PasswordHasher
 from adapters.repositories.base import create_repository
 from adapters.repositories.users import UsersRepository
 from config import Config
@@ -12,8 +13,12 @@ __all__ = ["users_repo", "create_user"]
 
 
 @pytest_asyncio.fixture()
-async def users_repo(config: Config, fake_db_session: AsyncSession) -> UsersRepository:
-    yield UsersRepository(config, create_repository(User, fake_db_session))
+async def users_repo(
+        config: Config,
+        fake_db_session: AsyncSession,
+        password_hasher: PasswordHasher,
+) -> UsersRepository:
+    yield UsersRepository(config, create_repository(User, fake_db_session), password_hasher)
 
 
 @pytest_asyncio.fixture()
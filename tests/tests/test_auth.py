@@ -1,11 +1,24 @@
-from typing import Callable
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Optional
 
 import pytest
 from fastapi import FastAPI
 from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
+from adapters.auth import JWTAuthenticator
+from adapters.exceptions.passwords import PasswordHasherOverloadedException
+from adapters.passwords import PasswordHasher
+from adapters.repositories.base import create_repository
+from adapters.repositories.tokens import RevokedTokensRepository
+from adapters.revocation import RevokedTokensRegistry
+from config import Config
 from dto import SuccessLoginResult
+from models import RevokedToken
+from services.auth import RevokedTokensSyncService
 
 
 @pytest.mark.asyncio
@@ -16,6 +29,20 @@ async def test_registration(app: FastAPI):
     assert response.json() == {"success": True}
 
 
+@pytest.mark.asyncio
+async def test_registration_with_login(app: FastAPI):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/v1/register",
+            params={"login": True},
+            json={"name": "str", "nickname": "str", "password": "str"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        login_result = SuccessLoginResult.model_validate(response.json())
+        response = await ac.get("/api/v1/tickets", headers={"Authorization": login_result.access_token})
+    assert response.status_code == status.HTTP_200_OK
+
+
 @pytest.mark.asyncio
 async def test_login(app: FastAPI, create_user: Callable):
     await create_user(name="str", nickname="str", password="str")
@@ -39,3 +66,172 @@ async def test_login_incorrect_password(app: FastAPI, create_user: Callable):
     async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
         response = await ac.post("/api/v1/login", json={"nickname": "str", "password": "str1"})
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_rejects_when_overloaded(config: Config):
+    password_hasher = PasswordHasher(
+        config.model_copy(update={"PASSWORD_HASHER_WORKERS_COUNT": 1, "PASSWORD_HASHER_MAX_PENDING": 1}),
+    )
+    results = await asyncio.gather(*(password_hasher.hash("str") for _ in range(3)), return_exceptions=True)
+    password_hasher.shutdown()
+    assert sum(isinstance(result, PasswordHasherOverloadedException) for result in results) == 1
+    assert password_hasher.get_stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_counts_cancelled_calls_until_done(config: Config):
+    password_hasher = PasswordHasher(
+        config.model_copy(update={"PASSWORD_HASHER_WORKERS_COUNT": 1, "PASSWORD_HASHER_MAX_PENDING": 0}),
+    )
+    hashing = asyncio.create_task(password_hasher.hash("str"))
+    await asyncio.sleep(0.01)
+    hashing.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await hashing
+    with pytest.raises(PasswordHasherOverloadedException):
+        await password_hasher.verify("str", "str")
+    assert password_hasher.get_stats()["busy_workers"] == 1
+    while password_hasher.get_stats()["busy_workers"]:
+        await asyncio.sleep(0.01)
+    with pytest.raises(ValueError):
+        await password_hasher.verify("str", "str")
+    password_hasher.shutdown()
+    assert password_hasher.get_stats()["completed"] == 1
+    assert password_hasher.get_stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_validate_token_cache(config: Config):
+    jwt_authenticator = JWTAuthenticator(config, RevokedTokensRegistry())
+    _, token = jwt_authenticator.create_access_token(1).split()
+    assert await jwt_authenticator.validate_token(token) == 1
+    assert await jwt_authenticator.validate_token(token) == 1
+    stats = jwt_authenticator.get_tokens_cache_stats()
+    assert stats["size"] == 1
+    assert stats["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_identity_resolved_once_per_request(app: FastAPI, create_user: Callable):
+    user = await create_user(name="str", nickname="str", password="str")
+    jwt_authenticator = await app.dependency_overrides[JWTAuthenticator]()
+    access_token = jwt_authenticator.create_access_token(user.id)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        # both the count and the page of the tickets are read for the user
+        response = await ac.get(
+            "/api/v1/tickets",
+            headers={"Authorization": access_token},
+            params={"include_total": True},
+        )
+    assert response.status_code == status.HTTP_200_OK
+    stats = jwt_authenticator.get_tokens_cache_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 0
+
+
+@pytest.mark.asyncio
+async def test_logout(app: FastAPI, create_user: Callable):
+    await create_user(name="str", nickname="str", password="str")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/api/v1/login", json={"nickname": "str", "password": "str"})
+        access_token = response.json()["access_token"]
+        response = await ac.post("/api/v1/logout", headers={"Authorization": access_token})
+        assert response.status_code == status.HTTP_200_OK
+        response = await ac.get("/api/v1/tickets", headers={"Authorization": access_token})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.json() == {"detail": "Token is revoked"}
+
+
+@pytest.mark.asyncio
+async def test_logout_revokes_tokens_of_the_same_login(app: FastAPI, create_user: Callable):
+    await create_user(name="str", nickname="str", password="str")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/api/v1/login", json={"nickname": "str", "password": "str"})
+        refresh_token = response.json()["refresh_token"]
+        response = await ac.post("/api/v1/logout", headers={"Authorization": response.json()["access_token"]})
+        assert response.status_code == status.HTTP_200_OK
+        response = await ac.get("/api/v1/tickets", headers={"Authorization": refresh_token})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response.json() == {"detail": "Token is revoked"}
+        # and the other way round, the other logins stay valid
+        response = await ac.post("/api/v1/login", json={"nickname": "str", "password": "str"})
+        access_token, refresh_token = response.json()["access_token"], response.json()["refresh_token"]
+        response = await ac.post("/api/v1/login", json={"nickname": "str", "password": "str"})
+        other_access_token = response.json()["access_token"]
+        response = await ac.post("/api/v1/logout", headers={"Authorization": refresh_token})
+        assert response.status_code == status.HTTP_200_OK
+        response = await ac.get("/api/v1/tickets", headers={"Authorization": access_token})
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        response = await ac.get("/api/v1/tickets", headers={"Authorization": other_access_token})
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_revoked_tokens_sync(config: Config, fake_db_session: AsyncSession):
+    revoked_tokens_repo = RevokedTokensRepository(config, create_repository(RevokedToken, fake_db_session))
+
+    @asynccontextmanager
+    async def revoked_tokens_repo_factory():
+        yield revoked_tokens_repo
+
+    revoked_tokens_registry = RevokedTokensRegistry()
+    revoked_tokens_sync_service = RevokedTokensSyncService(config, revoked_tokens_registry, revoked_tokens_repo_factory)
+    await revoked_tokens_repo.revoke_token("first", datetime.now() + timedelta(minutes=1))
+    await revoked_tokens_sync_service.sync()
+    await revoked_tokens_repo.revoke_token("second", datetime.now() + timedelta(minutes=1))
+    await revoked_tokens_repo.revoke_token("expired", datetime.now() - timedelta(minutes=1))
+    await revoked_tokens_sync_service.sync()
+    assert revoked_tokens_registry.is_revoked("first")
+    assert revoked_tokens_registry.is_revoked("second")
+    assert not revoked_tokens_registry.is_revoked("expired")
+
+
+@pytest.mark.asyncio
+async def test_revoked_tokens_sync_is_incremental_without_tokens(config: Config):
+    revoked_since_values = []
+
+    class EmptyRevokedTokensRepository:
+        async def get_revoked_tokens(self, revoked_since: Optional[datetime] = None) -> list:
+            revoked_since_values.append(revoked_since)
+            return []
+
+    @asynccontextmanager
+    async def revoked_tokens_repo_factory():
+        yield EmptyRevokedTokensRepository()
+
+    revoked_tokens_sync_service = RevokedTokensSyncService(
+        config,
+        RevokedTokensRegistry(),
+        revoked_tokens_repo_factory,
+    )
+    await revoked_tokens_sync_service.sync()
+    await revoked_tokens_sync_service.sync()
+    assert revoked_since_values[0] is None
+    assert revoked_since_values[1] is not None
+
+
+@pytest.mark.asyncio
+async def test_metrics(app: FastAPI, config: Config, create_user: Callable):
+    app.dependency_overrides[Config] = lambda: config.model_copy(update={"METRICS_TOKEN": "metrics"})
+    await create_user(name="str", nickname="str", password="str")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        await ac.post("/api/v1/login", json={"nickname": "str", "password": "str"})
+        response = await ac.get("/api/v1/metrics", headers={"X-Metrics-Token": "metrics"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["password_hasher"]["completed"] == 1
+    assert response.json()["database_pool"]["checkouts"] >= 1
+    assert response.json()["database_pool"]["waiting"] == 0
+    assert response.json()["database_replica_pool"] is None
+
+
+@pytest.mark.asyncio
+async def test_metrics_anonymous_access_is_refused(app: FastAPI, config: Config):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        disabled_response = await ac.get("/api/v1/metrics")
+        app.dependency_overrides[Config] = lambda: config.model_copy(update={"METRICS_TOKEN": "metrics"})
+        anonymous_response = await ac.get("/api/v1/metrics")
+        invalid_token_response = await ac.get("/api/v1/metrics", headers={"X-Metrics-Token": "invalid"})
+    assert disabled_response.status_code == status.HTTP_404_NOT_FOUND
+    assert anonymous_response.status_code == status.HTTP_403_FORBIDDEN
+    assert invalid_token_response.status_code == status.HTTP_403_FORBIDDEN
@@ -0,0 +1,152 @@
+import asyncio
+import io
+from collections import Counter
+
+import pytest
+from fastapi import FastAPI
+from miniopy_async.error import S3Error
+
+from adapters.files_storage import FilesStorage
+from config import Config
+
+
+def _get_s3_error(code: str) -> S3Error:
+    return S3Error(code, code, "resource", "request_id", "host_id", None)
+
+
+class FakeMinioClient:
+    """Counts the calls, raises the given errors from "put_object" and "make_bucket" one by one"""
+
+    def __init__(
+            self,
+            put_object_errors: tuple[S3Error, ...] = (),
+            make_bucket_errors: tuple[S3Error, ...] = (),
+            existing_buckets: tuple[str, ...] = (),
+    ):
+        self.calls = Counter()
+        self.buckets = set(existing_buckets)
+        self.objects = set()
+        self._put_object_errors = list(put_object_errors)
+        self._make_bucket_errors = list(make_bucket_errors)
+
+    async def put_object(self, bucket_name: str, object_name: str, data: io.BytesIO, length: int, content_type: str):
+        self.calls["put_object"] += 1
+        assert data.read() and data.tell() == length
+        if self._put_object_errors:
+            raise self._put_object_errors.pop(0)
+        self.objects.add((bucket_name, object_name))
+
+    async def bucket_exists(self, bucket_name: str) -> bool:
+        self.calls["bucket_exists"] += 1
+        return bucket_name in self.buckets
+
+    async def make_bucket(self, bucket_name: str):
+        self.calls["make_bucket"] += 1
+        if self._make_bucket_errors:
+            raise self._make_bucket_errors.pop(0)
+        self.buckets.add(bucket_name)
+
+    async def stat_object(self, bucket_name: str, object_name: str):
+        self.calls["stat_object"] += 1
+        if (bucket_name, object_name) not in self.objects:
+            raise _get_s3_error("NoSuchKey")
+
+    async def presigned_get_object(self, bucket_name: str, object_name: str, **kwargs) -> str:
+        self.calls["presigned_get_object"] += 1
+        return f"http://minio/{bucket_name}/{object_name}?signature={self.calls['presigned_get_object']}"
+
+
+async def _put_object(files_storage: FilesStorage, data: bytes = b"data") -> str:
+    return await files_storage.put_object("bucket", "object.txt", io.BytesIO(data), len(data), "text/plain")
+
+
+@pytest.mark.asyncio
+async def test_put_object_recreates_missing_bucket(config: Config):
+    minio_client = FakeMinioClient(put_object_errors=(_get_s3_error("NoSuchBucket"),))
+    link = await _put_object(FilesStorage(config, minio_client))
+    assert link
+    assert minio_client.calls["put_object"] == 2
+    assert minio_client.calls["make_bucket"] == 1
+    assert ("bucket", "object.txt") in minio_client.objects
+
+
+@pytest.mark.asyncio
+async def test_put_object_retries_missing_bucket_once(config: Config):
+    minio_client = FakeMinioClient(put_object_errors=(_get_s3_error("NoSuchBucket"), _get_s3_error("NoSuchBucket")))
+    with pytest.raises(S3Error) as exc_info:
+        await _put_object(FilesStorage(config, minio_client))
+    assert exc_info.value.code == "NoSuchBucket"
+    assert minio_client.calls["put_object"] == 2
+
+
+@pytest.mark.asyncio
+async def test_put_object_passes_other_errors_through(config: Config):
+    minio_client = FakeMinioClient(put_object_errors=(_get_s3_error("AccessDenied"),))
+    with pytest.raises(S3Error) as exc_info:
+        await _put_object(FilesStorage(config, minio_client))
+    assert exc_info.value.code == "AccessDenied"
+    assert minio_client.calls["put_object"] == 1
+    assert minio_client.calls["make_bucket"] == 0
+
+
+@pytest.mark.asyncio
+async def test_create_bucket(config: Config):
+    minio_client = FakeMinioClient(existing_buckets=("existing",))
+    files_storage = FilesStorage(config, minio_client)
+    await files_storage.create_bucket("existing")
+    await files_storage.create_bucket("new")
+    assert minio_client.calls["make_bucket"] == 1
+    assert minio_client.buckets == {"existing", "new"}
+
+
+@pytest.mark.asyncio
+async def test_create_bucket_created_concurrently(config: Config):
+    minio_client = FakeMinioClient(make_bucket_errors=(_get_s3_error("BucketAlreadyOwnedByYou"),))
+    await FilesStorage(config, minio_client).create_bucket("bucket")
+    minio_client = FakeMinioClient(make_bucket_errors=(_get_s3_error("AccessDenied"),))
+    with pytest.raises(S3Error) as exc_info:
+        await FilesStorage(config, minio_client).create_bucket("bucket")
+    assert exc_info.value.code == "AccessDenied"
+
+
+@pytest.mark.asyncio
+async def test_existing_object_link_is_cached(config: Config):
+    minio_client = FakeMinioClient()
+    files_storage = FilesStorage(config, minio_client)
+    await _put_object(files_storage)
+    assert await files_storage.get_existing_object_link("bucket", "missing.txt") is None
+    first_link = await files_storage.get_existing_object_link("bucket", "object.txt")
+    calls = minio_client.calls.copy()
+    second_link = await files_storage.get_existing_object_link("bucket", "object.txt")
+    assert second_link == first_link
+    assert minio_client.calls == calls
+
+
+@pytest.mark.asyncio
+async def test_existing_object_link_is_resigned_past_margin(config: Config):
+    # the links expire in a minute and are cached until a second after they're signed
+    config = config.model_copy(update={"FILES_LINKS_EXPIRATION_MINUTES": 1, "FILES_LINKS_CACHE_MARGIN_SECONDS": 59})
+    minio_client = FakeMinioClient()
+    files_storage = FilesStorage(config, minio_client)
+    await _put_object(files_storage)
+    first_link = await files_storage.get_existing_object_link("bucket", "object.txt")
+    assert await files_storage.get_existing_object_link("bucket", "object.txt") == first_link
+    presigns_count = minio_client.calls["presigned_get_object"]
+    await asyncio.sleep(1.1)
+    resigned_link = await files_storage.get_existing_object_link("bucket", "object.txt")
+    assert resigned_link != first_link
+    assert minio_client.calls["presigned_get_object"] == presigns_count + 1
+    assert minio_client.calls["stat_object"] == 2
+
+
+@pytest.mark.asyncio
+async def test_bucket_is_created_at_startup(app: FastAPI, config: Config):
+    minio_client = FakeMinioClient()
+    files_storage = FilesStorage(config, minio_client)
+
+    async def get_files_storage() -> FilesStorage:
+        return files_storage
+
+    app.dependency_overrides[FilesStorage] = get_files_storage
+    async with app.router.lifespan_context(app):
+        assert minio_client.buckets == {config.TICKET_FILES_BUCKET_NAME}
@@ -0,0 +1,82 @@
+from datetime import datetime
+from decimal import Decimal
+
+from constants import PaymentTypeEnum
+from models import Ticket, TicketProduct, User
+from services.receipts import get_display_width, get_receipt_renderer
+
+
+def _get_ticket(*products: TicketProduct) -> Ticket:
+    total = sum((product.price * product.quantity for product in products), Decimal(0))
+    return Ticket(
+        user=User(name="Іван"),
+        ticket_products=list(products),
+        payment_type=PaymentTypeEnum.cash,
+        total=total,
+        payment_amount=Decimal("100.00"),
+        created_at=datetime(2025, 1, 9, 15, 29),
+    )
+
+
+def test_render_receipt():
+    ticket = _get_ticket(
+        TicketProduct(name="Хліб", price=Decimal("25.50"), quantity=Decimal("2.00")),
+        TicketProduct(name="Молоко", price=Decimal("40.00"), quantity=Decimal("1.00")),
+    )
+    expected_receipt = (
+        "            ФОП Іван            \n"
+        "================================\n"
+        "2.00 x 25.50                    \n"
+        "Хліб                       51.00\n"
+        "--------------------------------\n"
+        "1.00 x 40.00                    \n"
+        "Молоко                     40.00\n"
+        "================================\n"
+        "СУМА:                      91.00\n"
+        "Готівка:                  100.00\n"
+        "Решта:                      9.00\n"
+        "================================\n"
+        "        09.01.2025 15:29        \n"
+        "      Дякуємо за покупку!       \n"
+    )
+    assert get_receipt_renderer(32).render(ticket) == expected_receipt.encode("utf-8")
+
+
+def test_render_receipt_long_product_name():
+    ticket = _get_ticket(
+        TicketProduct(
+            name="Дуже довга назва товару що не влазить у рядок взагалі ніяк і ще трохи",
+            price=Decimal("1.00"),
+            quantity=Decimal("1.00"),
+        ),
+    )
+    rows = get_receipt_renderer(20).render(ticket).decode("utf-8").splitlines()
+    assert rows[2:7] == [
+        "1.00 x 1.00         ",
+        "Дуже довга назва    ",
+        "товару що не влазить",
+        "у рядок взагалі нія…",
+        "                1.00",
+    ]
+    assert all(get_display_width(row) == 20 for row in rows)
+
+
+def test_display_width():
+    assert get_display_width("Ґанок") == 5
+    assert get_display_width("\u0438\u0306") == 1
+    assert get_display_width("中文") == 4
+
+
+def test_receipt_min_size():
+    tickets = [
+        _get_ticket(),
+        _get_ticket(TicketProduct(name="Хліб", price=Decimal("25.50"), quantity=Decimal("2.00"))),
+        _get_ticket(
+            TicketProduct(name="Хліб", price=Decimal("25.50"), quantity=Decimal("2.00")),
+            TicketProduct(name="Молоко дуже довге і ще довше", price=Decimal("40.00"), quantity=Decimal("1.00")),
+        ),
+    ]
+    for ticket in tickets:
+        for max_symbols in (20, 32, 48):
+            renderer = get_receipt_renderer(max_symbols)
+            assert renderer.get_min_size(ticket) <= len(renderer.render(ticket))
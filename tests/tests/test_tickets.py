@@ -1,14 +1,26 @@
+import csv
+import io
+import json
+import zipfile
 from decimal import Decimal
 from typing import Callable, Optional
 
 import pytest
 from fastapi import FastAPI
 from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from adapters.auth import JWTAuthenticator
+from adapters.background import BackgroundJobsQueue
+from adapters.cache import TicketsCountCache
+from adapters.database import create_db_engine
+from adapters.files_storage import FilesStorage
+from config import Config
+from dependencies import Stub
 from dto import TicketCreationData
 from models import User, Ticket
+from services.receipts import RECEIPT_LAYOUT_VERSION
 
 
 @pytest.mark.asyncio
@@ -73,6 +85,75 @@ async def test_create_ticket_incorrect_amount(app: FastAPI, jwt_authenticator: J
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
 
+@pytest.mark.asyncio
+async def test_create_ticket_prerenders_files(
+        app: FastAPI,
+        config: Config,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable,
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    access_token = jwt_authenticator.create_access_token(user.id)
+    background_jobs_queue = await app.dependency_overrides[BackgroundJobsQueue]()
+    background_jobs_queue.start()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/v1/create_ticket",
+            json={
+                "products": [{"name": "test1", "price": 50.00, "quantity": 3.00}],
+                "payment": {"type": "cash", "amount": 200.00},
+            },
+            headers={"Authorization": access_token},
+        )
+    await background_jobs_queue.join()
+    await background_jobs_queue.stop()
+    assert background_jobs_queue.get_stats()["failed_jobs"] == 0
+    files_storage = await app.dependency_overrides[FilesStorage]()
+    ticket_id = response.json()["id"]
+    for max_symbols in config.ticket_files_prerender_widths:
+        filename = f"{ticket_id}_{max_symbols}.txt"
+        assert await files_storage.check_object_exists(config.TICKET_FILES_BUCKET_NAME, filename)
+
+
+@pytest.mark.asyncio
+async def test_create_tickets(app: FastAPI, jwt_authenticator: JWTAuthenticator, create_user: Callable):
+    user = await create_user(name="str", nickname="str", password="str")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post(
+            "/api/v1/create_tickets",
+            json=[
+                {
+                    "products": [{"name": "test1", "price": 50.00, "quantity": 3.00}],
+                    "payment": {"type": "cash", "amount": 200.00},
+                },
+                {
+                    "products": [{"name": "test2", "price": 50.00, "quantity": 3.00}],
+                    "payment": {"type": "card", "amount": 100.00},
+                },
+                {
+                    "products": [
+                        {"name": "test3", "price": 10.00, "quantity": 1.00},
+                        {"name": "test4", "price": 20.00, "quantity": 2.00},
+                    ],
+                    "payment": {"type": "card", "amount": 50.00},
+                },
+            ],
+            headers={"Authorization": jwt_authenticator.create_access_token(user.id)},
+        )
+    assert response.status_code == status.HTTP_200_OK
+    first_result, second_result, third_result = response.json()
+    assert first_result["error"] is None
+    assert first_result["ticket"]["total"] == "150.00"
+    assert first_result["ticket"]["rest"] == "50.00"
+    assert [product["name"] for product in first_result["ticket"]["products"]] == ["test1"]
+    assert second_result["ticket"] is None
+    assert second_result["error"]
+    assert third_result["error"] is None
+    assert third_result["ticket"]["total"] == "50.00"
+    assert [product["name"] for product in third_result["ticket"]["products"]] == ["test3", "test4"]
+    assert first_result["ticket"]["id"] != third_result["ticket"]["id"]
+
+
 @pytest.mark.asyncio
 async def test_get_many_tickets_pagination(
         app: FastAPI,
@@ -120,6 +201,190 @@ async def test_get_many_tickets_pagination(
     assert response.json() == expected_response
 
 
+@pytest.mark.asyncio
+async def test_get_many_tickets_cursor_pagination(
+        app: FastAPI,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    ticket1 = await create_ticket(user.id, None)
+    ticket2 = await create_ticket(user.id, None)
+    ticket3 = await create_ticket(user.id, None)
+    headers = {"Authorization": jwt_authenticator.create_access_token(user.id)}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        first_page_response = await ac.get(
+            "/api/v1/tickets",
+            headers=headers,
+            params={"page_size": 2, "pagination": "cursor"},
+        )
+        first_page = first_page_response.json()
+        second_page_response = await ac.get(
+            "/api/v1/tickets",
+            headers=headers,
+            params={"page_size": 2, "cursor": first_page["next_cursor"]},
+        )
+        second_page = second_page_response.json()
+    assert first_page_response.status_code == status.HTTP_200_OK
+    assert [item["id"] for item in first_page["items"]] == [ticket3.id, ticket2.id]
+    assert first_page["next_cursor"]
+    assert second_page_response.status_code == status.HTTP_200_OK
+    assert [item["id"] for item in second_page["items"]] == [ticket1.id]
+    assert second_page["next_cursor"] is None
+
+
+@pytest.mark.asyncio
+async def test_get_many_tickets_page_size_only(
+        app: FastAPI,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    await create_ticket(user.id, None)
+    await create_ticket(user.id, None)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get(
+            "/api/v1/tickets",
+            headers={"Authorization": jwt_authenticator.create_access_token(user.id)},
+            params={"page_size": 1},
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert list(response.json()) == ["page_size", "page", "items"]
+    assert len(response.json()["items"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_many_tickets_include_total(
+        app: FastAPI,
+        config: Config,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    await create_ticket(user.id, None)
+    await create_ticket(user.id, None)
+    access_token = jwt_authenticator.create_access_token(user.id)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get(
+            "/api/v1/tickets",
+            headers={"Authorization": access_token},
+            params={"page_size": 1, "include_total": True},
+        )
+        assert response.json()["total_count"] == 2
+        assert response.json()["is_total_count_approximate"] is False
+        app.dependency_overrides[Config] = lambda: config.model_copy(update={"TICKETS_EXACT_COUNT_THRESHOLD": 1})
+        response = await ac.get(
+            "/api/v1/tickets",
+            headers={"Authorization": access_token},
+            params={"page_size": 1, "include_total": True},
+        )
+    assert response.json()["total_count"] >= 2
+    assert response.json()["is_total_count_approximate"] is True
+
+
+@pytest.mark.asyncio
+async def test_get_many_tickets_include_total_is_exact_with_stale_cache(
+        app: FastAPI,
+        config: Config,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    await create_ticket(user.id, None)
+    # left by another worker, which hasn't seen the tickets of the user change
+    tickets_count_cache = await app.dependency_overrides[TicketsCountCache]()
+    tickets_count_cache.set(user.id, None, 5000)
+    access_token = jwt_authenticator.create_access_token(user.id)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get(
+            "/api/v1/tickets",
+            headers={"Authorization": access_token},
+            params={"page_size": 1, "include_total": True},
+        )
+    assert response.json()["total_count"] == 1
+    assert response.json()["is_total_count_approximate"] is False
+
+
+@pytest.mark.asyncio
+async def test_get_many_tickets_invalid_cursor(
+        app: FastAPI,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable[..., User],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get(
+            "/api/v1/tickets",
+            headers={"Authorization": jwt_authenticator.create_access_token(user.id)},
+            params={"page_size": 2, "cursor": "invalid"},
+        )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_get_tickets_database_json(
+        app: FastAPI,
+        config: Config,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    ticket = await create_ticket(user.id, None)
+    await create_ticket(user.id, None)
+    headers = {"Authorization": jwt_authenticator.create_access_token(user.id)}
+    requests = [
+        ("/api/v1/tickets", {"page_size": 2}),
+        ("/api/v1/tickets", {"page_size": 1, "include_total": True}),
+        (f"/api/v1/tickets/{ticket.id}", {}),
+    ]
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        python_responses = [await ac.get(url, headers=headers, params=params) for url, params in requests]
+        app.dependency_overrides[Config] = lambda: config.model_copy(update={"TICKETS_DATABASE_JSON_ENABLED": True})
+        database_responses = [await ac.get(url, headers=headers, params=params) for url, params in requests]
+    for python_response, database_response in zip(python_responses, database_responses):
+        assert database_response.status_code == status.HTTP_200_OK
+        assert database_response.headers["content-type"] == python_response.headers["content-type"]
+        assert database_response.content == python_response.content
+
+
+@pytest.mark.asyncio
+async def test_get_tickets_replica_routing(
+        app: FastAPI,
+        config: Config,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    ticket = await create_ticket(user.id, None)
+    headers = {"Authorization": jwt_authenticator.create_access_token(user.id)}
+    app.dependency_overrides[Config] = lambda: config.model_copy(update={"DATABASE_REPLICA_URL": config.DATABASE_URL})
+    # a session outside of the test transaction doesn't see its data, as a replica lagging behind
+    async with AsyncSession(create_db_engine(config)) as replica_session:
+        app.dependency_overrides[Stub(AsyncSession, replica=True)] = lambda: replica_session
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            replica_response = await ac.get("/api/v1/tickets", headers=headers)
+            fallback_response = await ac.get(f"/api/v1/tickets/{ticket.id}", headers=headers)
+            await ac.post(
+                "/api/v1/create_ticket",
+                json={
+                    "products": [{"name": "test", "price": 1.00, "quantity": 1.00}],
+                    "payment": {"type": "cash", "amount": 1.00},
+                },
+                headers=headers,
+            )
+            primary_response = await ac.get("/api/v1/tickets", headers=headers)
+    assert replica_response.json()["items"] == []
+    assert fallback_response.status_code == status.HTTP_200_OK
+    assert fallback_response.json()["id"] == ticket.id
+    assert len(primary_response.json()["items"]) == 2
+
+
 @pytest.mark.asyncio
 async def test_get_many_tickets_filtering(
         app: FastAPI,
@@ -145,6 +410,116 @@ async def test_get_many_tickets_filtering(
     assert response.json() == expected_response
 
 
+@pytest.mark.asyncio
+async def test_get_tickets_stats(app: FastAPI, jwt_authenticator: JWTAuthenticator, create_user: Callable):
+    user = await create_user(name="str", nickname="str", password="str")
+    access_token = jwt_authenticator.create_access_token(user.id)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        await ac.post(
+            "/api/v1/create_ticket",
+            json={
+                "products": [{"name": "test1", "price": 50.00, "quantity": 3.00}],
+                "payment": {"type": "cash", "amount": 200.00},
+            },
+            headers={"Authorization": access_token},
+        )
+        await ac.post(
+            "/api/v1/create_tickets",
+            json=[
+                {
+                    "products": [{"name": "test2", "price": 10.00, "quantity": 1.00}],
+                    "payment": {"type": "cash", "amount": 10.00},
+                },
+                {
+                    "products": [{"name": "test3", "price": 20.00, "quantity": 1.00}],
+                    "payment": {"type": "card", "amount": 20.00},
+                },
+            ],
+            headers={"Authorization": access_token},
+        )
+        response = await ac.get("/api/v1/tickets/stats", headers={"Authorization": access_token})
+    assert response.status_code == status.HTTP_200_OK
+    stats = response.json()
+    assert stats["tickets_count"] == 3
+    assert Decimal(stats["total"]) == Decimal("180.00")
+    assert Decimal(stats["payment_amount"]) == Decimal("230.00")
+    assert {day_stats["payment_type"]: day_stats["tickets_count"] for day_stats in stats["days"]} == {
+        "cash": 2,
+        "card": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_export_tickets(
+        app: FastAPI,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    first_ticket = await create_ticket(user.id, None)
+    second_ticket = await create_ticket(user.id, None)
+    access_token = jwt_authenticator.create_access_token(user.id)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get(
+            "/api/v1/tickets/export",
+            params={"max_symbols": 40},
+            headers={"Authorization": access_token},
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.testzip() is None
+        filenames = archive.namelist()
+        assert len(filenames) == 2
+        assert filenames[0].endswith(f"_{second_ticket.id}.txt")
+        assert filenames[1].endswith(f"_{first_ticket.id}.txt")
+        assert all(len(row) == 40 for row in archive.read(filenames[0]).decode("utf-8").splitlines())
+
+
+@pytest.mark.asyncio
+async def test_export_tickets_rows(
+        app: FastAPI,
+        jwt_authenticator: JWTAuthenticator,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    first_ticket = await create_ticket(user.id, None)
+    second_ticket = await create_ticket(user.id, None)
+    access_token = jwt_authenticator.create_access_token(user.id)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        ndjson_response = await ac.get(
+            "/api/v1/tickets/export/rows",
+            params={"format": "ndjson"},
+            headers={"Authorization": access_token},
+        )
+        csv_response = await ac.get(
+            "/api/v1/tickets/export/rows",
+            params={"format": "csv"},
+            headers={"Authorization": access_token},
+        )
+    assert ndjson_response.status_code == status.HTTP_200_OK
+    assert ndjson_response.headers["content-type"] == "application/x-ndjson"
+    ndjson_rows = [json.loads(line) for line in ndjson_response.text.splitlines()]
+    assert [row["ticket_id"] for row in ndjson_rows] == [second_ticket.id, first_ticket.id]
+    assert ndjson_rows[0] == {
+        "ticket_id": second_ticket.id,
+        "created_at": second_ticket.created_at.isoformat(),
+        "payment_type": "card",
+        "payment_amount": "100.00",
+        "total": "100.00",
+        "product_id": second_ticket.ticket_products[0].id,
+        "product_name": "test",
+        "product_price": "50.00",
+        "product_quantity": "2.00",
+    }
+    assert csv_response.status_code == status.HTTP_200_OK
+    assert csv_response.headers["content-type"] == "text/csv; charset=utf-8"
+    csv_rows = list(csv.DictReader(io.StringIO(csv_response.text)))
+    assert csv_rows == [{key: str(value) for key, value in row.items()} for row in ndjson_rows]
+
+
 @pytest.mark.asyncio
 async def test_download_ticket(
         app: FastAPI,
@@ -162,6 +537,97 @@ async def test_download_ticket(
     assert response.headers["content-type"] == "text/plain; charset=utf-8"
 
 
+@pytest.mark.asyncio
+async def test_download_ticket_link_is_reused(
+        app: FastAPI,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    ticket = await create_ticket(user.id, None)
+    files_storage = await app.dependency_overrides[FilesStorage]()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        first_response = await ac.get(f"/api/v1/download_ticket/{ticket.id}", params={"max_symbols": 40})
+        hits = files_storage.get_links_cache_stats()["hits"]
+        second_response = await ac.get(f"/api/v1/download_ticket/{ticket.id}", params={"max_symbols": 40})
+        assert files_storage.get_links_cache_stats()["hits"] == hits + 1
+        other_width_response = await ac.get(f"/api/v1/download_ticket/{ticket.id}", params={"max_symbols": 41})
+    assert first_response.headers["location"] == second_response.headers["location"]
+    assert first_response.headers["location"] != other_width_response.headers["location"]
+
+
+@pytest.mark.asyncio
+async def test_download_ticket_streaming(
+        app: FastAPI,
+        config: Config,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    streaming_config = config.model_copy(update={"TICKET_FILES_STREAMING_ENABLED": True})
+    app.dependency_overrides[Config] = lambda: streaming_config
+    user = await create_user(name="str", nickname="str", password="str")
+    ticket = await create_ticket(user.id, None)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get(f"/api/v1/download_ticket/{ticket.id}", params={"max_symbols": 40})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "text/plain; charset=utf-8"
+        assert response.headers["content-length"] == str(len(response.content))
+        assert "immutable" in response.headers["cache-control"]
+        etag = response.headers["etag"]
+        response = await ac.get(
+            f"/api/v1/download_ticket/{ticket.id}",
+            params={"max_symbols": 40},
+            headers={"If-None-Match": etag},
+        )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.asyncio
+async def test_download_ticket_if_none_match(
+        app: FastAPI,
+        config: Config,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    user = await create_user(name="str", nickname="str", password="str")
+    ticket = await create_ticket(user.id, None)
+    etag = f'"{ticket.id}-40-{RECEIPT_LAYOUT_VERSION}"'
+    missing_ticket_etag = f'"{ticket.id + 1}-40-{RECEIPT_LAYOUT_VERSION}"'
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        redirect_response = await ac.get(
+            f"/api/v1/download_ticket/{ticket.id}",
+            params={"max_symbols": 40},
+            headers={"If-None-Match": etag},
+        )
+        app.dependency_overrides[Config] = lambda: config.model_copy(update={"TICKET_FILES_STREAMING_ENABLED": True})
+        missing_ticket_response = await ac.get(
+            f"/api/v1/download_ticket/{ticket.id + 1}",
+            params={"max_symbols": 40},
+            headers={"If-None-Match": missing_ticket_etag},
+        )
+    assert redirect_response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+    assert missing_ticket_response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_download_ticket_streaming_above_max_size(
+        app: FastAPI,
+        config: Config,
+        create_user: Callable[..., User],
+        create_ticket: Callable[[int, Optional[TicketCreationData]], Ticket],
+):
+    streaming_config = config.model_copy(
+        update={"TICKET_FILES_STREAMING_ENABLED": True, "TICKET_FILES_STREAMING_MAX_SIZE": 1},
+    )
+    app.dependency_overrides[Config] = lambda: streaming_config
+    user = await create_user(name="str", nickname="str", password="str")
+    ticket = await create_ticket(user.id, None)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get(f"/api/v1/download_ticket/{ticket.id}", params={"max_symbols": 40})
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+
 @pytest.mark.asyncio
 async def test_download_ticket_invalid_id(
         app: FastAPI,